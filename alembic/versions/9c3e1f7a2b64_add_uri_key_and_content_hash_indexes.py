@@ -0,0 +1,83 @@
+"""add_uri_key_and_content_hash_indexes
+
+Revision ID: 9c3e1f7a2b64
+Revises: 707543f03b6d
+Create Date: 2026-10-17 08:12:40.512371
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+import sqlalchemy as sa
+from yarl import URL
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9c3e1f7a2b64"
+down_revision: str | None = "707543f03b6d"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+DOCUMENT_TABLES = (
+    "book",
+    "document_position_info",
+    "recent_document",
+    "pinned_document",
+)
+
+
+# The scheme of document uris when this revision was written
+BOOKWORM_URI_SCHEME = "bkw"
+
+
+def _get_uri_key(uri_string):
+    """
+    The uri without its openner args, as `DocumentUri.to_key_string` derived it when
+    this revision was written. Inlined, so that later changes to the application do
+    not change what this migration writes.
+    """
+    uri = URL(uri_string)
+    if uri.scheme != BOOKWORM_URI_SCHEME:
+        raise ValueError(f"Invalid uri string {uri_string}")
+    return str(
+        URL.build(
+            scheme=BOOKWORM_URI_SCHEME,
+            authority=uri.authority,
+            path=f"/{uri.path.strip('/')}",
+        )
+    )
+
+
+def _get_uri_key_or_none(uri_string):
+    # The key of a malformed uri is left unset, rather than failing the whole upgrade
+    try:
+        return _get_uri_key(uri_string)
+    except Exception:
+        return None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    for table_name in DOCUMENT_TABLES:
+        op.add_column(table_name, sa.Column("uri_key", sa.String(1024), nullable=True))
+        table = sa.table(
+            table_name, sa.column("id", sa.Integer), sa.column("uri_key", sa.String)
+        )
+        rows = conn.execute(sa.text(f"SELECT id, uri FROM {table_name}")).fetchall()
+        if rows:
+            conn.execute(
+                table.update()
+                .where(table.c.id == sa.bindparam("row_id"))
+                .values(uri_key=sa.bindparam("key")),
+                [{"row_id": row_id, "key": _get_uri_key_or_none(uri)} for (row_id, uri) in rows],
+            )
+        op.create_index(f"ix_{table_name}_uri_key", table_name, ["uri_key"])
+        op.create_index(f"ix_{table_name}_content_hash", table_name, ["content_hash"])
+
+
+def downgrade() -> None:
+    for table_name in DOCUMENT_TABLES:
+        op.drop_index(f"ix_{table_name}_content_hash", table_name=table_name)
+        op.drop_index(f"ix_{table_name}_uri_key", table_name=table_name)
+        op.drop_column(table_name, "uri_key")
@@ -0,0 +1,192 @@
+# coding: utf-8
+
+"""
+Compares the previous bookshelf full-text index, which read its content from a
+view joining the page and document tables, with the current external content
+index over the page table, in build time, query latency, and index size.
+
+Usage:
+    python benchmarks/bench_bookshelf_fts.py --pages 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from bookworm.bookshelf.local_bookshelf import models
+from bookworm.document.uri import DocumentUri
+
+PAGES_PER_DOCUMENT = 250
+WORDS_PER_PAGE = 250
+VOCABULARY_SIZE = 50_000
+INSERT_CHUNK_SIZE = 500
+
+LEGACY_SCHEMA = """
+CREATE TABLE document (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL);
+CREATE TABLE page (
+    id INTEGER PRIMARY KEY,
+    number INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    document_id INTEGER NOT NULL REFERENCES document (id) ON DELETE CASCADE
+);
+CREATE INDEX page_document_id ON page (document_id);
+CREATE VIEW vw_document_page AS
+    SELECT page.id AS page_id, page.number AS page_number, document.id AS document_id,
+    document.title AS document_title, page.content AS content
+    FROM page JOIN document ON page.document_id = document.id;
+CREATE VIRTUAL TABLE document_fts_index USING fts5 (
+    page_number UNINDEXED, document_id UNINDEXED, document_title, content,
+    tokenize='porter unicode61', content=vw_document_page, content_rowid=page_id
+);
+"""
+LEGACY_REBUILD = (
+    "INSERT INTO document_fts_index "
+    "(rowid, page_number, document_id, document_title, content) "
+    "SELECT page_id, page_number, document_id, document_title, content FROM vw_document_page"
+)
+LEGACY_QUERY = (
+    "SELECT rowid, page_number, document_id, document_title, "
+    "snippet(document_fts_index, 3, '', '', '', ?) "
+    "FROM document_fts_index WHERE content MATCH ? ORDER BY bm25(document_fts_index)"
+)
+
+
+def make_vocabulary(size):
+    rng = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choices(letters, k=rng.randint(3, 10))) for _i in range(size)]
+
+
+def generate_documents(num_pages, vocabulary):
+    """Yield `(title, page_texts)` with a zipfian distribution of words."""
+    rng = random.Random(1)
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    for doc_index, start in enumerate(range(0, num_pages, PAGES_PER_DOCUMENT)):
+        count = min(PAGES_PER_DOCUMENT, num_pages - start)
+        title = f"Document {doc_index} {' '.join(rng.choices(vocabulary, k=3))}"
+        yield title, [
+            " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=WORDS_PER_PAGE))
+            for _n in range(count)
+        ]
+
+
+def build_legacy(path, num_pages, vocabulary):
+    con = sqlite3.connect(path)
+    con.executescript(LEGACY_SCHEMA)
+    with con:
+        for title, page_texts in generate_documents(num_pages, vocabulary):
+            doc_id = con.execute("INSERT INTO document (title) VALUES (?)", (title,)).lastrowid
+            con.executemany(
+                "INSERT INTO page (number, content, document_id) VALUES (?, ?, ?)",
+                ((n, text, doc_id) for n, text in enumerate(page_texts)),
+            )
+        con.execute(LEGACY_REBUILD)
+        con.execute("INSERT INTO document_fts_index(document_fts_index) VALUES('optimize')")
+    return con
+
+
+def build_current(path, num_pages, vocabulary):
+    models.database.init(os.fspath(path))
+    models.BaseModel.create_all()
+    doc_format, _created = models.Format.get_or_create(name="plain_text")
+    fields = [models.Page.number, models.Page.content, models.Page.document]
+    with models.database.atomic():
+        for index, (title, page_texts) in enumerate(generate_documents(num_pages, vocabulary)):
+            doc_id = models.Document.insert(
+                uri=DocumentUri("plain_text", f"document{index}.txt", {}),
+                title=title,
+                format=doc_format,
+            ).execute()
+            rows = [(n, text, doc_id) for n, text in enumerate(page_texts)]
+            for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+                models.Page.insert_many(rows[start : start + INSERT_CHUNK_SIZE], fields).execute()
+    models.DocumentFTSIndex.optimize()
+
+
+def get_index_size(cursor, table_name):
+    """The approximate size in bytes of the data stored by the given full-text index."""
+    size = cursor.execute(f"SELECT SUM(LENGTH(block)) FROM {table_name}_data").fetchone()[0]
+    if (
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name = ?", (f"{table_name}_content",)
+        ).fetchone()[0]
+    ):
+        # An index which stores its own copy of the content
+        columns = cursor.execute(f"SELECT * FROM {table_name}_content LIMIT 1").description
+        size += cursor.execute(
+            "SELECT SUM({}) FROM {}_content".format(
+                " + ".join(f"IFNULL(LENGTH({col[0]}), 0)" for col in columns), table_name
+            )
+        ).fetchone()[0]
+    return size or 0
+
+
+def time_queries(run_query, terms):
+    latencies = []
+    for term in terms:
+        started = time.perf_counter()
+        run_query(term)
+        latencies.append(time.perf_counter() - started)
+    return statistics.median(latencies), max(latencies)
+
+
+def print_results(label, build_time, index_size, path, latencies):
+    median, worst = latencies
+    print(
+        f"{label}: built in {build_time:.1f}s, index {index_size / 2**20:.1f}MiB, "
+        f"file {path.stat().st_size / 2**20:.1f}MiB, "
+        f"query median {median * 1000:.2f}ms, max {worst * 1000:.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    vocabulary = make_vocabulary(VOCABULARY_SIZE)
+    rng = random.Random(2)
+    # Mix frequent and rare terms
+    terms = [rng.choice(vocabulary[: VOCABULARY_SIZE // 10]) for _i in range(args.queries // 2)]
+    terms += [rng.choice(vocabulary[VOCABULARY_SIZE // 10 :]) for _i in range(args.queries // 2)]
+    print(f"{args.pages} pages, {args.queries} queries")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        legacy_path = Path(temp_dir, "legacy.sqlite")
+        started = time.perf_counter()
+        con = build_legacy(legacy_path, args.pages, vocabulary)
+        build_time = time.perf_counter() - started
+        latencies = time_queries(
+            lambda term: con.execute(LEGACY_QUERY, (len(term) + 8, term)).fetchall(), terms
+        )
+        index_size = get_index_size(con, "document_fts_index")
+        print_results("view content index", build_time, index_size, legacy_path, latencies)
+        con.close()
+
+        current_path = Path(temp_dir, "current.sqlite")
+        started = time.perf_counter()
+        build_current(current_path, args.pages, vocabulary)
+        build_time = time.perf_counter() - started
+        cursor = models.database.connection().cursor()
+        latencies = time_queries(
+            lambda term: cursor.execute(
+                *models.DocumentFTSIndex.perform_search(term).sql()
+            ).fetchall(),
+            terms,
+        )
+        index_size = get_index_size(cursor, "document_fts_index") + get_index_size(
+            cursor, "document_title_fts_index"
+        )
+        print_results("external content index", build_time, index_size, current_path, latencies)
+        models.database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# coding: utf-8
+
+"""
+Measures the latency of saving reading positions and of querying annotations
+while several threads do both at once, as the reader, the annotation service,
+and the recents manager do. The default engine configuration, which uses the
+rollback journal, is compared with the tuned one set up by `init_database`,
+which uses the write-ahead log and a pool of read-only connections.
+
+Usage:
+    python benchmarks/bench_database_concurrency.py --writers 4 --readers 4 --duration 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import close_all_sessions, scoped_session, sessionmaker
+
+from bookworm.database import (
+    Base,
+    Book,
+    DocumentPositionInfo,
+    Note,
+    init_database,
+    read_session,
+)
+from bookworm.document.uri import DocumentUri
+
+NOTES_PER_PAGE = 20
+NUM_PAGES = 50
+
+
+def configure_default_engine(url):
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    Base.session = scoped_session(sessionmaker(engine, autocommit=False, autoflush=False))
+
+    def query(session_user):
+        try:
+            return session_user(Base.session())
+        finally:
+            Base.session.remove()
+
+    return engine, query
+
+
+def configure_tuned_engine(url):
+    engine = init_database(url=url)
+
+    def query(session_user):
+        with read_session() as session:
+            return session_user(session)
+
+    return engine, query
+
+
+def populate(num_writers):
+    session = Base.session()
+    book = Book(title="Book", uri=DocumentUri("txt", "/books/book.txt", {}))
+    session.add(book)
+    session.flush()
+    session.add_all(
+        Note(
+            title=f"Note {n}",
+            content="content " * 20,
+            page_number=n % NUM_PAGES,
+            position=n,
+            section_title="section",
+            section_identifier="section",
+            book_id=book.id,
+        )
+        for n in range(NUM_PAGES * NOTES_PER_PAGE)
+    )
+    session.add_all(
+        DocumentPositionInfo(title=f"Book {n}", uri=DocumentUri("txt", f"/books/{n}.txt", {}))
+        for n in range(num_writers)
+    )
+    book_id = book.id
+    session.commit()
+    Base.session.remove()
+    return book_id
+
+
+def save_positions(index, deadline, latencies, errors):
+    record = DocumentPositionInfo.query.filter_by(title=f"Book {index}").one()
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            record.save_position(random.randrange(NUM_PAGES), random.randrange(10_000))
+        except Exception:
+            Base.session.rollback()
+            errors.append("save_position")
+            continue
+        latencies.append(time.perf_counter() - started)
+    Base.session.remove()
+
+
+def query_annotations(query, book_id, deadline, latencies, errors):
+    def get_notes_for_page(session):
+        return (
+            session.query(Note)
+            .filter_by(book_id=book_id, page_number=random.randrange(NUM_PAGES))
+            .all()
+        )
+
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            query(get_notes_for_page)
+        except Exception:
+            errors.append("annotation query")
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+def format_latencies(latencies):
+    if not latencies:
+        return "no operations completed"
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95)]
+    return (
+        f"{len(latencies)} ops, median {statistics.median(latencies) * 1000:.2f}ms, "
+        f"p95 {p95 * 1000:.2f}ms, max {latencies[-1] * 1000:.2f}ms"
+    )
+
+
+def run(configure, args):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        url = f"sqlite:///{os.path.join(temp_dir, 'database.sqlite')}"
+        engine, query = configure(url)
+        try:
+            book_id = populate(args.writers)
+            deadline = time.monotonic() + args.duration
+            write_latencies, read_latencies, errors = [], [], []
+            threads = [
+                threading.Thread(
+                    target=save_positions, args=(n, deadline, write_latencies, errors)
+                )
+                for n in range(args.writers)
+            ]
+            threads += [
+                threading.Thread(
+                    target=query_annotations,
+                    args=(query, book_id, deadline, read_latencies, errors),
+                )
+                for _n in range(args.readers)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            close_all_sessions()
+            engine.dispose()
+    print(f"  save_position: {format_latencies(write_latencies)}")
+    print(f"  annotation queries: {format_latencies(read_latencies)}")
+    print(f"  errors: {len(errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+    for name, configure in (
+        ("Default engine", configure_default_engine),
+        ("Tuned engine", configure_tuned_engine),
+    ):
+        print(f"{name}:")
+        run(configure, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# coding: utf-8
+
+"""
+Measures how long `init_database` takes at startup on a database whose schema
+is already up to date, in a fresh process each time. The fast path, which skips
+Alembic when the stored revision is the bundled head, is compared with always
+running `alembic upgrade head`, as was done before.
+
+Usage:
+    python benchmarks/bench_database_startup.py --repeat 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+INIT_DATABASE = """
+import sys, time
+import bookworm.database
+if {force_migrations}:
+    bookworm.database.get_head_revision = lambda script_location: None
+started = time.perf_counter()
+bookworm.database.init_database(url={url!r})
+print(time.perf_counter() - started, "alembic" in sys.modules)
+"""
+
+
+def run_init_database(url, prelude, force_migrations):
+    code = INIT_DATABASE.format(url=url, force_migrations=force_migrations)
+    result = subprocess.run(
+        [sys.executable, "-c", f"{prelude}\n{code}"], capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to initialize the database:\n{result.stderr}")
+    elapsed, alembic_imported = result.stdout.split()[-2:]
+    return float(elapsed), alembic_imported == "True"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--prelude",
+        default="",
+        help="Code to run in each process before importing bookworm.database",
+    )
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        url = f"sqlite:///{os.path.join(temp_dir, 'database.sqlite')}"
+        # Creates the database, and brings it to the head revision
+        run_init_database(url, args.prelude, force_migrations=False)
+        for label, force_migrations in (
+            ("Always running the migrations", True),
+            ("Skipping Alembic when up to date", False),
+        ):
+            runs = [
+                run_init_database(url, args.prelude, force_migrations)
+                for _n in range(args.repeat)
+            ]
+            timings = [elapsed * 1000 for (elapsed, _alembic_imported) in runs]
+            print(f"{label}:")
+            print(
+                f"  init_database: median {statistics.median(timings):.1f}ms, "
+                f"min {min(timings):.1f}ms, max {max(timings):.1f}ms, "
+                f"alembic imported: {runs[0][1]}"
+            )
+
+
+if __name__ == "__main__":
+    main()
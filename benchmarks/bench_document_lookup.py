@@ -0,0 +1,113 @@
+# coding: utf-8
+
+"""
+Compares looking up recent documents by uri and by content hash by scanning
+every row, as the recents manager used to, with the indexed lookups on the
+`uri_key` and `content_hash` columns.
+
+Usage:
+    python benchmarks/bench_document_lookup.py --rows 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.orm import close_all_sessions
+
+from bookworm.database import RecentDocument, init_database
+from bookworm.document.uri import DocumentUri
+from bookworm.gui.book_viewer import recents_manager
+
+INSERT_CHUNK_SIZE = 5000
+
+
+def scan_by_uri(model, uri):
+    for doc in model.query:
+        if uri.is_equal_without_openner_args(doc.uri):
+            return doc
+
+
+def scan_by_content_hash(model, content_hash, uri):
+    return [
+        doc
+        for doc in model.query
+        if doc.content_hash == content_hash and doc.uri.format == uri.format
+    ]
+
+
+def populate(num_rows):
+    uris = [
+        DocumentUri(
+            format="epub", path=f"C:\\Books\\shelf{i % 97}\\book{i}.epub", openner_args={}
+        )
+        for i in range(num_rows)
+    ]
+    rows = [
+        dict(
+            title=f"Book {i}",
+            uri=uri,
+            uri_key=uri.to_key_string(),
+            content_hash=os.urandom(32).hex(),
+            last_opened_on=datetime.utcnow(),
+        )
+        for i, uri in enumerate(uris)
+    ]
+    session = RecentDocument.session()
+    for start in range(0, num_rows, INSERT_CHUNK_SIZE):
+        session.execute(insert(RecentDocument), rows[start : start + INSERT_CHUNK_SIZE])
+    session.commit()
+    return [(uri, row["content_hash"]) for uri, row in zip(uris, rows)]
+
+
+def time_lookups(lookup, documents):
+    timings = []
+    for uri, content_hash in documents:
+        started = time.perf_counter()
+        lookup(uri, content_hash)
+        timings.append(time.perf_counter() - started)
+        RecentDocument.session.expire_all()
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=5)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        engine = init_database(url=f"sqlite:///{os.path.join(temp_dir, 'database.sqlite')}")
+        try:
+            started = time.perf_counter()
+            documents = populate(args.rows)
+            elapsed = time.perf_counter() - started
+            print(f"Inserted {args.rows} recent documents in {elapsed:.1f}s")
+            sample = random.sample(documents, args.lookups)
+            lookups = {
+                "uri, full scan": lambda uri, _h: scan_by_uri(RecentDocument, uri),
+                "uri, indexed": lambda uri, _h: recents_manager._get_document_by_uri(
+                    RecentDocument, uri
+                ),
+                "content hash, full scan": lambda uri, h: scan_by_content_hash(
+                    RecentDocument, h, uri
+                ),
+                "content hash, indexed": lambda uri, h: (
+                    recents_manager._get_documents_by_content_hash(RecentDocument, h, uri)
+                ),
+            }
+            for name, lookup in lookups.items():
+                print(f"{name}: {time_lookups(lookup, sample):.2f}ms median")
+        finally:
+            close_all_sessions()
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# coding: utf-8
+
+"""
+Measures the latency of repeatedly searching the same document in a worker process.
+A fresh `QueueProcess`, which opens the document every time, is compared with the
+document worker pool, which keeps the document open between searches.
+
+Usage:
+    python benchmarks/bench_document_worker_pool.py path/to/book.epub --term "the" --repeat 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+
+from bookworm.concurrency import QueueProcess, WorkerPool
+from bookworm.document import create_document
+from bookworm.document.operations import SearchRequest, search_book
+from bookworm.document.uri import DocumentUri
+
+
+def run_search(make_task):
+    started = time.perf_counter()
+    num_results = sum(len(resultset) for resultset in make_task())
+    return time.perf_counter() - started, num_results
+
+
+def report(label, runs):
+    timings = [elapsed * 1000 for (elapsed, _num_results) in runs]
+    print(f"{label}:")
+    print(
+        f"  first {timings[0]:.1f}ms, median of the rest "
+        f"{statistics.median(timings[1:] or timings):.1f}ms, {runs[0][1]} results"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("filename", help="The document to search")
+    parser.add_argument("--term", default="the", help="The term to search for")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    doc = create_document(DocumentUri.from_filename(args.filename))
+    request = SearchRequest(
+        term=args.term,
+        is_regex=False,
+        case_sensitive=False,
+        whole_word=False,
+        from_page=0,
+        to_page=len(doc) - 1,
+    )
+    print(f"Searching {len(doc)} pages for {args.term!r}, {args.repeat} times")
+    report(
+        "A new process for each search",
+        [
+            run_search(lambda: QueueProcess(target=search_book, args=(doc, request)))
+            for _n in range(args.repeat)
+        ],
+    )
+    pool = WorkerPool(max_workers=1, preload_modules=("bookworm.document",))
+    try:
+        report(
+            "The document worker pool",
+            [
+                run_search(
+                    lambda: pool.submit(
+                        search_book, doc, args=(request,), key=doc.get_worker_handle_key()
+                    )
+                )
+                for _n in range(args.repeat)
+            ],
+        )
+    finally:
+        pool.shutdown()
+        doc.close()
+
+
+if __name__ == "__main__":
+    main()
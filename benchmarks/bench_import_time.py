@@ -0,0 +1,168 @@
+# coding: utf-8
+
+"""
+Measures the cold-start import time of a module using `python -X importtime`,
+and the peak memory use of the importing process on POSIX systems, and lists
+the modules which took the longest to import. Fails, with a non-zero
+exit status, if the median import time exceeds `--max-ms`, or if any of the
+`--forbid` modules is imported. By default, the document package is checked
+against the libraries used by the individual document formats, and by image
+processing, which should only be imported when they are first used.
+
+Usage:
+    python benchmarks/bench_import_time.py --module bookworm.document --repeat 5 --max-ms 800
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ON_DEMAND_LIBRARIES = (
+    "bs4",
+    "cv2",
+    "dateparser",
+    "docx",
+    "ebooklib",
+    "fitz",
+    "mammoth",
+    "mistune",
+    "mobi",
+    "msoffcrypto",
+    "numpy",
+    "odf",
+    "pptx",
+    "pyxpdf",
+    "trafilatura",
+    "unrar",
+)
+
+
+def parse_importtime(output, module):
+    """
+    Return a mapping of the modules imported by the given module, including itself,
+    to `(self_us, cumulative_us)` from the output of `python -X importtime`.
+    """
+    lines = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        if not self_us.strip().isdigit():
+            # The header line
+            continue
+        depth = len(name) - len(name.lstrip())
+        lines.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    module_index = next(
+        (index for (index, line) in enumerate(lines) if line[0] == module), None
+    )
+    if module_index is None:
+        return {}
+    # A module is listed after the modules it imports, which are indented further
+    module_depth = lines[module_index][3]
+    timings = {module: lines[module_index][1:3]}
+    for name, self_us, cumulative_us, depth in reversed(lines[:module_index]):
+        if depth <= module_depth:
+            break
+        timings[name] = (self_us, cumulative_us)
+    return timings
+
+
+# Prints the peak resident set size of the process in KiB
+PRINT_PEAK_RSS = """
+import resource, sys
+peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(peak_rss // 1024 if sys.platform == "darwin" else peak_rss)
+"""
+
+
+def measure(module, prelude):
+    """Return the import timings of the module, and the peak RSS of the process in KiB."""
+    code = f"{prelude}\nimport {module}" if prelude else f"import {module}"
+    if resource is not None:
+        code += PRINT_PEAK_RSS
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}:\n{result.stderr}")
+    timings = parse_importtime(result.stderr, module)
+    if not timings:
+        raise RuntimeError(f"{module} was already imported by the prelude")
+    peak_rss = int(result.stdout.split()[-1]) if resource is not None else None
+    return timings, peak_rss
+
+
+def get_imported_modules(timings, modules):
+    """Return which of the given modules, or their submodules, are in the timings."""
+    return sorted(
+        module
+        for module in modules
+        if any(name == module or name.startswith(f"{module}.") for name in timings)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="bookworm.document")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=None,
+        help="Fail if the median import time exceeds this many milliseconds",
+    )
+    parser.add_argument(
+        "--forbid",
+        nargs="*",
+        default=ON_DEMAND_LIBRARIES,
+        help="Fail if any of these modules is imported",
+    )
+    parser.add_argument(
+        "--prelude",
+        default="",
+        help="Code to run before the import, which is excluded from the measurement",
+    )
+    args = parser.parse_args()
+
+    runs, peak_rss = zip(*(measure(args.module, args.prelude) for _n in range(args.repeat)))
+    import_times = [timings[args.module][1] / 1000 for timings in runs]
+    # Use the run closest to the median for the breakdown
+    median = statistics.median(import_times)
+    timings = min(runs, key=lambda timings: abs(timings[args.module][1] / 1000 - median))
+    imported = {name: value for (name, value) in timings.items() if name != args.module}
+
+    print(f"Import time of {args.module} over {args.repeat} runs:")
+    print(
+        f"  median {median:.1f}ms, min {min(import_times):.1f}ms, "
+        f"max {max(import_times):.1f}ms, {len(imported)} modules imported"
+    )
+    if resource is not None:
+        print(f"  median peak RSS of the process {statistics.median(peak_rss) / 1024:.1f}MiB")
+    print("Slowest modules by self time:")
+    slowest = sorted(imported.items(), key=lambda item: item[1][0], reverse=True)
+    for name, (self_us, cumulative_us) in slowest[: args.top]:
+        print(f"  {name}: self {self_us / 1000:.1f}ms, cumulative {cumulative_us / 1000:.1f}ms")
+
+    failures = []
+    if forbidden_modules := get_imported_modules(imported, args.forbid):
+        failures.append(f"Modules which should be imported on demand: {forbidden_modules}")
+    if (args.max_ms is not None) and (median > args.max_ms):
+        failures.append(f"The median import time exceeds {args.max_ms}ms")
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
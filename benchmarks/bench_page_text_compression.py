@@ -0,0 +1,97 @@
+# coding: utf-8
+
+"""
+Measures the size of the bookshelf database and the latency of full-text queries
+before and after compressing the stored page text.
+
+Usage:
+    python benchmarks/bench_page_text_compression.py --pages 100000
+    python benchmarks/bench_page_text_compression.py --database path/to/bookshelf.sqlite
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from bench_bookshelf_fts import (
+    VOCABULARY_SIZE,
+    build_current,
+    make_vocabulary,
+    time_queries,
+)
+
+from bookworm.bookshelf.local_bookshelf import models
+from bookworm.bookshelf.local_bookshelf.tasks import compress_bookshelf_page_text
+
+
+def sample_terms(cursor, count):
+    """Sample indexed terms, weighted towards the frequent ones."""
+    cursor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts_vocabulary "
+        "USING fts5vocab(main, document_fts_index, 'row')"
+    )
+    terms = [
+        term
+        for (term,) in cursor.execute(
+            "SELECT term FROM temp.fts_vocabulary ORDER BY doc DESC LIMIT 20000"
+        )
+        if term.isalpha()
+    ]
+    rng = random.Random(2)
+    frequent = terms[: len(terms) // 10] or terms
+    return [rng.choice(frequent) for _i in range(count // 2)] + [
+        rng.choice(terms) for _i in range(count - count // 2)
+    ]
+
+
+def measure(path, terms):
+    cursor = models.database.connection().cursor()
+    page_content_size = cursor.execute("SELECT SUM(LENGTH(content)) FROM page").fetchone()[0]
+    median, worst = time_queries(
+        lambda term: cursor.execute(
+            *models.DocumentFTSIndex.perform_search(term).sql()
+        ).fetchall(),
+        terms,
+    )
+    return (
+        f"file {path.stat().st_size / 2**20:.1f}MiB, "
+        f"page content {page_content_size / 2**20:.1f}MiB, "
+        f"query median {median * 1000:.2f}ms, max {worst * 1000:.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument(
+        "--database", help="A copy of this bookshelf database is used instead of a synthetic one"
+    )
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = Path(temp_dir, "bookshelf.sqlite")
+        if args.database:
+            shutil.copyfile(args.database, path)
+            models.database.init(os.fspath(path))
+            models.BaseModel.create_all()
+        else:
+            build_current(path, args.pages, make_vocabulary(VOCABULARY_SIZE))
+        models.database.execute_sql("VACUUM")
+        terms = sample_terms(models.database.connection().cursor(), args.queries)
+        print(f"uncompressed: {measure(path, terms)}")
+        started = time.perf_counter()
+        report = compress_bookshelf_page_text()
+        models.database.execute_sql("VACUUM")
+        print(f"compressed in {time.perf_counter() - started:.1f}s: {report}")
+        print(f"compressed: {measure(path, terms)}")
+        models.database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# coding: utf-8
+
+"""
+Measures how plain-text export scales with the number of worker processes.
+
+Usage:
+    python benchmarks/bench_parallel_export.py path/to/large.pdf
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from bookworm.document import create_document
+from bookworm.document.operations import (
+    export_to_plain_text,
+    export_to_plain_text_in_parallel,
+)
+from bookworm.document.uri import DocumentUri
+
+
+def run_export(export_func, uri, target_filename, **kwargs):
+    started = time.perf_counter()
+    for _progress in export_func(create_document(uri), target_filename, **kwargs):
+        pass
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("filename", help="The document to export")
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=os.cpu_count(),
+        help="The maximum number of worker processes",
+    )
+    args = parser.parse_args()
+    uri = DocumentUri.from_filename(args.filename)
+    num_pages = len(create_document(uri))
+    print(f"Exporting {num_pages} pages")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        target_filename = Path(temp_dir, "export.txt")
+        baseline = run_export(export_to_plain_text, uri, target_filename)
+        print(
+            f"sequential: {baseline:.2f}s "
+            f"({num_pages / baseline:.1f} pages/s, {target_filename.stat().st_size} bytes)"
+        )
+        num_workers = 1
+        while num_workers <= args.max_workers:
+            elapsed = run_export(
+                export_to_plain_text_in_parallel,
+                uri,
+                target_filename,
+                num_workers=num_workers,
+            )
+            print(
+                f"{num_workers} workers: {elapsed:.2f}s "
+                f"({num_pages / elapsed:.1f} pages/s, speedup {baseline / elapsed:.2f}x)"
+            )
+            num_workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# coding: utf-8
+
+"""
+Measures how in-document search scales with the number of worker processes.
+
+Usage:
+    python benchmarks/bench_parallel_search.py path/to/large.pdf --term "the"
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+from bookworm.document import create_document
+from bookworm.document.operations import (
+    SearchRequest,
+    search_book,
+    search_book_in_parallel,
+)
+from bookworm.document.uri import DocumentUri
+
+
+def run_search(search_func, uri, request, **kwargs):
+    started = time.perf_counter()
+    num_results = sum(
+        len(resultset)
+        for resultset in search_func(create_document(uri), request, **kwargs)
+    )
+    return time.perf_counter() - started, num_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("filename", help="The document to search")
+    parser.add_argument("--term", default="the", help="The term to search for")
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=os.cpu_count(),
+        help="The maximum number of worker processes",
+    )
+    args = parser.parse_args()
+    uri = DocumentUri.from_filename(args.filename)
+    num_pages = len(create_document(uri))
+    request = SearchRequest(
+        term=args.term,
+        is_regex=False,
+        case_sensitive=False,
+        whole_word=False,
+        from_page=0,
+        to_page=num_pages - 1,
+    )
+    print(f"Searching {num_pages} pages for {args.term!r}")
+    baseline, num_results = run_search(search_book, uri, request)
+    print(f"sequential: {baseline:.2f}s ({num_results} results)")
+    num_workers = 1
+    while num_workers <= args.max_workers:
+        elapsed, num_results = run_search(
+            search_book_in_parallel, uri, request, num_workers=num_workers
+        )
+        print(
+            f"{num_workers} workers: {elapsed:.2f}s "
+            f"({num_results} results, speedup {baseline / elapsed:.2f}x)"
+        )
+        num_workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# coding: utf-8
+
+"""
+Compares looking up the section at a text position by scanning the table of
+content with looking it up in a `SectionIntervalIndex`.
+
+Usage:
+    python benchmarks/bench_section_lookup.py --sections 5000 --lookups 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from bookworm.document.elements import Pager, Section
+from bookworm.document.section_index import SectionIntervalIndex
+from bookworm.structured_text import TextRange
+
+SECTION_LENGTH = 1000
+SUBSECTIONS_PER_SECTION = 4
+
+
+def make_toc_tree(num_sections):
+    """A two-level table of content covering consecutive text ranges."""
+    text_length = num_sections * SECTION_LENGTH
+    root = Section(
+        title="root", pager=Pager(first=0, last=0), text_range=TextRange(0, text_length)
+    )
+    subsection_length = SECTION_LENGTH // SUBSECTIONS_PER_SECTION
+    for i in range(0, num_sections, SUBSECTIONS_PER_SECTION + 1):
+        start = i * SECTION_LENGTH
+        section = Section(
+            title=f"Section {i}",
+            pager=Pager(first=0, last=0),
+            text_range=TextRange(start, start + SECTION_LENGTH * (SUBSECTIONS_PER_SECTION + 1)),
+        )
+        for j in range(SUBSECTIONS_PER_SECTION):
+            sub_start = start + j * subsection_length
+            section.append(
+                Section(
+                    title=f"Section {i}.{j}",
+                    pager=Pager(first=0, last=0),
+                    text_range=TextRange(sub_start, sub_start + subsection_length),
+                )
+            )
+        root.append(section)
+    return root, text_length
+
+
+def find_section_by_scanning(toc_tree, pos):
+    rv = toc_tree
+    for sect in toc_tree.iter_children():
+        if pos in sect.text_range:
+            rv = sect
+    return rv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sections", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+    toc_tree, text_length = make_toc_tree(args.sections)
+    num_sections = sum(1 for _sect in toc_tree.iter_children())
+    positions = [random.randrange(text_length) for _i in range(args.lookups)]
+    print(f"{num_sections} sections, {args.lookups} lookups")
+
+    started = time.perf_counter()
+    index = SectionIntervalIndex.from_text_ranges(toc_tree)
+    build_time = time.perf_counter() - started
+    started = time.perf_counter()
+    indexed = [index.get(pos) for pos in positions]
+    indexed_time = time.perf_counter() - started
+    print(
+        f"index: built in {build_time * 1000:.1f}ms, "
+        f"{indexed_time / args.lookups * 1e6:.2f}us per lookup"
+    )
+
+    # Scanning is slow, so only time a sample of the lookups
+    sample = positions[: max(1, args.lookups // 100)]
+    started = time.perf_counter()
+    scanned = [find_section_by_scanning(toc_tree, pos) for pos in sample]
+    scan_time = time.perf_counter() - started
+    print(f"scan: {scan_time / len(sample) * 1e6:.2f}us per lookup")
+    assert scanned == indexed[: len(sample)]
+    print(f"speedup: {(scan_time / len(sample)) / (indexed_time / args.lookups):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# coding: utf-8
+
+"""
+Measures how long interactive tasks wait while the thread pool is flooded with
+background indexing tasks. A plain, first in first out, thread pool is compared
+with the thread lane of the task scheduler, which starts queued tasks by priority
+and leaves workers free for interactive tasks.
+
+Usage:
+    python benchmarks/bench_task_scheduler.py --background-tasks 500 --interactive-tasks 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bookworm.concurrency import TaskPriority, TaskScheduler
+
+
+def background_task(duration):
+    time.sleep(duration)
+
+
+def interactive_task(submitted_at):
+    return time.perf_counter() - submitted_at
+
+
+def measure(background_executor, interactive_executor, args):
+    background = [
+        background_executor.submit(background_task, args.task_ms / 1000)
+        for _n in range(args.background_tasks)
+    ]
+    latencies = []
+    for _n in range(args.interactive_tasks):
+        future = interactive_executor.submit(interactive_task, time.perf_counter())
+        latencies.append(future.result() * 1000)
+        time.sleep(args.interval_ms / 1000)
+    for future in background:
+        future.cancel()
+    return latencies
+
+
+def report(label, latencies):
+    print(f"{label}:")
+    print(
+        f"  interactive wait: median {statistics.median(latencies):.1f}ms, "
+        f"max {max(latencies):.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--background-tasks", type=int, default=500)
+    parser.add_argument("--interactive-tasks", type=int, default=20)
+    parser.add_argument("--task-ms", type=float, default=20, help="Duration of background tasks")
+    parser.add_argument("--interval-ms", type=float, default=10)
+    parser.add_argument("--cores", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    num_threads = min(32, args.cores + 4)
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        report("First in first out thread pool", measure(executor, executor, args))
+
+    scheduler = TaskScheduler(num_cores=args.cores)
+    try:
+        report(
+            "Task scheduler",
+            measure(
+                scheduler.thread_executor(TaskPriority.INDEXING),
+                scheduler.thread_executor(TaskPriority.INTERACTIVE),
+                args,
+            ),
+        )
+        for priority, metrics in scheduler.get_metrics()["thread"].items():
+            if metrics.submitted:
+                print(
+                    f"  {priority.name}: {metrics.submitted} submitted, "
+                    f"{metrics.cancelled} cancelled, max queue depth {metrics.max_queue_depth}, "
+                    f"mean wait {metrics.mean_wait_time * 1000:.1f}ms"
+                )
+    finally:
+        scheduler.shutdown()
+
+
+if __name__ == "__main__":
+    main()
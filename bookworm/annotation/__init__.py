@@ -3,6 +3,7 @@
 import wx
 
 from bookworm import config, speech
+from bookworm.database import read_session
 from bookworm.database.models import Note, Quote
 from bookworm.logger import logger
 from bookworm.resources import sounds
@@ -231,26 +232,28 @@ class AnnotationService(BookwormService):
         evtdata = {}
         start, end = self.view.get_containing_line(clean_position)
         pos_range = range(start, end)
-        for bookmark in Bookmarker(self.reader).get_for_page():
-            if bookmark.position in pos_range:
-                evtdata["bookmark"] = True
-                break
-        for highlight in Quoter(self.reader).get_for_page():
-            if highlight.start_pos <= clean_position < highlight.end_pos:
-                evtdata["highlight"] = True
-                break
-            elif highlight.start_pos in pos_range:
-                evtdata["line_contains_highlight"] = True
-                break
-        for comment in NoteTaker(self.reader).get_for_page():
-            start_pos, end_pos = (comment.start_pos, comment.end_pos)
-            condition = (
-                (start_pos <= clean_position < end_pos)
-                if (start_pos, end_pos) != (None, None)
-                else comment.position in pos_range
-            )
-            if condition:
-                evtdata["comment"] = True
+        # This runs on every caret move, so it should not wait on positions being saved
+        with read_session() as session:
+            for bookmark in Bookmarker(self.reader).get_for_page(session=session):
+                if bookmark.position in pos_range:
+                    evtdata["bookmark"] = True
+                    break
+            for highlight in Quoter(self.reader).get_for_page(session=session):
+                if highlight.start_pos <= clean_position < highlight.end_pos:
+                    evtdata["highlight"] = True
+                    break
+                elif highlight.start_pos in pos_range:
+                    evtdata["line_contains_highlight"] = True
+                    break
+            for comment in NoteTaker(self.reader).get_for_page(session=session):
+                start_pos, end_pos = (comment.start_pos, comment.end_pos)
+                condition = (
+                    (start_pos <= clean_position < end_pos)
+                    if (start_pos, end_pos) != (None, None)
+                    else comment.position in pos_range
+                )
+                if condition:
+                    evtdata["comment"] = True
         wx.CallAfter(self._process_caret_move, evtdata)
 
     def _process_caret_move(self, evtdata):
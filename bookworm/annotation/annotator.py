@@ -117,8 +117,9 @@ class Annotator:
             filter_criteria=filter_criteria, sort_criteria=sort_criteria, asc=asc
         )
 
-    def get_for_page(self, page_number=None, asc=False):
-        return self.model.query.filter_by(
+    def get_for_page(self, page_number=None, asc=False, session=None):
+        query = self.model.query if session is None else session.query(self.model)
+        return query.filter_by(
             book_id=self.current_book.id,
             page_number=page_number or self.reader.current_page,
         )
@@ -5,7 +5,7 @@ from __future__ import annotations
 
 from bookworm import config
 from bookworm.commandline_handler import BaseSubcommandHandler, register_subcommand
-from bookworm.concurrency import threaded_worker
+from bookworm.concurrency import TaskPriority, task_scheduler
 from bookworm.logger import logger
 from bookworm.service import BookwormService
 from bookworm.signals import reader_book_loaded
@@ -27,10 +27,51 @@ class BookshelfSubcommandHandler(BaseSubcommandHandler):
 
     @classmethod
     def add_arguments(cls, subparser):
-        pass
+        compression_args = subparser.add_mutually_exclusive_group()
+        compression_args.add_argument(
+            "--compress-page-text",
+            action="store_true",
+            help="Compress the page text stored in the bookshelf database",
+        )
+        compression_args.add_argument(
+            "--decompress-page-text",
+            action="store_true",
+            help="Store the page text in the bookshelf database uncompressed",
+        )
+        subparser.add_argument(
+            "--index-documents",
+            action="store_true",
+            help="Add the text of documents added without it to the full-text index",
+        )
 
     @classmethod
     def handle_commandline_args(cls, args):
+        if args.compress_page_text or args.decompress_page_text:
+            from .local_bookshelf.models import BaseModel
+            from .local_bookshelf.tasks import (
+                compress_bookshelf_page_text,
+                decompress_bookshelf_page_text,
+            )
+
+            BaseModel.create_all()
+            try:
+                if args.compress_page_text:
+                    compress_bookshelf_page_text()
+                else:
+                    decompress_bookshelf_page_text()
+            except (RuntimeError, ValueError):
+                log.exception("Failed to rewrite the page text of the bookshelf.")
+                return 1
+            return 0
+        if args.index_documents:
+            from .local_bookshelf.models import BaseModel
+            from .local_bookshelf.tasks import index_bookshelf_documents
+
+            BaseModel.create_all()
+            report = index_bookshelf_documents()
+            for failed_import in report.failed:
+                log.error(f"Failed to index {failed_import.filename}: {failed_import.error}")
+            return int(bool(report.failed))
         run_bookshelf_standalone()
         return 0
 
@@ -71,4 +112,6 @@ class BookshelfService(BookwormService):
         if not config.conf["bookshelf"]["auto_add_opened_documents_to_bookshelf"]:
             return
         log.debug("Book loaded, trying to add it to the shelf...")
-        threaded_worker.submit(issue_add_document_request, sender.document.uri)
+        task_scheduler.thread_executor(TaskPriority.INDEXING).submit(
+            issue_add_document_request, sender.document.uri
+        )
@@ -5,7 +5,6 @@ from __future__ import annotations
 import math
 import os
 from abc import ABC, abstractmethod
-from concurrent.futures import ThreadPoolExecutor
 from functools import cached_property, partial
 from pathlib import Path
 
@@ -13,21 +12,27 @@ import peewee
 import wx
 
 from bookworm import config
+from bookworm.concurrency import TaskPriority, task_scheduler
+from bookworm.database.maintenance import database_maintenance
 from bookworm.document import DocumentInfo
 from bookworm.document.uri import DocumentUri
 from bookworm.gui.book_viewer import BookViewerWindow
 from bookworm.gui.components import AsyncSnakDialog
+from bookworm.image_io import ImageIO
 from bookworm.logger import logger
 from bookworm.signals import app_booting
 
 from ..provider import (
+    ITEMS_PAGE_SIZE,
     BookshelfAction,
     BookshelfProvider,
     ItemContainerSource,
+    ItemsPage,
     MetaSource,
     Source,
     sources_updated,
 )
+from .database import paginate_by_key
 from .dialogs import (
     AddFolderToLocalBookshelfDialog,
     BookshelfSearchResultsDialog,
@@ -44,6 +49,7 @@ from .models import (
     DocumentAuthor,
     DocumentFTSIndex,
     DocumentTag,
+    DocumentThumbnail,
     Tag,
 )
 from .tasks import (
@@ -58,6 +64,7 @@ log = logger.getChild(__name__)
 @app_booting.connect
 def create_db_tables(sender):
     BaseModel.create_all()
+    database_maintenance.register(BaseModel.create_maintenance_target())
 
 
 class LocalBookshelfProvider(BookshelfProvider):
@@ -318,10 +325,19 @@ class LocalBookshelfProvider(BookshelfProvider):
 
     def _on_folder_import_done(self, future):
         try:
-            future.result()
+            report = future.result()
             wx.MessageBox(
                 # Translators: content of a message shown when importing documents from a folder to the bookshelf is successful
-                _("Documents imported from folder."),
+                _(
+                    "Documents imported from folder.\n"
+                    "Imported: {imported}, unchanged: {skipped}, "
+                    "removed: {removed}, failed: {failed}."
+                ).format(
+                    imported=report.num_documents,
+                    skipped=report.num_skipped,
+                    removed=report.num_removed,
+                    failed=len(report.failed),
+                ),
                 # Translators: title of a message shown when importing documents from a folder to the bookshelf is successful
                 _("Operation Completed"),
                 style=wx.ICON_INFORMATION,
@@ -426,13 +442,14 @@ class LocalBookshelfProvider(BookshelfProvider):
         num_succesfull = 0
         func = partial(bundle_single_document, DEFAULT_BOOKSHELF_DATABASE_FILE)
         errors = []
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            for idx, (is_ok, src_file, doc_title) in enumerate(
-                executor.map(func, Document.select())
-            ):
-                if not is_ok:
-                    errors.append((src_file, doc_title))
-                num_succesfull += 1 * is_ok
+        # The user waits for the copies to finish
+        executor = task_scheduler.thread_executor(TaskPriority.INTERACTIVE)
+        for idx, (is_ok, src_file, doc_title) in enumerate(
+            executor.map(func, Document.select())
+        ):
+            if not is_ok:
+                errors.append((src_file, doc_title))
+            num_succesfull += 1 * is_ok
         return num_documents, num_succesfull, errors
 
     def _done_bundling_callback(self, future):
@@ -561,11 +578,30 @@ class LocalDatabaseSource(Source):
         self.query = query
         self.model = model
 
+    def _get_listing_query(self):
+        # Cover images are large, so they are only loaded when they are needed
+        return self.query.clone().select(*Document.get_listing_fields())
+
     def get_items(self):
-        return [doc.as_document_info() for doc in self.query.clone()]
+        return [doc.as_document_info() for doc in self._get_listing_query()]
+
+    def get_item_page(self, after=None, limit=ITEMS_PAGE_SIZE):
+        docs, next_page_key = paginate_by_key(
+            self._get_listing_query(), Document.id, after=after, limit=limit
+        )
+        return ItemsPage(
+            [doc.as_document_info() for doc in docs], next_page_key=next_page_key
+        )
 
     def get_item_count(self):
-        return self.query.count()
+        return self.query.order_by().count()
+
+    def get_item_thumbnail(self, item, size):
+        if image_data := DocumentThumbnail.get_thumbnail(item.data["database_id"], size):
+            return ImageIO.from_bytes(image_data)
+
+    def get_item_cover_image(self, item):
+        return self.get_doc_instance(item).cover_image
 
     def get_item_actions(self, item):
         doc_instance = self.get_doc_instance(item)
@@ -0,0 +1,113 @@
+# coding: utf-8
+
+"""
+Optional compression of the page text stored in the bookshelf database.
+Pages are compressed one by one using zstandard, with a dictionary trained
+on the pages of the library, so that reading a page only decompresses that page.
+Compressed pages are stored as blobs, and uncompressed pages as text.
+"""
+
+from __future__ import annotations
+
+import threading
+
+from bookworm import typehints as t
+from bookworm.logger import logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+log = logger.getChild(__name__)
+PAGE_TEXT_COMPRESSION_LEVEL = 9
+PAGE_TEXT_DICTIONARY_SIZE = 112 * 1024
+
+
+def is_page_text_compression_available() -> bool:
+    return zstandard is not None
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise RuntimeError(
+            "The zstandard package is required to use compressed page text in the bookshelf"
+        )
+
+
+def train_page_text_dictionary(samples: t.Iterable[str]) -> tuple[int, bytes]:
+    """Train a dictionary on the given page texts. Return its id and its data."""
+    _require_zstandard()
+    dictionary = zstandard.train_dictionary(
+        PAGE_TEXT_DICTIONARY_SIZE,
+        [text.encode("utf-8") for text in samples],
+        level=PAGE_TEXT_COMPRESSION_LEVEL,
+    )
+    return dictionary.dict_id(), dictionary.as_bytes()
+
+
+class PageTextCodec:
+    """
+    Compresses and decompresses page text. Dictionaries are loaded once,
+    using `dictionary_loader`, when a page compressed with them is first read.
+    """
+
+    def __init__(self, dictionary_loader: t.Callable[[int], bytes] = None):
+        self.dictionary_loader = dictionary_loader
+        self._dictionaries = {}
+        self._lock = threading.Lock()
+        # Zstandard (de)compressors should not be shared between threads
+        self._local = threading.local()
+
+    def _get_dictionary(self, dict_id, dict_data=None):
+        if (dictionary := self._dictionaries.get(dict_id)) is not None:
+            return dictionary
+        with self._lock:
+            if dict_data is None:
+                dict_data = self.dictionary_loader(dict_id)
+                if dict_data is None:
+                    raise LookupError(f"Page text compression dictionary {dict_id} not found")
+            dictionary = zstandard.ZstdCompressionDict(dict_data)
+            return self._dictionaries.setdefault(dict_id, dictionary)
+
+    def _get_local_cache(self, name):
+        if (cache := getattr(self._local, name, None)) is None:
+            cache = {}
+            setattr(self._local, name, cache)
+        return cache
+
+    def get_compressor(self, dict_id: int, dict_data: bytes) -> t.Callable[[str], bytes]:
+        """Return a function which compresses text using the given dictionary."""
+        _require_zstandard()
+        dictionary = self._get_dictionary(dict_id, dict_data)
+        compressors = self._get_local_cache("compressors")
+        if (compressor := compressors.get(dict_id)) is None:
+            compressor = compressors[dict_id] = zstandard.ZstdCompressor(
+                level=PAGE_TEXT_COMPRESSION_LEVEL, dict_data=dictionary
+            )
+        return lambda text: compressor.compress(text.encode("utf-8"))
+
+    def decompress(self, value: t.Union[str, bytes, None]) -> t.Optional[str]:
+        """Return the text of a stored page, whether it is compressed or not."""
+        if not isinstance(value, bytes):
+            return value
+        _require_zstandard()
+        dict_id = zstandard.get_frame_parameters(value).dict_id
+        decompressors = self._get_local_cache("decompressors")
+        if (decompressor := decompressors.get(dict_id)) is None:
+            decompressor = decompressors[dict_id] = zstandard.ZstdDecompressor(
+                dict_data=self._get_dictionary(dict_id) if dict_id else None
+            )
+        return decompressor.decompress(value).decode("utf-8")
+
+    @staticmethod
+    def get_dictionary_id(value: t.Union[str, bytes]) -> t.Optional[int]:
+        """The id of the dictionary used to compress the given value, if it is compressed."""
+        if not isinstance(value, bytes):
+            return None
+        _require_zstandard()
+        return zstandard.get_frame_parameters(value).dict_id
+
+
+page_text_codec = PageTextCodec()
@@ -1,22 +1,67 @@
 # coding: utf-8
 
+import contextlib
 import typing
 
+import apsw
 from peewee import *
-from peewee import ColumnBase, EnclosedNodeList, NodeList
+from peewee import ColumnBase, EnclosedNodeList, NodeList, Ordering
 from playhouse.apsw_ext import APSWDatabase, BooleanField, DateTimeField
 
+from bookworm.database.maintenance import SQLiteChangeCounter, SQLiteMaintenanceTarget
 from bookworm.document.uri import DocumentUri
 from bookworm.image_io import ImageIO
 
 
 class AutoOptimizedAPSWDatabase(APSWDatabase):
-    """Optimizes the database after closing each connection as per recommended practices for sqlite3."""
+    """
+    Counts the rows changed using its connections, so that the database is
+    optimized by the maintenance scheduler when it needs to be, rather than
+    each time a connection is closed. Connections are kept open by their threads.
+    """
 
-    def close(self):
-        cursor = self.connection().cursor()
-        cursor.execute("PRAGMA optimize")
-        super().close()
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.change_counter = SQLiteChangeCounter()
+
+    def _add_conn_hooks(self, conn):
+        # Setting it waits for writers, and only takes effect when the database is created
+        if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        super()._add_conn_hooks(conn)
+
+    def _connect(self):
+        conn = super()._connect()
+        self.change_counter.register(conn, apsw.Connection.total_changes)
+        return conn
+
+    def _close(self, conn):
+        self.change_counter.retire(conn)
+        super()._close(conn)
+
+    @contextlib.contextmanager
+    def without_waiting_for_writers(self):
+        """
+        Fail with `apsw.BusyError` at once, rather than waiting for the busy timeout,
+        if another connection is writing to the database.
+        """
+        connection = self.connection()
+        connection.setbusytimeout(0)
+        try:
+            yield
+        finally:
+            if self._timeout is not None:
+                connection.setbusytimeout(int(self._timeout * 1000))
+
+    def create_maintenance_target(
+        self, name: str, fts_tables: typing.Iterable[str] = ()
+    ) -> SQLiteMaintenanceTarget:
+        return SQLiteMaintenanceTarget(
+            name,
+            execute=lambda sql: list(self.execute_sql(sql)),
+            change_counter=self.change_counter,
+            fts_tables=fts_tables,
+        )
 
 
 class AutoCalculatedField(Field):
@@ -73,6 +118,9 @@ class ImageField(BlobField):
     """Uses ImageIO to store and retreive images from the database."""
 
     def db_value(self, value):
+        if isinstance(value, bytes):
+            # Already encoded
+            return value
         if value:
             try:
                 return value.as_bytes(format="JPEG")
@@ -95,6 +143,84 @@ class DocumentUriField(TextField):
         return DocumentUri.from_uri_string(value)
 
 
+class PageContentField(TextField):
+    """Stores page text as text, or compressed as a blob, and returns it as stored."""
+
+    def db_value(self, value):
+        if isinstance(value, bytes):
+            return value
+        return super().db_value(value)
+
+    def python_value(self, value):
+        return value
+
+
+def get_keyset_ordering(query, key_field) -> typing.Optional[list[tuple[Field, bool]]]:
+    """
+    Return the ordering of the query as `(field, is_descending)` pairs, with the
+    key field appended to break ties, or None if the query can not be paginated
+    by key, i.e. it is limited, or not ordered by fields of the model in one direction.
+    """
+    if (query._limit is not None) or (query._offset is not None):
+        return None
+    ordering = []
+    for node in query._order_by or ():
+        if isinstance(node, Ordering):
+            field, is_descending = node.node, node.direction.upper() == "DESC"
+        else:
+            field, is_descending = node, False
+        if (not isinstance(field, Field)) or (field.model is not key_field.model):
+            return None
+        ordering.append((field, is_descending))
+    directions = {is_descending for (_field, is_descending) in ordering}
+    if len(directions) > 1:
+        return None
+    is_descending = directions.pop() if directions else False
+    if all(field is not key_field for (field, _d) in ordering):
+        ordering.append((key_field, is_descending))
+    return ordering
+
+
+def paginate_by_key(query, key_field, after=None, limit=100) -> tuple[list, typing.Any]:
+    """
+    Return up to `limit` rows of the query which come after the given page key,
+    and the key of the next page, or None if this is the last page.
+    Rows are located by comparing the values of the ordering fields of the query
+    (keyset pagination), so the cost of fetching a page does not grow with its
+    position. Queries which can not be paginated by key use offsets instead.
+    """
+    if (ordering := get_keyset_ordering(query, key_field)) is None:
+        offset = after or 0
+        if query._limit is not None:
+            rows = list(query.clone())[offset : offset + limit + 1]
+        else:
+            rows = list(query.clone().offset(offset).limit(limit + 1))
+        next_key = offset + limit
+    else:
+        fields = [field for (field, _d) in ordering]
+        is_descending = ordering[0][1]
+        query = query.clone().order_by(
+            *(field.desc() if is_descending else field.asc() for field in fields)
+        )
+        if after is not None:
+            row_value = Tuple(*fields)
+            after_value = Tuple(
+                *(Value(value, converter=field.db_value) for field, value in zip(fields, after))
+            )
+            query = query.where(
+                (row_value < after_value) if is_descending else (row_value > after_value)
+            )
+        rows = list(query.limit(limit + 1))
+        next_key = (
+            tuple(getattr(rows[limit - 1], field.name) for field in fields)
+            if len(rows) > limit
+            else None
+        )
+    if len(rows) <= limit:
+        return rows, None
+    return rows[:limit], next_key
+
+
 class SqliteViewSchemaManager(SchemaManager):
     def _create_table(self, safe=True, **options):
         if not getattr(self.model, "view_select_builder", None):
@@ -3,6 +3,7 @@
 import os
 from datetime import datetime
 
+import apsw
 import attr
 import ujson
 from peewee import *
@@ -14,10 +15,13 @@ from playhouse.sqlite_ext import (
     SearchField,
 )
 
+from bookworm import typehints as t
 from bookworm.document import DocumentInfo
 from bookworm.i18n import LocaleInfo
+from bookworm.logger import logger
 from bookworm.paths import db_path
 
+from .compression import page_text_codec
 from .database import (
     AutoCalculatedField,
     AutoOptimizedAPSWDatabase,
@@ -25,11 +29,12 @@ from .database import (
     DateTimeField,
     DocumentUriField,
     ImageField,
-    SqliteViewSchemaManager,
+    PageContentField,
 )
 
+log = logger.getChild(__name__)
 BOOKWORM_BOOKSHELF_APP_ID = 10194273
-BOOKWORM_BOOKSHELF_SCHEMA_VERSION = 2
+BOOKWORM_BOOKSHELF_SCHEMA_VERSION = 4
 DEFAULT_BOOKSHELF_DATABASE_FILE = db_path("bookshelf.sqlite")
 database = AutoOptimizedAPSWDatabase(
     os.fspath(DEFAULT_BOOKSHELF_DATABASE_FILE),
@@ -40,12 +45,51 @@ database = AutoOptimizedAPSWDatabase(
         ("foreign_keys", 1),
     ],
 )
-TRIGGER_DELETE_FTS_INDEX_ON_PAGE_DELETE = (
-    "CREATE TRIGGER IF NOT EXISTS doc_fts_idx_remove AFTER DELETE ON page\n"
+# Page text may be stored compressed, so it is read using this function
+database.func("bookshelf_text", 1)(page_text_codec.decompress)
+# The text of the pages, decompressed as rows are read
+PAGE_TEXT_VIEW = (
+    "CREATE VIEW IF NOT EXISTS page_text AS\n"
+    "SELECT id, number, document_id, bookshelf_text(content) AS content FROM page"
+)
+# The full-text indexes read their content from the page_text view and the document
+# table, and are kept in sync with the page and document tables using these triggers
+FTS_INDEX_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS page_fts_idx_insert AFTER INSERT ON page\n"
+    "BEGIN\n"
+    "INSERT INTO document_fts_index(rowid, number, document_id, content)\n"
+    "VALUES(new.id, new.number, new.document_id, bookshelf_text(new.content));\n"
+    "END;",
+    "CREATE TRIGGER IF NOT EXISTS page_fts_idx_delete AFTER DELETE ON page\n"
+    "BEGIN\n"
+    "INSERT INTO document_fts_index(document_fts_index, rowid, number, document_id, content)\n"
+    "VALUES('delete', old.id, old.number, old.document_id, bookshelf_text(old.content));\n"
+    "END;",
+    # Compressing or decompressing a page does not change its text
+    "CREATE TRIGGER IF NOT EXISTS page_fts_idx_update AFTER UPDATE ON page\n"
+    "WHEN (old.number IS NOT new.number) OR (old.document_id IS NOT new.document_id)\n"
+    "OR (bookshelf_text(old.content) IS NOT bookshelf_text(new.content))\n"
+    "BEGIN\n"
+    "INSERT INTO document_fts_index(document_fts_index, rowid, number, document_id, content)\n"
+    "VALUES('delete', old.id, old.number, old.document_id, bookshelf_text(old.content));\n"
+    "INSERT INTO document_fts_index(rowid, number, document_id, content)\n"
+    "VALUES(new.id, new.number, new.document_id, bookshelf_text(new.content));\n"
+    "END;",
+    "CREATE TRIGGER IF NOT EXISTS document_title_fts_idx_insert AFTER INSERT ON document\n"
+    "BEGIN\n"
+    "INSERT INTO document_title_fts_index(rowid, title) VALUES(new.id, new.title);\n"
+    "END;",
+    "CREATE TRIGGER IF NOT EXISTS document_title_fts_idx_delete AFTER DELETE ON document\n"
+    "BEGIN\n"
+    "INSERT INTO document_title_fts_index(document_title_fts_index, rowid, title)\n"
+    "VALUES('delete', old.id, old.title);\n"
+    "END;",
+    "CREATE TRIGGER IF NOT EXISTS document_title_fts_idx_update AFTER UPDATE OF title ON document\n"
     "BEGIN\n"
-    "INSERT INTO document_fts_index(document_fts_index, rowid, page_number, document_id, content)\n"
-    "VALUES('delete', old.id, old.number, old.document_id, old.content);\n"
-    "END;"
+    "INSERT INTO document_title_fts_index(document_title_fts_index, rowid, title)\n"
+    "VALUES('delete', old.id, old.title);\n"
+    "INSERT INTO document_title_fts_index(rowid, title) VALUES(new.id, new.title);\n"
+    "END;",
 )
 
 
@@ -77,19 +121,25 @@ class BaseModel(Model):
                 Format,
                 Tag,
                 Document,
+                DocumentThumbnail,
                 Page,
-                VwDocumentPage,
                 DocumentAuthor,
                 DocumentTag,
                 DocumentFTSIndex,
+                DocumentTitleFTSIndex,
+                FolderSyncEntry,
+                CompressionDictionary,
             )
         )
-        with database:
+        with database.atomic():
             cursor = database.connection().cursor()
             cursor.execute(f"PRAGMA application_id={BOOKWORM_BOOKSHELF_APP_ID}")
-            # Create a trigger to remove FTS indexes for deleted pages
-            cursor.execute(TRIGGER_DELETE_FTS_INDEX_ON_PAGE_DELETE)
+            cursor.execute(PAGE_TEXT_VIEW)
         cls.perform_migrations()
+        with database.atomic():
+            cursor = database.connection().cursor()
+            for trigger in FTS_INDEX_TRIGGERS:
+                cursor.execute(trigger)
 
     @classmethod
     def perform_migrations(cls):
@@ -114,8 +164,49 @@ class BaseModel(Model):
                     'ALTER TABLE "document" ADD COLUMN "is_currently_reading" INTEGER DEFAULT  0;'
                 )
                 cursor.execute(f"PRAGMA user_version=2")
+        elif user_version == 2:
+            # The full-text index used to read its content from a view, and
+            # stored the title of the document with each page. It is replaced by
+            # the index of version 4 at once, so it is only rebuilt once.
+            with database.transaction():
+                cursor = database.connection().cursor()
+                cursor.execute("DROP TRIGGER IF EXISTS doc_fts_idx_remove")
+                cursor.execute("DROP TABLE IF EXISTS document_fts_index")
+                cursor.execute("DROP VIEW IF EXISTS vw_document_page")
+                cursor.execute(PAGE_TEXT_VIEW)
+                DocumentFTSIndex.create_table()
+                DocumentTitleFTSIndex.create_table()
+                DocumentFTSIndex.rebuild()
+                DocumentTitleFTSIndex.rebuild()
+                cursor.execute(f"PRAGMA user_version=4")
+        elif user_version == 3:
+            # The full-text index reads page text through the page_text view,
+            # so that pages may be stored compressed
+            with database.transaction():
+                cursor = database.connection().cursor()
+                for trigger_name in (
+                    "page_fts_idx_insert",
+                    "page_fts_idx_delete",
+                    "page_fts_idx_update",
+                ):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {trigger_name}")
+                cursor.execute("DROP TABLE IF EXISTS document_fts_index")
+                cursor.execute(PAGE_TEXT_VIEW)
+                DocumentFTSIndex.create_table()
+                DocumentFTSIndex.rebuild()
+                cursor.execute(f"PRAGMA user_version=4")
         cls.perform_migrations()
 
+    @classmethod
+    def create_maintenance_target(cls):
+        return cls._meta.database.create_maintenance_target(
+            "bookshelf",
+            fts_tables=(
+                DocumentFTSIndex._meta.table_name,
+                DocumentTitleFTSIndex._meta.table_name,
+            ),
+        )
+
 
 class Author(BaseModel):
     name = TextField(index=True, null=False)
@@ -206,6 +297,11 @@ class Document(BaseModel):
     in_reading_list = BooleanField(default=False)
     is_currently_reading = BooleanField(default=False)
 
+    @classmethod
+    def get_listing_fields(cls):
+        """All the fields except the cover image, which is loaded on demand."""
+        return [field for field in cls._meta.sorted_fields if field is not cls.cover_image]
+
     def as_document_info(self) -> DocumentInfo:
         kwargs = self.metadata.copy()
         kwargs["uri"] = self.uri
@@ -233,9 +329,58 @@ class Document(BaseModel):
         return any([is_category_created, is_tag_created])
 
 
+class DocumentThumbnail(BaseModel):
+    """
+    A small copy of the cover image of a document, for showing the document in lists.
+    Created from the cover image the first time it is needed. Thumbnails are requested
+    by the GUI while documents may be imported, so they are not cached if the database
+    is being written to, rather than waiting for the import to finish its transaction.
+    """
+
+    document = ForeignKeyField(
+        column_name="document_id",
+        field="id",
+        model=Document,
+        backref="thumbnails",
+        primary_key=True,
+        on_delete="CASCADE",
+    )
+    size = IntegerField(null=False)
+    # None if the document has no cover image
+    image = BlobField(null=True)
+
+    @classmethod
+    def get_thumbnail(cls, document_id, size) -> t.Optional[bytes]:
+        """Return the JPEG encoded thumbnail of the given size for the given document."""
+        row = cls.select(cls.size, cls.image).where(cls.document == document_id).first()
+        if (row is not None) and (row.size == size):
+            return row.image
+        image = None
+        cover_image = (
+            Document.select(Document.cover_image).where(Document.id == document_id).scalar()
+        )
+        if cover_image is not None:
+            try:
+                image = (
+                    cover_image.make_thumbnail(size, size, exact_fit=True)
+                    .as_bytes(format="JPEG")
+                )
+            except Exception:
+                log.exception(
+                    f"Failed to create thumbnail for document: {document_id}", exc_info=True
+                )
+        try:
+            with database.without_waiting_for_writers():
+                cls.replace(document=document_id, size=size, image=image).execute()
+        except (apsw.BusyError, apsw.LockedError):
+            log.debug(f"The database is busy, the thumbnail of {document_id} is not cached.")
+        return image
+
+
 class Page(BaseModel):
     number = IntegerField(null=False)
-    content = TextField(null=False)
+    # Use `bookshelf_text` to read the text, since pages may be stored compressed
+    content = PageContentField(null=False)
     document = ForeignKeyField(
         column_name="document_id",
         field="id",
@@ -247,7 +392,9 @@ class Page(BaseModel):
     @classmethod
     def get_text_start_position(cls, page_id, text):
         return (
-            cls.select(fn.ABS(fn.INSTR(cls.content, text))).where(cls.id == page_id)
+            cls.select(fn.ABS(fn.INSTR(fn.bookshelf_text(cls.content), text))).where(
+                cls.id == page_id
+            )
         ).scalar()
 
 
@@ -293,63 +440,67 @@ class DocumentTag(BaseModel):
         primary_key = CompositeKey("document", "tag")
 
 
-class VwDocumentPage(BaseModel):
-    """A custom view to aggregate information from the document and page tables."""
+class FolderSyncEntry(BaseModel):
+    """
+    The manifest of a folder synced to the bookshelf. Records the state of each
+    document file when it was last synced, so unchanged files are skipped without
+    opening them, and documents whose files were removed are pruned.
+    """
 
-    page_id = IntegerField()
-    page_number = IntegerField()
-    document_id = IntegerField()
-    document_title = TextField()
-    content = TextField()
+    folder = TextField(index=True, null=False)
+    path = TextField(unique=True, null=False)
+    size = IntegerField(null=False)
+    mtime_ns = IntegerField(null=False)
+    file_hash = TextField(null=True)
+    document = ForeignKeyField(
+        column_name="document_id",
+        field="id",
+        model=Document,
+        backref="sync_entries",
+        null=True,
+        on_delete="CASCADE",
+    )
+    error = TextField(null=True)
+
+    @property
+    def is_failed(self):
+        return self.error is not None
+
+    def matches_stat(self, size, mtime_ns):
+        return (self.size == size) and (self.mtime_ns == mtime_ns)
+
+
+class CompressionDictionary(BaseModel):
+    """A dictionary trained on the pages of this library, used to compress page text."""
+
+    dict_id = IntegerField(unique=True, null=False)
+    data = BlobField(null=False)
+    date_added = DateTimeField(default=datetime.utcnow, null=False)
 
     @classmethod
-    def view_select_builder(cls):
-        return Page.select(
-            Page.id.alias("page_id"),
-            Page.number.alias("page_number"),
-            Document.id.alias("document_id"),
-            Document.title.alias("document_title"),
-            Page.content.alias("content"),
-        ).join(Document, on=Page.document_id == Document.id)
+    def get_active(cls):
+        """The dictionary used to compress new pages, or None if compression is disabled."""
+        return cls.select().order_by(cls.id.desc()).first()
 
-    class Meta:
-        primary_key = False
-        schema_manager_class = SqliteViewSchemaManager
+    @classmethod
+    def get_data(cls, dict_id):
+        return cls.select(cls.data).where(cls.dict_id == dict_id).scalar()
 
 
 class DocumentFTSIndex(BaseModel, FTS5Model):
+    """
+    An external content index of the text of the pages. Only the index is stored,
+    the text and the unindexed columns are read from the page_text view by rowid,
+    so only the pages being shown are decompressed.
+    """
+
     rowid = RowIDField()
-    page_number = SearchField(unindexed=True)
+    page_number = SearchField(unindexed=True, column_name="number")
     document_id = SearchField(unindexed=True)
-    document_title = SearchField()
     content = SearchField()
 
     @classmethod
-    def add_document_to_search_index(cls, document_id):
-        return DocumentFTSIndex.insert_from(
-            (
-                VwDocumentPage.select(
-                    VwDocumentPage.page_id.alias("rowid"),
-                    VwDocumentPage.page_number.alias("page_number"),
-                    VwDocumentPage.document_id.alias("document_id"),
-                    VwDocumentPage.document_title.alias("document_title"),
-                    VwDocumentPage.content.alias("content"),
-                )
-                .join(Document, on=VwDocumentPage.document_id == Document.id)
-                .join(Page, on=VwDocumentPage.page_id == Page.id)
-                .where(Document.id == document_id)
-            ),
-            fields=[
-                "rowid",
-                "page_number",
-                "document_id",
-                "document_title",
-                "content",
-            ],
-        )
-
-    @classmethod
-    def perform_search(cls, column, term):
+    def perform_search(cls, term):
         if not cls.validate_query(term):
             term = cls.clean_query(term)
         snip_length = len(term) + 8
@@ -358,26 +509,26 @@ class DocumentFTSIndex(BaseModel, FTS5Model):
                 cls.rowid,
                 cls.page_number,
                 cls.document_id,
-                cls.document_title,
-                column.snippet(
+                Document.title,
+                cls.content.snippet(
                     left="", right="", over_length="", max_tokens=snip_length
                 ),
             )
-            .where(column.match(term))
+            .join(Document, on=(cls.document_id == Document.id))
+            .where(cls.match(term))
             .order_by(fn.bm25(cls._meta.entity))
         )
 
     @classmethod
     def search_for_term(cls, term, field="content") -> list[FullTextSearchResult]:
         assert field in ("title", "content"), "Field should be one of: (title, content)"
-        field_column = cls.document_title if field == "title" else cls.content
+        if field == "title":
+            yield from DocumentTitleFTSIndex.search_for_term(term)
+            return
         connection = cls._meta.database.connection()
         with connection:
             cursor = connection.cursor()
-            content_matches = cursor.execute(
-                str(cls.perform_search(field_column, term))
-            )
-            yielded_docs = set()
+            content_matches = cursor.execute(*cls.perform_search(term).sql())
             for (
                 page_id,
                 page_number,
@@ -385,10 +536,6 @@ class DocumentFTSIndex(BaseModel, FTS5Model):
                 document_title,
                 snippet,
             ) in content_matches:
-                if document_id in yielded_docs:
-                    continue
-                if field == "title":
-                    yielded_docs.add(document_id)
                 yield FullTextSearchResult(
                     page_id=page_id,
                     page_index=page_number,
@@ -405,6 +552,63 @@ class DocumentFTSIndex(BaseModel, FTS5Model):
         extension_module = "fts5"
         options = {
             "tokenize": "porter unicode61",
-            "content": VwDocumentPage,
-            "content_rowid": VwDocumentPage.page_id,
+            "content": "page_text",
+            "content_rowid": "id",
+        }
+
+
+class DocumentTitleFTSIndex(BaseModel, FTS5Model):
+    """An external content index of the titles of the documents."""
+
+    rowid = RowIDField()
+    title = SearchField()
+
+    @classmethod
+    def perform_search(cls, term):
+        if not cls.validate_query(term):
+            term = cls.clean_query(term)
+        snip_length = len(term) + 8
+        first_page = Page.alias()
+        return (
+            cls.select(
+                first_page.id,
+                cls.rowid,
+                cls.title,
+                cls.title.snippet(
+                    left="", right="", over_length="", max_tokens=snip_length
+                ),
+            )
+            .join(
+                first_page,
+                JOIN.LEFT_OUTER,
+                on=((first_page.document == cls.rowid) & (first_page.number == 0)),
+            )
+            .where(cls.match(term))
+            .order_by(fn.bm25(cls._meta.entity))
+        )
+
+    @classmethod
+    def search_for_term(cls, term) -> list[FullTextSearchResult]:
+        connection = cls._meta.database.connection()
+        with connection:
+            cursor = connection.cursor()
+            title_matches = cursor.execute(*cls.perform_search(term).sql())
+            for page_id, document_id, document_title, snippet in title_matches:
+                yield FullTextSearchResult(
+                    page_id=page_id,
+                    page_index=0,
+                    document_id=document_id,
+                    document_title=document_title,
+                    snippet=snippet,
+                )
+
+    class Meta:
+        extension_module = "fts5"
+        options = {
+            "tokenize": "porter unicode61",
+            "content": Document,
+            "content_rowid": Document.id,
         }
+
+
+page_text_codec.dictionary_loader = CompressionDictionary.get_data
@@ -3,11 +3,13 @@
 import contextlib
 import os
 import shutil
+import time
 import urllib.parse
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, wait
 from functools import partial
 from pathlib import Path
 
+import attr
 import more_itertools
 import peewee
 import requests
@@ -15,36 +17,53 @@ from bottle import abort, request
 
 from bookworm import local_server, paths
 from bookworm import typehints as t
-from bookworm.concurrency import threaded_worker
-from bookworm.document import BaseDocument, create_document
+from bookworm.concurrency import TaskPriority, task_scheduler
+from bookworm.document import BaseDocument, create_document, probe_document
+from bookworm.document.cache_utils import hash_file
 from bookworm.document.elements import DocumentInfo
 from bookworm.document.uri import DocumentUri
 from bookworm.logger import logger
 from bookworm.runtime import IS_RUNNING_PORTABLE
-from bookworm.signals import app_shuttingdown, local_server_booting
+from bookworm.signals import local_server_booting
 from bookworm.utils import generate_file_md5
 
+from .compression import (
+    is_page_text_compression_available,
+    page_text_codec,
+    train_page_text_dictionary,
+)
 from .models import (
     DEFAULT_BOOKSHELF_DATABASE_FILE,
     Author,
     Category,
+    CompressionDictionary,
     Document,
     DocumentAuthor,
     DocumentFTSIndex,
     DocumentTag,
+    FolderSyncEntry,
     Format,
     Page,
     Tag,
+    database,
 )
 
 log = logger.getChild(__name__)
 ADD_TO_BOOKSHELF_URL_PREFIX = "/add-to-bookshelf"
-local_bookshelf_process_executor = ProcessPoolExecutor(max_workers=8)
-
-
-@app_shuttingdown.connect
-def _shutdown_local_bookshelf_process_executor(sender):
-    local_bookshelf_process_executor.shutdown(wait=False)
+COVER_THUMBNAIL_SIZE = 512
+# Number of documents written to the database in a single transaction
+BULK_IMPORT_BATCH_SIZE = 32
+# A batch is written early once it holds this many pages, to bound memory usage
+BULK_IMPORT_BATCH_MAX_PAGES = 20_000
+# Number of documents that may be extracted ahead of the writer per worker process
+BULK_IMPORT_QUEUE_SIZE_PER_WORKER = 2
+PAGE_INSERT_CHUNK_SIZE = 500
+# Maximum number of parameters bound in a single `IN (...)` clause
+SQL_IN_CLAUSE_CHUNK_SIZE = 500
+# Number of pages sampled to train the page text compression dictionary
+PAGE_TEXT_DICTIONARY_TRAINING_PAGES = 4000
+PAGE_TEXT_DICTIONARY_MIN_TRAINING_PAGES = 100
+PAGE_TEXT_COMPRESSION_CHUNK_SIZE = 500
 
 
 @local_server_booting.connect
@@ -100,106 +119,486 @@ def copy_document_to_bundled_documents(source_document_path, bundled_documents_f
     return bundled_document_path
 
 
-def add_document_to_bookshelf(
-    document_or_uri: t.Union[BaseDocument, DocumentUri],
-    category_name: str,
-    tags_names: list[str],
-    should_add_to_fts: bool,
-    database_file: t.PathLike,
-):
-    """Add the given document to the bookshelf database."""
-    document = (
-        create_document(document_or_uri)
-        if isinstance(document_or_uri, DocumentUri)
-        else document_or_uri
+@attr.s(auto_attribs=True, slots=True)
+class ExtractedDocument:
+    """The information needed to add a document to the bookshelf, extracted from the document."""
+
+    uri: DocumentUri
+    """The URI of the opened document."""
+
+    stored_uri: DocumentUri
+    """The URI stored in the database, which differs from `uri` for bundled documents."""
+
+    title: str
+    author: str
+    metadata: dict
+    num_pages: int
+    cover_image: bytes = None
+    page_texts: list[str] = None
+    file_hash: str = None
+    """The hash of the document file, computed by the worker if the writer needs it."""
+
+
+@attr.s(auto_attribs=True, slots=True, frozen=True)
+class FailedImport:
+    filename: str
+    error: str
+
+
+@attr.s(auto_attribs=True, slots=True)
+class BulkImportReport:
+    num_documents: int = 0
+    num_pages: int = 0
+    num_skipped: int = 0
+    failed: list[FailedImport] = attr.ib(factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def documents_per_second(self) -> float:
+        return self.num_documents / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.num_pages / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"Imported {self.num_documents} documents "
+            f"({self.documents_per_second:.1f} documents/s) "
+            f"with {self.num_pages} pages ({self.pages_per_second:.0f} pages/s) "
+            f"in {self.elapsed:.1f}s. "
+            f"Skipped {self.num_skipped}, failed {len(self.failed)}."
+        )
+
+
+@attr.s(auto_attribs=True, slots=True)
+class FolderSyncReport(BulkImportReport):
+    num_removed: int = 0
+
+    def __str__(self):
+        return f"{super().__str__()} Removed {self.num_removed}."
+
+
+def extract_document(document: BaseDocument, should_add_to_fts: bool) -> ExtractedDocument:
+    return _make_extracted_document(
+        DocumentInfo.from_document(document),
+        num_pages=len(document),
+        page_texts=[page.get_text() for page in document] if should_add_to_fts else None,
     )
-    if (existing_doc := Document.get_or_none(uri=document.uri)) is not None:
-        log.debug("Document already in the database...")
-        if should_add_to_fts:
-            log.debug("Checking index...")
-            db_page_count = (
-                DocumentFTSIndex.select()
-                .where(DocumentFTSIndex.document_id == existing_doc.get_id())
-                .count()
-            )
-            if db_page_count == len(document):
-                log.debug("Document index is OK")
-                return
-            else:
-                log.debug("Document index is not well formed. Rebuilding index...")
-                existing_doc.delete_instance()
+
+
+def extract_document_metadata(uri: DocumentUri) -> ExtractedDocument:
+    """
+    Extract only the metadata and the cover image of the given document, without
+    reading its content. The text can be added later using `index_bookshelf_documents`.
+    """
+    document_info = probe_document(uri)
+    return _make_extracted_document(
+        document_info, num_pages=document_info.number_of_pages or 1
+    )
+
+
+def _make_extracted_document(
+    document_info: DocumentInfo, num_pages: int, page_texts: list[str] = None
+) -> ExtractedDocument:
+    uri = document_info.uri
     if IS_RUNNING_PORTABLE:
         bundled_document_path = copy_document_to_bundled_documents(
-            source_document_path=document.get_file_system_path(),
+            source_document_path=Path(uri.path),
             bundled_documents_folder=get_bundled_documents_folder(),
         )
-        uri = document.uri.create_copy(path=bundled_document_path)
+        stored_uri = uri.create_copy(path=bundled_document_path)
     else:
-        uri = document.uri
-    cover_image = document.get_cover_image()
-    if cover_image:
+        stored_uri = uri
+    cover_image = None
+    if document_info.cover_image:
         try:
-            cover_image = cover_image.make_thumbnail(
-                width=512,
-                height=512,
+            cover_image = document_info.cover_image.make_thumbnail(
+                width=COVER_THUMBNAIL_SIZE,
+                height=COVER_THUMBNAIL_SIZE,
                 exact_fit=True,
-            )
-        except:
-            cover_image = None
-    metadata = document.metadata
-    format, __ = Format.get_or_create(name=uri.format)
-    if category_name:
-        category, __ = Category.get_or_create(name=category_name)
-    else:
-        category = None
-    log.debug("Adding document to the database ")
-    doc_info_dict = DocumentInfo.from_document(document).asdict(
-        excluded_fields=("cover_image",)
-    )
-    doc = Document.create(
+            ).as_bytes(format="JPEG")
+        except Exception:
+            log.exception(f"Failed to create the cover thumbnail for {uri}", exc_info=True)
+    return ExtractedDocument(
         uri=uri,
-        title=metadata.title,
+        stored_uri=stored_uri,
+        title=document_info.title,
+        author=document_info.authors,
+        metadata=document_info.asdict(excluded_fields=("cover_image",)),
+        num_pages=num_pages,
         cover_image=cover_image,
-        format=format,
-        category=category,
-        metadata=doc_info_dict,
+        page_texts=page_texts,
     )
-    doc.save()
-    doc_id = doc.get_id()
-    if author_name := metadata.author:
-        author, __ = Author.get_or_create(name=author_name)
-        DocumentAuthor.create(document_id=doc_id, author_id=author.get_id())
-    if type(tags_names) is str:
-        tags_names = [t.strip() for t in tags_names.split(" ")]
-    tags = [
-        Tag.get_or_create(name=t_name)[0] for t in tags_names if (t_name := t.strip())
-    ]
-    for tag in tags:
-        DocumentTag.create(document_id=doc_id, tag_id=tag.get_id())
-    if should_add_to_fts:
+
+
+def _extract_document_file(
+    filename: str, should_add_to_fts: bool, should_hash_file: bool = False
+) -> ExtractedDocument:
+    """This function runs in a bulk import worker process."""
+    # Hashed before the document is read, so that a file changed while it
+    # is being read gets a hash that no longer matches on the next sync
+    file_hash = hash_file(filename) if should_hash_file else None
+    uri = DocumentUri.from_filename(filename)
+    if not should_add_to_fts:
+        extracted = extract_document_metadata(uri)
+    else:
+        with contextlib.closing(create_document(uri)) as document:
+            extracted = extract_document(document, should_add_to_fts)
+    extracted.file_hash = file_hash
+    return extracted
+
+
+def _extract_document_text(uri: DocumentUri, working_directory: str) -> ExtractedDocument:
+    """
+    This function runs in a bulk import worker process. Relative paths are resolved
+    against the working directory of the importing process, which the process workers
+    of the scheduler do not follow.
+    """
+    file_uri = uri.create_copy(path=os.path.join(working_directory, uri.path))
+    with contextlib.closing(create_document(file_uri)) as document:
+        return ExtractedDocument(
+            uri=uri,
+            stored_uri=uri,
+            title=document.metadata.title,
+            author=document.metadata.author,
+            metadata={},
+            num_pages=len(document),
+            page_texts=[page.get_text() for page in document],
+        )
+
+
+class BookshelfBatchWriter:
+    """
+    Writes extracted documents to the bookshelf database, one batch per transaction.
+    Only one writer should be active at a time. Formats, authors, and tags are looked
+    up once and then remembered.
+    """
+
+    # Whether the extraction workers should hash the document files
+    needs_file_hash = False
+
+    def __init__(self, category_name: str, tags_names: t.Iterable[str], should_add_to_fts: bool):
+        self.should_add_to_fts = should_add_to_fts
+        self.category_id = (
+            Category.get_or_create(name=category_name)[0].get_id() if category_name else None
+        )
+        if type(tags_names) is str:
+            tags_names = tags_names.split(" ")
+        self.tag_ids = [
+            Tag.get_or_create(name=t_name)[0].get_id()
+            for tag_name in tags_names
+            if (t_name := tag_name.strip())
+        ]
+        self._format_ids = {}
+        self._author_ids = {}
+        self._compress_page_text = get_page_text_compressor()
+
+    def _get_format_id(self, name):
+        if (format_id := self._format_ids.get(name)) is None:
+            format_id = self._format_ids[name] = Format.get_or_create(name=name)[0].get_id()
+        return format_id
+
+    def _get_author_id(self, name):
+        if (author_id := self._author_ids.get(name)) is None:
+            author_id = self._author_ids[name] = Author.get_or_create(name=name)[0].get_id()
+        return author_id
+
+    def _get_existing_document_id(self, extracted: ExtractedDocument) -> t.Optional[int]:
+        existing_doc = Document.get_or_none(
+            Document.uri.in_([extracted.uri, extracted.stored_uri])
+        )
+        if existing_doc is None:
+            return None
+        if not self.should_add_to_fts:
+            log.debug("Document already in the database...")
+            return existing_doc.get_id()
+        # Pages are added to the full-text index by triggers
+        db_page_count = Page.select().where(Page.document == existing_doc.get_id()).count()
+        if db_page_count == extracted.num_pages:
+            log.debug("Document index is OK")
+            return existing_doc.get_id()
+        log.debug("Document index is not well formed. Rebuilding index...")
+        existing_doc.delete_instance()
+        return None
+
+    def _add_document(self, extracted: ExtractedDocument) -> int:
+        doc_id = Document.insert(
+            uri=extracted.stored_uri,
+            title=extracted.title,
+            cover_image=extracted.cover_image,
+            format=self._get_format_id(extracted.stored_uri.format),
+            category=self.category_id,
+            metadata=extracted.metadata,
+        ).execute()
+        if extracted.author:
+            DocumentAuthor.insert(
+                document_id=doc_id, author_id=self._get_author_id(extracted.author)
+            ).execute()
+        if self.tag_ids:
+            DocumentTag.insert_many(
+                [(doc_id, tag_id) for tag_id in self.tag_ids],
+                [DocumentTag.document, DocumentTag.tag],
+            ).execute()
+        if self.should_add_to_fts:
+            self._add_pages(doc_id, extracted.page_texts)
+        return doc_id
+
+    def _add_pages(self, doc_id: int, page_texts: list[str]):
+        # Pages are added to the full-text index by triggers
         fields = [Page.number, Page.content, Page.document]
-        page_objs = ((page.index, page.get_text(), doc) for page in document)
-        for batch in more_itertools.chunked(page_objs, 100):
+        if self._compress_page_text is not None:
+            page_texts = map(self._compress_page_text, page_texts)
+        page_rows = ((n, text, doc_id) for (n, text) in enumerate(page_texts))
+        for batch in more_itertools.chunked(page_rows, PAGE_INSERT_CHUNK_SIZE):
             Page.insert_many(batch, fields).execute()
-        DocumentFTSIndex.add_document_to_search_index(doc.get_id()).execute()
+
+    def write(self, batch: list[tuple[str, ExtractedDocument]], report: BulkImportReport):
+        """Write a batch of `(filename, extracted_document)` pairs in a single transaction."""
+        with database.atomic():
+            for filename, extracted in batch:
+                try:
+                    # A failure only rolls back this document
+                    with database.atomic():
+                        doc_id = self._get_existing_document_id(extracted)
+                        is_already_added = doc_id is not None
+                        if not is_already_added:
+                            doc_id = self._add_document(extracted)
+                        self.on_document_written(filename, extracted, doc_id)
+                except Exception as e:
+                    log.exception(f"Failed to add document: {filename}", exc_info=True)
+                    self.add_failure(report, filename, repr(e))
+                    continue
+                if is_already_added:
+                    report.num_skipped += 1
+                    continue
+                report.num_documents += 1
+                report.num_pages += extracted.num_pages
+
+    def on_document_written(self, filename: str, extracted: ExtractedDocument, document_id: int):
+        """Called in the transaction of the batch after a document is added or found."""
+
+    def add_failure(self, report: BulkImportReport, filename: str, error: str):
+        """Record that the given file could not be added to the bookshelf."""
+        report.failed.append(FailedImport(filename, error))
+
+
+class FolderSyncWriter(BookshelfBatchWriter):
+    """Also records each written file in the manifest of the synced folder."""
+
+    needs_file_hash = True
+
+    def __init__(self, folder: str, file_stats: dict[str, tuple[int, int]], *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.folder = folder
+        self.file_stats = file_stats
+
+    def _write_manifest_entry(self, filename, file_hash=None, document_id=None, error=None):
+        size, mtime_ns = self.file_stats[filename]
+        FolderSyncEntry.insert(
+            folder=self.folder,
+            path=filename,
+            size=size,
+            mtime_ns=mtime_ns,
+            file_hash=file_hash,
+            document=document_id,
+            error=error,
+        ).on_conflict_replace().execute()
+
+    def on_document_written(self, filename, extracted, document_id):
+        self._write_manifest_entry(
+            filename, file_hash=extracted.file_hash, document_id=document_id
+        )
+
+    def add_failure(self, report, filename, error):
+        super().add_failure(report, filename, error)
+        try:
+            self._write_manifest_entry(filename, error=error)
+        except Exception:
+            log.exception(f"Failed to record the failure of: {filename}", exc_info=True)
+
+
+class BookshelfIndexWriter(BookshelfBatchWriter):
+    """Adds the pages of documents which were added to the bookshelf without them."""
+
+    def __init__(self):
+        super().__init__(category_name=None, tags_names=(), should_add_to_fts=True)
+
+    @staticmethod
+    def _get_document_id(extracted):
+        document_id = (
+            Document.select(Document.id).where(Document.uri == extracted.stored_uri).scalar()
+        )
+        if document_id is None:
+            raise LookupError(f"Document {extracted.stored_uri} is not in the bookshelf")
+        return document_id
+
+    def _get_existing_document_id(self, extracted):
+        document_id = self._get_document_id(extracted)
+        if Page.select().where(Page.document == document_id).exists():
+            return document_id
+        return None
+
+    def _add_document(self, extracted):
+        document_id = self._get_document_id(extracted)
+        self._add_pages(document_id, extracted.page_texts)
+        return document_id
+
+
+def add_document_to_bookshelf(
+    document_or_uri: t.Union[BaseDocument, DocumentUri],
+    category_name: str,
+    tags_names: list[str],
+    should_add_to_fts: bool,
+    database_file: t.PathLike,
+):
+    """Add the given document to the bookshelf database."""
+    if isinstance(document_or_uri, BaseDocument):
+        extracted = extract_document(document_or_uri, should_add_to_fts)
+    elif should_add_to_fts:
+        with contextlib.closing(create_document(document_or_uri)) as document:
+            extracted = extract_document(document, should_add_to_fts)
+    else:
+        extracted = extract_document_metadata(document_or_uri)
+    report = BulkImportReport()
+    log.debug("Adding document to the database ")
+    BookshelfBatchWriter(category_name, tags_names, should_add_to_fts).write(
+        [(extracted.uri.path, extracted)], report
+    )
+    if report.failed:
+        raise RuntimeError(f"Failed to add document to the bookshelf: {report.failed[0].error}")
+    if should_add_to_fts and report.num_documents:
+        DocumentFTSIndex.optimize()
+
+
+def import_documents_to_bookshelf(
+    filenames: t.Iterable[t.PathLike],
+    category_name: str,
+    tags_names: t.Iterable[str] = (),
+    should_add_to_fts: bool = True,
+    num_workers: int = None,
+) -> BulkImportReport:
+    """
+    Import the given files to the bookshelf. Documents are opened and their text is
+    extracted by a pool of worker processes, while this thread writes them to the
+    database in batches. The full-text index is optimized once, at the end.
+    """
+    started = time.perf_counter()
+    report = BulkImportReport()
+    writer = BookshelfBatchWriter(category_name, tags_names, should_add_to_fts)
+    _run_bulk_import(filenames, writer, report, num_workers)
+    if should_add_to_fts and report.num_documents:
         DocumentFTSIndex.optimize()
+    report.elapsed = time.perf_counter() - started
+    log.info(str(report))
+    return report
+
+
+def index_bookshelf_documents(num_workers: int = None) -> BulkImportReport:
+    """
+    Extract the text of the documents which were added to the bookshelf without it,
+    and add it to the full-text index.
+    """
+    started = time.perf_counter()
+    report = BulkImportReport()
+    has_pages = Page.select().where(Page.document == Document.id)
+    uris = [
+        doc.uri for doc in Document.select(Document.uri).where(~peewee.fn.EXISTS(has_pages))
+    ]
+    _run_bulk_import(
+        uris,
+        BookshelfIndexWriter(),
+        report,
+        num_workers,
+        extract=partial(_extract_document_text, working_directory=os.getcwd()),
+    )
+    if report.num_documents:
+        DocumentFTSIndex.optimize()
+    report.elapsed = time.perf_counter() - started
+    log.info(f"Indexed documents: {report}")
+    return report
+
+
+def _run_bulk_import(
+    filenames: t.Iterable[t.PathLike],
+    writer: BookshelfBatchWriter,
+    report: BulkImportReport,
+    num_workers: int = None,
+    extract: t.Callable[[t.Any], ExtractedDocument] = None,
+):
+    """
+    `extract` is called in a process worker of the task scheduler with each of the given
+    items, which default to file names to be opened and extracted. By default, as many
+    documents are extracted at the same time as the indexing class may run.
+    """
+    if extract is None:
+        extract = partial(
+            _extract_document_file,
+            should_add_to_fts=writer.should_add_to_fts,
+            should_hash_file=writer.needs_file_hash,
+        )
+        filenames = map(os.fspath, filenames)
+    num_workers = num_workers or task_scheduler.processes.class_limits[TaskPriority.INDEXING]
+    filenames = iter(filenames)
+    batch = []
+    num_batch_pages = 0
+    executor = task_scheduler.process_executor(TaskPriority.INDEXING, group=object())
+    try:
+        pending = {}
+
+        def submit_next_file():
+            if (filename := next(filenames, None)) is not None:
+                future = executor.submit(extract, filename)
+                pending[future] = filename
+
+        # Bound the number of extracted documents waiting to be written
+        for _i in range(num_workers * BULK_IMPORT_QUEUE_SIZE_PER_WORKER):
+            submit_next_file()
+        while pending:
+            done, _not_done = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                filename = pending.pop(future)
+                submit_next_file()
+                try:
+                    extracted = future.result()
+                except Exception as e:
+                    log.exception(f"Failed to open document: {filename}", exc_info=True)
+                    with database.atomic():
+                        writer.add_failure(report, filename, repr(e))
+                    continue
+                batch.append((filename, extracted))
+                num_batch_pages += len(extracted.page_texts or ())
+                if (len(batch) >= BULK_IMPORT_BATCH_SIZE) or (
+                    num_batch_pages >= BULK_IMPORT_BATCH_MAX_PAGES
+                ):
+                    writer.write(batch, report)
+                    batch = []
+                    num_batch_pages = 0
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if batch:
+        writer.write(batch, report)
 
 
 def add_to_bookshelf_view():
     data = request.json
     doc_uri = data["document_uri"]
     try:
-        document = create_document(DocumentUri.from_uri_string(doc_uri))
+        uri = DocumentUri.from_uri_string(doc_uri)
+        document_format = BaseDocument.document_formats.get(uri.format)
     except:
         log.exception(f"Failed to open document: {doc_uri}", exc_info=True)
         abort(400, f"Failed to open document: {doc_uri}")
     else:
-        if document.__internal__:
+        if document_format is None:
+            abort(400, f"Failed to open document: {doc_uri}")
+        elif document_format.internal:
             abort(400, f"Document is an internal document: {doc_uri}")
         else:
-            local_bookshelf_process_executor.submit(
+            # The document is opened, or only probed, by the worker process
+            task_scheduler.process_executor(TaskPriority.INDEXING).submit(
                 add_document_to_bookshelf,
-                document,
+                uri,
                 data["category"],
                 data["tags"],
                 data["should_add_to_fts"],
@@ -208,42 +607,261 @@ def add_to_bookshelf_view():
             return {"status": "OK", "document_uri": doc_uri}
 
 
-def import_folder_to_bookshelf(folder, category_name, should_add_to_fts):
+def get_bookshelf_document_extensions() -> set[str]:
+    return set(BaseDocument.document_formats.get_supported_file_extensions(include_internal=False))
+
+
+def scan_folder(
+    folder: str, extensions: set[str]
+) -> tuple[dict[str, tuple[int, int]], list[str]]:
+    """
+    Recursively find the document files in the given folder.
+    Return a mapping of file path to `(size, mtime_ns)`, and the folders which
+    could not be read.
+    """
+    file_stats = {}
+    unreadable_folders = []
+    folders = [folder]
+    while folders:
+        current_folder = folders.pop()
+        try:
+            with os.scandir(current_folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        folders.append(entry.path)
+                    elif (
+                        entry.is_file()
+                        and os.path.splitext(entry.name)[1].lower() in extensions
+                    ):
+                        stat = entry.stat()
+                        file_stats[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            log.exception(f"Failed to read folder: {current_folder}", exc_info=True)
+            unreadable_folders.append(current_folder)
+    return file_stats, unreadable_folders
+
+
+def _is_file_content_unchanged(filename, file_hash) -> bool:
+    try:
+        return hash_file(filename) == file_hash
+    except OSError:
+        return False
+
+
+def sync_folder_to_bookshelf(
+    folder: t.PathLike,
+    category_name: str,
+    should_add_to_fts: bool,
+    num_workers: int = None,
+) -> FolderSyncReport:
+    """
+    Bring the bookshelf up to date with the document files in the given folder
+    and its sub folders, using the manifest recorded by the previous sync.
+    Unchanged files are skipped without opening them, changed files are imported
+    again, and the documents of removed files are removed from the bookshelf.
+    The manifest is written in the same transactions as the documents, so an
+    interrupted sync resumes where it left off.
+    """
+    started = time.perf_counter()
     folder = Path(folder)
     if (not folder.is_dir()) or (not folder.exists()):
         raise FileNotFoundError(f"Folder {folder} not found") from RuntimeError
-    all_document_extensions = set()
-    for doc_cls in BaseDocument.document_classes.values():
-        if not doc_cls.__internal__:
-            all_document_extensions.update(ext.strip("*") for ext in doc_cls.extensions)
-    doc_filenames = (
-        filename
-        for filename in folder.iterdir()
-        if (filename.is_file()) and (filename.suffix in all_document_extensions)
+    folder = os.fspath(folder.resolve())
+    report = FolderSyncReport()
+    file_stats, unreadable_folders = scan_folder(
+        folder, get_bookshelf_document_extensions()
     )
-    with ThreadPoolExecutor(
-        max_workers=8, thread_name_prefix="bookshelf.import.folder"
-    ) as executor:
-        for retval in executor.map(
-            partial(_import_document, category_name, should_add_to_fts), doc_filenames
+    manifest = {
+        entry.path: entry
+        for entry in FolderSyncEntry.select(
+            FolderSyncEntry.id,
+            FolderSyncEntry.path,
+            FolderSyncEntry.size,
+            FolderSyncEntry.mtime_ns,
+            FolderSyncEntry.file_hash,
+            FolderSyncEntry.document,
+            FolderSyncEntry.error,
+        )
+        .where(FolderSyncEntry.folder == folder)
+        .namedtuples()
+    }
+    files_to_import = []
+    touched_entries = []
+    replaced_document_ids = []
+    for filename, (size, mtime_ns) in file_stats.items():
+        entry = manifest.get(filename)
+        if entry is None:
+            files_to_import.append(filename)
+        elif (entry.size, entry.mtime_ns) == (size, mtime_ns):
+            if entry.error is not None:
+                report.failed.append(FailedImport(filename, entry.error))
+            else:
+                report.num_skipped += 1
+        elif (entry.document is not None) and _is_file_content_unchanged(
+            filename, entry.file_hash
         ):
-            if retval:
-                log.info(f"Added document: {retval}")
+            # Only the modification time has changed
+            touched_entries.append((entry.id, size, mtime_ns))
+            report.num_skipped += 1
+        else:
+            files_to_import.append(filename)
+            if entry.document is not None:
+                replaced_document_ids.append(entry.document)
+    # Keep the documents in folders that could not be read this time
+    unreadable_prefixes = tuple(os.path.join(path, "") for path in unreadable_folders)
+    removed_entries = [
+        entry
+        for filename, entry in manifest.items()
+        if (filename not in file_stats) and not filename.startswith(unreadable_prefixes)
+    ]
+    with database.atomic():
+        for entry_id, size, mtime_ns in touched_entries:
+            FolderSyncEntry.update(size=size, mtime_ns=mtime_ns).where(
+                FolderSyncEntry.id == entry_id
+            ).execute()
+        removed_document_ids = [
+            entry.document for entry in removed_entries if entry.document is not None
+        ]
+        # Deleting a document also deletes its pages, search index, and manifest entry
+        for chunk in more_itertools.chunked(
+            replaced_document_ids + removed_document_ids, SQL_IN_CLAUSE_CHUNK_SIZE
+        ):
+            Document.delete().where(Document.id.in_(chunk)).execute()
+        for chunk in more_itertools.chunked(
+            [entry.id for entry in removed_entries], SQL_IN_CLAUSE_CHUNK_SIZE
+        ):
+            FolderSyncEntry.delete().where(FolderSyncEntry.id.in_(chunk)).execute()
+    report.num_removed = len(removed_entries)
+    writer = FolderSyncWriter(
+        folder, file_stats, category_name, (), should_add_to_fts=should_add_to_fts
+    )
+    _run_bulk_import(files_to_import, writer, report, num_workers)
+    if should_add_to_fts and (report.num_documents or report.num_removed):
+        DocumentFTSIndex.optimize()
+    report.elapsed = time.perf_counter() - started
+    log.info(str(report))
+    return report
 
 
-def _import_document(category_name, should_add_to_fts, filename):
-    try:
-        uri = DocumentUri.from_filename(filename)
-        with contextlib.closing(create_document(uri)) as document:
-            add_document_to_bookshelf(
-                document,
-                category_name,
-                tags_names=(),
-                should_add_to_fts=should_add_to_fts,
-                database_file=DEFAULT_BOOKSHELF_DATABASE_FILE,
+def import_folder_to_bookshelf(folder, category_name, should_add_to_fts) -> FolderSyncReport:
+    return sync_folder_to_bookshelf(folder, category_name, should_add_to_fts)
+
+
+@attr.s(auto_attribs=True, slots=True)
+class PageTextCompressionReport:
+    num_pages: int = 0
+    num_changed_pages: int = 0
+    original_size: int = 0
+    stored_size: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def compression_ratio(self) -> float:
+        return self.original_size / self.stored_size if self.stored_size else 1.0
+
+    def __str__(self):
+        return (
+            f"Page text of {self.num_pages} pages: {self.original_size} bytes stored "
+            f"in {self.stored_size} bytes (ratio {self.compression_ratio:.2f}). "
+            f"Rewrote {self.num_changed_pages} pages in {self.elapsed:.1f}s."
+        )
+
+
+def get_page_text_compressor() -> t.Optional[t.Callable[[str], bytes]]:
+    """Return a function to compress new pages, or None if compression is disabled."""
+    if (dictionary := CompressionDictionary.get_active()) is None:
+        return None
+    if not is_page_text_compression_available():
+        log.warning("Page text compression is enabled, but zstandard is not available")
+        return None
+    return page_text_codec.get_compressor(dictionary.dict_id, dictionary.data)
+
+
+def _rewrite_page_text(
+    transform: t.Callable[[t.Union[str, bytes], str], t.Union[str, bytes, None]],
+) -> PageTextCompressionReport:
+    """
+    Pass the stored content and the text of each page to `transform`, and store the
+    returned value unless it is None. The full-text index is not updated, since the
+    text is unchanged.
+    """
+    started = time.perf_counter()
+    report = PageTextCompressionReport()
+    last_page_id = 0
+    while True:
+        with database.atomic():
+            rows = (
+                Page.select(Page.id, Page.content)
+                .where(Page.id > last_page_id)
+                .order_by(Page.id)
+                .limit(PAGE_TEXT_COMPRESSION_CHUNK_SIZE)
+                .tuples()
             )
-    except:
-        return
+            rows = list(rows)
+            if not rows:
+                break
+            for page_id, content in rows:
+                text = page_text_codec.decompress(content)
+                new_content = transform(content, text)
+                if new_content is not None:
+                    Page.update(content=new_content).where(Page.id == page_id).execute()
+                    report.num_changed_pages += 1
+                    content = new_content
+                text_size = len(text.encode("utf-8"))
+                report.num_pages += 1
+                report.original_size += text_size
+                report.stored_size += len(content) if isinstance(content, bytes) else text_size
+            last_page_id = rows[-1][0]
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def compress_bookshelf_page_text(retrain_dictionary=False) -> PageTextCompressionReport:
+    """
+    Enable compression of the page text stored in the bookshelf. A dictionary is
+    trained on a sample of the pages in the library, then every page which is not
+    compressed with it is compressed. New pages are compressed as they are added.
+    """
+    if not is_page_text_compression_available():
+        raise RuntimeError("The zstandard package is required to compress page text")
+    dictionary = CompressionDictionary.get_active()
+    if (dictionary is None) or retrain_dictionary:
+        samples = [
+            page_text_codec.decompress(content)
+            for (content,) in Page.select(Page.content)
+            .order_by(peewee.fn.RANDOM())
+            .limit(PAGE_TEXT_DICTIONARY_TRAINING_PAGES)
+            .tuples()
+        ]
+        if len(samples) < PAGE_TEXT_DICTIONARY_MIN_TRAINING_PAGES:
+            raise ValueError(
+                f"At least {PAGE_TEXT_DICTIONARY_MIN_TRAINING_PAGES} pages are needed "
+                "to train a compression dictionary"
+            )
+        dict_id, dict_data = train_page_text_dictionary(samples)
+        dictionary = CompressionDictionary.create(dict_id=dict_id, data=dict_data)
+    compress = page_text_codec.get_compressor(dictionary.dict_id, dictionary.data)
+
+    def compress_page(content, text):
+        if page_text_codec.get_dictionary_id(content) == dictionary.dict_id:
+            return None
+        return compress(text)
+
+    report = _rewrite_page_text(compress_page)
+    # Dictionaries which are no longer used
+    CompressionDictionary.delete().where(CompressionDictionary.id != dictionary.id).execute()
+    log.info(str(report))
+    return report
+
+
+def decompress_bookshelf_page_text() -> PageTextCompressionReport:
+    """Disable compression of the page text stored in the bookshelf, and decompress all pages."""
+    report = _rewrite_page_text(
+        lambda content, text: text if isinstance(content, bytes) else None
+    )
+    CompressionDictionary.delete().execute()
+    log.info(str(report))
+    return report
 
 
 def bundle_single_document(database_file, doc_instance):
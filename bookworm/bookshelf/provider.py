@@ -18,6 +18,15 @@ log = logger.getChild(__name__)
 
 
 sources_updated = _signals.signal("bookshelf/source_updated")
+# The number of items retrieved at once when listing the items of a source
+ITEMS_PAGE_SIZE = 200
+
+
+@attr.s(auto_attribs=True, slots=True, frozen=True)
+class ItemsPage:
+    items: list
+    next_page_key: t.Any = None
+    """Pass this to `Source.get_item_page` to get the next page. None for the last page."""
 
 
 class BookshelfProvider(ABC):
@@ -94,10 +103,37 @@ class Source:
         """Return a list of documents contained in this source."""
         yield from self.get_items()
 
+    def get_item_page(self, after=None, limit=ITEMS_PAGE_SIZE) -> ItemsPage:
+        """
+        Return up to `limit` items, starting after the page whose `next_page_key`
+        is given. Sources which can retrieve a page without retrieving all
+        of their items should override this.
+        """
+        start = after or 0
+        items = list(self.get_items() or ())[start : start + limit + 1]
+        if len(items) <= limit:
+            return ItemsPage(items)
+        return ItemsPage(items[:limit], next_page_key=start + limit)
+
+    def iter_item_pages(self, limit=ITEMS_PAGE_SIZE) -> t.Iterator[list[DocumentInfo]]:
+        page = self.get_item_page(limit=limit)
+        yield page.items
+        while page.next_page_key is not None:
+            page = self.get_item_page(after=page.next_page_key, limit=limit)
+            yield page.items
+
     @abstractmethod
     def get_item_count(self):
         """Return the number of documents in this source."""
 
+    def get_item_thumbnail(self, item, size: int) -> t.Optional[ImageIO]:
+        """Return a thumbnail of the cover image of the given item."""
+        if cover_image := item.cover_image:
+            return cover_image.make_thumbnail(size, size, exact_fit=True)
+
+    def get_item_cover_image(self, item) -> t.Optional[ImageIO]:
+        return item.cover_image
+
     def get_source_actions(self) -> list[BookshelfAction]:
         """Get a list of actions supported by this source."""
         return self.source_actions
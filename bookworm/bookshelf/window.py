@@ -3,10 +3,12 @@
 import operator
 import os
 from enum import IntEnum, auto
-from functools import partial
+from functools import cached_property, partial
 
+import attr
 import wx
 import wx.lib.sized_controls as sc
+from lru import LRU
 
 from bookworm import speech
 from bookworm.bookshelf.provider import (
@@ -28,6 +30,11 @@ from bookworm.resources import sounds
 from bookworm.utils import fuzzy_search
 
 log = logger.getChild(__name__)
+THUMBNAIL_SIZE = 220
+# Number of decoded thumbnails kept in the image list of a results page
+THUMBNAIL_CACHE_SIZE = 120
+# Thumbnails are loaded for this many items on each side of the focused item
+THUMBNAIL_PREFETCH_RADIUS = 24
 
 
 class BookshelfNotebookPage(sc.SizedPanel):
@@ -111,11 +118,26 @@ class BookshelfResultsPage(BookshelfNotebookPage):
             self.onDocumentListEndLabelEdit,
             self.document_list,
         )
+        self.document_list.Bind(
+            wx.EVT_LIST_ITEM_FOCUSED, self.onDocumentListItemFocused, self.document_list
+        )
+        for scroll_event in (wx.EVT_SCROLLWIN, wx.EVT_MOUSEWHEEL):
+            self.document_list.Bind(scroll_event, self.onDocumentListScroll)
         self.Bind(wx.EVT_CONTEXT_MENU, self.onContextMenu, self.document_list)
         self.Bind(wx.EVT_TEXT, self.onQuickFilterTextChanged, self.quickFilterTextCtrl)
         self._all_items = None
         self.items = None
         self.__source_navigation_stack = []
+        # The source of the items being shown, which differs from `self.source`
+        # when navigating into a folder
+        self._items_source = self.source
+        # Incremented whenever a new source is loaded, or the items are rendered again
+        self._loading_generation = 0
+        self._rendering_generation = 0
+        # Maps the index of an item in the list to the index of its thumbnail in the image list
+        self._thumbnail_slots = LRU(THUMBNAIL_CACHE_SIZE)
+        self._pending_thumbnails = set()
+        self.image_list = None
 
     def set_focused_item(self, idx):
         self.document_list.SetFocus()
@@ -163,27 +185,18 @@ class BookshelfResultsPage(BookshelfNotebookPage):
             self.set_focused_item(0)
             sounds.navigation.play()
 
-    def create_image_list_from_items(self, items):
-        icon_size = (220, 220)
-        image_list = wx.ImageList(*icon_size, mask=False)
-        generic_file_icon = (
+    @cached_property
+    def generic_file_icon(self):
+        return (
             ImageIO.from_filename(images_path("generic_document.png"))
-            .make_thumbnail(*icon_size, exact_fit=True)
+            .make_thumbnail(THUMBNAIL_SIZE, THUMBNAIL_SIZE, exact_fit=True)
             .to_wx_bitmap()
         )
-        for idx, item in enumerate(items):
-            if cover_image := item.cover_image:
-                item_icon = cover_image.make_thumbnail(
-                    *icon_size, exact_fit=True
-                ).to_wx_bitmap()
-            else:
-                item_icon = generic_file_icon
-            wx.CallAfter(image_list.Add, item_icon)
-        return image_list
 
     def get_source_items(self, source):
-        items = tuple(source.iter_items())
-        return items, self.create_image_list_from_items(items)
+        """Retrieve the first page of items. The rest are retrieved after it is shown."""
+        page = source.get_item_page()
+        return source, page.items, page.next_page_key
 
     def _get_items_callback(self, future):
         try:
@@ -198,22 +211,121 @@ class BookshelfResultsPage(BookshelfNotebookPage):
                 style=wx.ICON_ERROR,
             )
         else:
-            items, image_list = result
-            self._all_items = items
-            self.render_items(items, image_list)
+            source, items, next_page_key = result
+            self._loading_generation += 1
+            self._items_source = source
+            self._all_items = list(items)
+            self.render_items(items)
+            if next_page_key is not None:
+                threaded_worker.submit(
+                    self._retrieve_remaining_items,
+                    self._loading_generation,
+                    source,
+                    next_page_key,
+                )
+
+    def _retrieve_remaining_items(self, generation, source, next_page_key):
+        while (next_page_key is not None) and (generation == self._loading_generation):
+            page = source.get_item_page(after=next_page_key)
+            wx.CallAfter(self._append_items, generation, page.items)
+            next_page_key = page.next_page_key
+
+    def _append_items(self, generation, items):
+        if generation != self._loading_generation:
+            return
+        self._all_items.extend(items)
+        if self.quickFilterTextCtrl.GetValue().strip():
+            # The list is filtered
+            return
+        start = len(self.items)
+        self.items.extend(items)
+        for idx, item in enumerate(items, start=start):
+            self.document_list.InsertItem(idx, item.title, 0)
 
-    def render_items(self, items, image_list, set_focus_to_first_item=True):
+    def render_items(self, items, set_focus_to_first_item=True):
         self.document_list.ClearAll()
         self.document_list.DeleteAllItems()
         self.__source_navigation_stack.clear()
-        self.items = items
-        self.document_list.AssignImageList(image_list, wx.IMAGE_LIST_NORMAL)
-        for idx, item in enumerate(items):
-            wx.CallAfter(self.document_list.InsertItem, idx, item.title, idx)
+        self.items = list(items)
+        self._reset_thumbnails()
+        for idx, item in enumerate(self.items):
+            wx.CallAfter(self.document_list.InsertItem, idx, item.title, 0)
         self.document_list.RefreshItems(0, self.document_list.GetItemCount())
         self.list_label.SetLabel(self.source.name)
         if set_focus_to_first_item:
             self.set_focused_item(0)
+        wx.CallAfter(self.request_thumbnails, max(self.selected_item_index, 0))
+
+    def _reset_thumbnails(self):
+        """Start with an image list holding only the generic document icon."""
+        self._rendering_generation += 1
+        self._thumbnail_slots = LRU(THUMBNAIL_CACHE_SIZE)
+        self._pending_thumbnails = set()
+        self.image_list = wx.ImageList(THUMBNAIL_SIZE, THUMBNAIL_SIZE, mask=False)
+        self.image_list.Add(self.generic_file_icon)
+        self.document_list.AssignImageList(self.image_list, wx.IMAGE_LIST_NORMAL)
+
+    def request_thumbnails(self, anchor_index):
+        """Load the thumbnails of the items around the given item, nearest first."""
+        if not self.items:
+            return
+        start = max(anchor_index - THUMBNAIL_PREFETCH_RADIUS, 0)
+        stop = min(anchor_index + THUMBNAIL_PREFETCH_RADIUS + 1, len(self.items))
+        to_load = []
+        for idx in sorted(range(start, stop), key=lambda i: abs(i - anchor_index)):
+            if idx in self._thumbnail_slots:
+                # Mark as recently used
+                self._thumbnail_slots.get(idx)
+            elif idx not in self._pending_thumbnails:
+                to_load.append((idx, self.items[idx]))
+        if to_load:
+            self._pending_thumbnails.update(idx for (idx, _item) in to_load)
+            threaded_worker.submit(
+                self._load_thumbnails, self._rendering_generation, self._items_source, to_load
+            )
+
+    def _load_thumbnails(self, generation, source, items):
+        for idx, item in items:
+            if generation != self._rendering_generation:
+                return
+            bitmap = None
+            try:
+                if thumbnail := source.get_item_thumbnail(item, THUMBNAIL_SIZE):
+                    bitmap = thumbnail.to_wx_bitmap()
+            except Exception:
+                log.exception(f"Failed to load the thumbnail of item: {item}", exc_info=True)
+            wx.CallAfter(self._set_item_thumbnail, generation, idx, bitmap)
+
+    def _set_item_thumbnail(self, generation, idx, bitmap):
+        if generation != self._rendering_generation:
+            return
+        self._pending_thumbnails.discard(idx)
+        if (bitmap is None) or (idx in self._thumbnail_slots):
+            return
+        if len(self._thumbnail_slots) >= THUMBNAIL_CACHE_SIZE:
+            # Reuse the slot of the least recently used thumbnail
+            evicted_idx, slot = self._thumbnail_slots.peek_last_item()
+            del self._thumbnail_slots[evicted_idx]
+            self.document_list.SetItemImage(evicted_idx, 0)
+            self.image_list.Replace(slot, bitmap)
+        else:
+            slot = self.image_list.Add(bitmap)
+        self._thumbnail_slots[idx] = slot
+        self.document_list.SetItemImage(idx, slot)
+
+    def onDocumentListItemFocused(self, event):
+        event.Skip()
+        self.request_thumbnails(event.GetIndex())
+
+    def onDocumentListScroll(self, event):
+        event.Skip()
+        wx.CallAfter(self._request_visible_thumbnails)
+
+    def _request_visible_thumbnails(self):
+        width, height = self.document_list.GetClientSize()
+        idx, _flags = self.document_list.HitTest(wx.Point(width // 2, height // 2))
+        if idx != wx.NOT_FOUND:
+            self.request_thumbnails(idx)
 
     @property
     def selected_item(self):
@@ -267,6 +379,10 @@ class BookshelfResultsPage(BookshelfNotebookPage):
         speech.announce("Openning document...")
 
     def _do_show_document_info(self, document_info):
+        document_info = attr.evolve(
+            document_info,
+            cover_image=self._items_source.get_item_cover_image(document_info),
+        )
         with DocumentInfoDialog(
             parent=self,
             document_info=document_info,
@@ -290,11 +406,7 @@ class BookshelfResultsPage(BookshelfNotebookPage):
         )
         self.document_list.DeleteAllItems()
         self.items = matching_items
-        self.render_items(
-            matching_items,
-            self.create_image_list_from_items(matching_items),
-            set_focus_to_first_item=False,
-        )
+        self.render_items(matching_items, set_focus_to_first_item=False)
         if not matching_items:
             # Translators: spoken message when no matching documents were found when filtering the document list
             speech.announce(_("No matching documents"))
@@ -16,6 +16,7 @@ from bookworm.commandline_handler import (
 )
 from bookworm.config import setup_config
 from bookworm.database import init_database
+from bookworm.database.content_hash_backfill import start_content_hash_backfill
 from bookworm.document.uri import DocumentUri
 from bookworm.gui.book_viewer import BookViewerWindow
 from bookworm.gui.settings import show_file_association_dialog
@@ -209,6 +210,7 @@ def init_app_and_run_main_loop():
     app.SetTopWindow(mainFrame)
     mainFrame.Show(True)
     app_window_shown.send(mainFrame)
+    start_content_hash_backfill()
     app.MainLoop()
     log.info("Shutting down the application.")
     app_shuttingdown.send(app)
@@ -7,7 +7,6 @@ import multiprocessing as mp
 import os
 import sys
 import threading
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from contextlib import suppress
 from enum import IntEnum
 from functools import partial, wraps
@@ -17,24 +16,39 @@ import attr
 
 import bookworm.typehints as t
 from bookworm.logger import logger
-from bookworm.signals import app_shuttingdown, app_starting
+from bookworm.signals import app_shuttingdown, app_starting, app_window_shown
+
+from .scheduler import ScheduledExecutor, TaskClassMetrics, TaskPriority, TaskScheduler
 
 log = logger.getChild(__name__)
 
 
-# An executor for background tasks (designated for i/o bound tasks)
-threaded_worker = ThreadPoolExecutor(thread_name_prefix="bookworm_threaded_worker")
+# Runs all the background tasks by priority, see `bookworm.concurrency.scheduler`
+task_scheduler = TaskScheduler()
+
+# An executor for interactive background tasks (designated for i/o bound tasks)
+threaded_worker = task_scheduler.thread_executor(TaskPriority.INTERACTIVE)
 
-# An executor for background tasks (designated for CPU bound tasks)
-process_worker = ProcessPoolExecutor()
+# An executor for interactive background tasks (designated for CPU bound tasks)
+process_worker = task_scheduler.process_executor(TaskPriority.INTERACTIVE)
+
+# Like `process_worker`, but each process runs a single task, for code that leaks memory
+recycled_process_worker = task_scheduler.recycled_process_executor(TaskPriority.INTERACTIVE)
 
 
 @app_shuttingdown.connect
 def _shutdown_concurrent_workers(sender):
     """Cancel any pending background tasks."""
     log.debug("Canceling  background tasks.")
-    threaded_worker.shutdown(wait=False, cancel_futures=True)
-    process_worker.shutdown(wait=False)
+    task_scheduler.log_metrics()
+    task_scheduler.shutdown(wait=False)
+    document_worker_pool.shutdown()
+
+
+@app_window_shown.connect
+def _prestart_document_worker(sender):
+    """Start a document worker ahead of the first search or export."""
+    call_threaded(document_worker_pool.prestart)()
 
 
 def call_threaded(func: t.Callable[..., None]) -> t.Callable[..., "Future"]:
@@ -200,3 +214,10 @@ class QueueProcess(mp.Process):
         """Asynchronously generate values and invoke the given callback with each generated value."""
         for value in self:
             callback(value)
+
+
+# Imported here, because the worker pool uses the channel messages defined above
+from .worker_pool import PooledTask, WorkerPool  # noqa: E402
+
+# Persistent processes for operations on documents, which keep them open between tasks
+document_worker_pool = WorkerPool(preload_modules=("bookworm.document",), name="document-worker")
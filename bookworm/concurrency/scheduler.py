@@ -0,0 +1,500 @@
+# coding: utf-8
+
+"""
+A central scheduler for the background tasks of the application.
+Tasks are submitted with a priority class, and run by a thread or a process lane,
+each backed by a single executor sized after the number of cores. A lane only hands
+tasks to its executor when it has a free worker, so that queued tasks are started
+in priority order. Background tasks never take more than all but one of the workers
+of a lane, so that there is always room for an interactive task, and each background
+class is limited to its share of those workers.
+
+Tasks submitted to the process lane may share an initializer, which runs once in
+each worker for all the tasks of the same executor, like the initializer of a
+`ProcessPoolExecutor`. The state it sets is released once the worker is idle.
+"""
+
+from __future__ import annotations
+
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import (
+    BrokenExecutor,
+    Executor,
+    Future,
+    InvalidStateError,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from contextlib import suppress
+from enum import IntEnum
+from functools import partial
+
+import attr
+
+import bookworm.typehints as t
+from bookworm.logger import logger
+
+log = logger.getChild(__name__)
+# Windows does not support waiting on more than 61 processes
+MAX_PROCESS_WORKERS = 61
+# How long a process worker keeps the state set by an initializer once idle, in seconds
+INITIALIZED_STATE_IDLE_TIMEOUT = 5.0
+# The initializer which last ran in this process worker, see `_run_initialized`
+_worker_initializer_state = {}
+_worker_initializer_lock = threading.Lock()
+
+
+class TaskPriority(IntEnum):
+    """Priority classes of tasks, from the most to the least urgent."""
+
+    # The user is waiting for the result
+    INTERACTIVE = 0
+    # Work done ahead of the user, such as loading the following pages
+    PREFETCH = 1
+    # Indexing documents, for search or for the bookshelf
+    INDEXING = 2
+    # Recognizing the text of many pages
+    BULK_OCR = 3
+
+
+BACKGROUND_PRIORITIES = frozenset(TaskPriority) - {TaskPriority.INTERACTIVE}
+
+
+@attr.s(auto_attribs=True, slots=True)
+class TaskClassMetrics:
+    """The number of tasks of a priority class, and how long they waited and ran, in seconds."""
+
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    running: int = 0
+    total_wait_time: float = 0.0
+    max_wait_time: float = 0.0
+    total_run_time: float = 0.0
+
+    @property
+    def mean_wait_time(self) -> float:
+        num_started = self.completed + self.failed + self.running
+        return (self.total_wait_time / num_started) if num_started else 0.0
+
+    @property
+    def mean_run_time(self) -> float:
+        num_finished = self.completed + self.failed
+        return (self.total_run_time / num_finished) if num_finished else 0.0
+
+
+@attr.s(auto_attribs=True, slots=True, eq=False)
+class _WorkItem:
+    future: Future
+    func: t.Callable
+    args: tuple
+    kwargs: dict
+    priority: TaskPriority
+    group: t.Hashable
+    submitted_at: float = attr.ib(factory=time.perf_counter)
+    started_at: float = None
+
+
+class TaskLane:
+    """
+    Runs tasks using an executor created by `executor_factory`, which is given the
+    maximum number of workers. `class_limits` maps priority classes to the maximum
+    number of their tasks which may run at the same time. Whatever the class limits,
+    background tasks run in at most `max_workers - 1` workers, so that a lane with a
+    single worker only runs interactive tasks.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        executor_factory: t.Callable[[int], Executor],
+        max_workers: int,
+        class_limits: dict[TaskPriority, int],
+    ):
+        self.name = name
+        self.executor_factory = executor_factory
+        self.max_workers = max_workers
+        self.max_background_workers = max(0, max_workers - 1)
+        self.class_limits = {
+            priority: min(class_limits.get(priority, max_workers), max_workers)
+            for priority in TaskPriority
+        }
+        for priority in BACKGROUND_PRIORITIES:
+            self.class_limits[priority] = min(
+                self.class_limits[priority], self.max_background_workers
+            )
+        self._lock = threading.RLock()
+        self._executor = None
+        self._queues = {priority: deque() for priority in TaskPriority}
+        self._running = {priority: 0 for priority in TaskPriority}
+        self._metrics = {priority: TaskClassMetrics() for priority in TaskPriority}
+        self._is_shutdown = False
+
+    def submit(self, priority, group, func, args, kwargs) -> Future:
+        item = _WorkItem(Future(), func, args, kwargs, TaskPriority(priority), group)
+        with self._lock:
+            if self._is_shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            queue = self._queues[item.priority]
+            queue.append(item)
+            metrics = self._metrics[item.priority]
+            metrics.submitted += 1
+            metrics.max_queue_depth = max(metrics.max_queue_depth, len(queue))
+        self._dispatch()
+        return item.future
+
+    def cancel_group(self, group: t.Hashable) -> int:
+        """Cancel the queued tasks of the given group. Return the number of cancelled tasks."""
+        num_cancelled = 0
+        with self._lock:
+            for priority, queue in self._queues.items():
+                in_group = [item for item in queue if item.group == group]
+                for item in in_group:
+                    queue.remove(item)
+                    if item.future.cancel():
+                        self._metrics[priority].cancelled += 1
+                        num_cancelled += 1
+        return num_cancelled
+
+    def get_metrics(self) -> dict[TaskPriority, TaskClassMetrics]:
+        with self._lock:
+            return {
+                priority: attr.evolve(
+                    metrics,
+                    queue_depth=len(self._queues[priority]),
+                    running=self._running[priority],
+                )
+                for (priority, metrics) in self._metrics.items()
+            }
+
+    def shutdown(self, wait=False, cancel_futures=True):
+        with self._lock:
+            self._is_shutdown = True
+            if cancel_futures:
+                for priority, queue in self._queues.items():
+                    while queue:
+                        if queue.popleft().future.cancel():
+                            self._metrics[priority].cancelled += 1
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def _dispatch(self):
+        items_to_start = []
+        with self._lock:
+            num_running = sum(self._running.values())
+            while num_running < self.max_workers:
+                if (item := self._pop_next_item()) is None:
+                    break
+                if not item.future.set_running_or_notify_cancel():
+                    self._metrics[item.priority].cancelled += 1
+                    continue
+                self._running[item.priority] += 1
+                num_running += 1
+                items_to_start.append(item)
+        for item in items_to_start:
+            self._start(item)
+
+    def _pop_next_item(self) -> _WorkItem | None:
+        num_background_running = sum(
+            self._running[priority] for priority in BACKGROUND_PRIORITIES
+        )
+        for priority, queue in self._queues.items():
+            if not queue or (self._running[priority] >= self.class_limits[priority]):
+                continue
+            if (priority in BACKGROUND_PRIORITIES) and (
+                num_background_running >= self.max_background_workers
+            ):
+                continue
+            return queue.popleft()
+
+    def _start(self, item):
+        item.started_at = time.perf_counter()
+        wait_time = item.started_at - item.submitted_at
+        with self._lock:
+            metrics = self._metrics[item.priority]
+            metrics.total_wait_time += wait_time
+            metrics.max_wait_time = max(metrics.max_wait_time, wait_time)
+        executor = None
+        try:
+            executor = self._get_executor()
+            executor_future = executor.submit(item.func, *item.args, **item.kwargs)
+        except BaseException as e:
+            if isinstance(e, BrokenExecutor):
+                self._discard_executor(executor)
+            self._finish(item, exception=e)
+            return
+        executor_future.add_done_callback(
+            partial(self._on_executor_future_done, item, executor)
+        )
+
+    def _on_executor_future_done(self, item, executor, executor_future):
+        if executor_future.cancelled():
+            # The executor was shut down
+            self._finish(item, exception=RuntimeError("The task was cancelled by its executor."))
+        elif (exc := executor_future.exception()) is not None:
+            if isinstance(exc, BrokenExecutor):
+                self._discard_executor(executor)
+            self._finish(item, exception=exc)
+        else:
+            self._finish(item, result=executor_future.result())
+
+    def _finish(self, item, result=None, exception=None):
+        with self._lock:
+            self._running[item.priority] -= 1
+            metrics = self._metrics[item.priority]
+            metrics.total_run_time += time.perf_counter() - item.started_at
+            if exception is None:
+                metrics.completed += 1
+            else:
+                metrics.failed += 1
+        with suppress(InvalidStateError):
+            if exception is None:
+                item.future.set_result(result)
+            else:
+                item.future.set_exception(exception)
+        self._dispatch()
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._is_shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            if self._executor is None:
+                self._executor = self.executor_factory(self.max_workers)
+            return self._executor
+
+    def _discard_executor(self, executor):
+        """Replace a broken executor, such as a process pool with a crashed worker."""
+        with self._lock:
+            if (executor is None) or (executor is not self._executor):
+                return
+            self._executor = None
+        log.warning(f"The executor of the {self.name} lane is broken, replacing it.")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ScheduledExecutor(Executor):
+    """
+    Submits tasks to a lane of the scheduler, with the given priority and cancellation group.
+    If given, `initializer` is called with `initargs` in a process worker before the first
+    task of this executor it runs, and `finalizer` once the worker has been idle for
+    `INITIALIZED_STATE_IDLE_TIMEOUT`, or before it runs the tasks of another executor.
+    """
+
+    def __init__(
+        self,
+        lane: TaskLane,
+        priority: TaskPriority,
+        group: t.Hashable = None,
+        initializer: t.Callable = None,
+        initargs: tuple = (),
+        finalizer: t.Callable = None,
+    ):
+        self.lane = lane
+        self.priority = priority
+        self.group = group
+        self.initializer = initializer
+        self.finalizer = finalizer
+        if initializer is not None:
+            self._initializer_key = uuid.uuid4().hex
+            # Pickled once, and only unpickled by the workers which were not initialized yet
+            self._pickled_initargs = pickle.dumps(initargs)
+
+    def __repr__(self):
+        return f"<ScheduledExecutor: lane={self.lane.name}, priority={self.priority.name}>"
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        if self.initializer is None:
+            return self.lane.submit(self.priority, self.group, fn, args, kwargs)
+        return self.lane.submit(
+            self.priority,
+            self.group,
+            _run_initialized,
+            (
+                self._initializer_key,
+                self.initializer,
+                self._pickled_initargs,
+                self.finalizer,
+                fn,
+                args,
+                kwargs,
+            ),
+            {},
+        )
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        """The lane is shared, and is only shut down by the scheduler."""
+        if cancel_futures and (self.group is not None):
+            self.lane.cancel_group(self.group)
+
+
+class TaskScheduler:
+    """
+    Runs the background tasks of the application by priority, in a thread lane
+    for i/o bound tasks, and a process lane for CPU bound tasks. Tasks which leak
+    memory run in the recycled process lane, whose processes only run one task.
+    """
+
+    def __init__(self, num_cores: int = None):
+        num_cores = num_cores or os.cpu_count() or 1
+        num_threads = min(32, num_cores + 4)
+        self.threads = TaskLane(
+            "thread",
+            partial(_create_thread_pool, thread_name_prefix="bookworm_threaded_worker"),
+            max_workers=num_threads,
+            # OCR engines mostly wait for native code, so they get the larger share
+            class_limits=_get_background_class_limits(
+                num_threads - 1,
+                {TaskPriority.PREFETCH: 1, TaskPriority.INDEXING: 1, TaskPriority.BULK_OCR: 2},
+            ),
+        )
+        # At least two processes, otherwise background tasks would never run
+        # in a lane which keeps a worker free for interactive tasks
+        num_processes = max(2, min(num_cores, MAX_PROCESS_WORKERS))
+        process_class_limits = _get_background_class_limits(
+            num_processes - 1,
+            {TaskPriority.PREFETCH: 1, TaskPriority.INDEXING: 2, TaskPriority.BULK_OCR: 1},
+        )
+        self.processes = TaskLane(
+            "process",
+            _create_process_pool,
+            max_workers=num_processes,
+            class_limits=process_class_limits,
+        )
+        self.recycled_processes = TaskLane(
+            "recycled process",
+            partial(_create_process_pool, max_tasks_per_child=1),
+            max_workers=num_processes,
+            class_limits=process_class_limits,
+        )
+
+    @property
+    def lanes(self) -> tuple[TaskLane, ...]:
+        return (self.threads, self.processes, self.recycled_processes)
+
+    def thread_executor(
+        self, priority: TaskPriority = TaskPriority.INTERACTIVE, group: t.Hashable = None
+    ) -> ScheduledExecutor:
+        return ScheduledExecutor(self.threads, priority, group)
+
+    def process_executor(
+        self,
+        priority: TaskPriority = TaskPriority.INTERACTIVE,
+        group: t.Hashable = None,
+        initializer: t.Callable = None,
+        initargs: tuple = (),
+        finalizer: t.Callable = None,
+    ) -> ScheduledExecutor:
+        return ScheduledExecutor(
+            self.processes,
+            priority,
+            group,
+            initializer=initializer,
+            initargs=initargs,
+            finalizer=finalizer,
+        )
+
+    def recycled_process_executor(
+        self, priority: TaskPriority = TaskPriority.INTERACTIVE, group: t.Hashable = None
+    ) -> ScheduledExecutor:
+        """Each process of this executor exits after running a single task."""
+        return ScheduledExecutor(self.recycled_processes, priority, group)
+
+    def cancel_group(self, group: t.Hashable) -> int:
+        """
+        Cancel the queued tasks of the given group, in all the lanes.
+        Tasks which already started are left to run.
+        """
+        return sum(lane.cancel_group(group) for lane in self.lanes)
+
+    def get_metrics(self) -> dict[str, dict[TaskPriority, TaskClassMetrics]]:
+        return {lane.name: lane.get_metrics() for lane in self.lanes}
+
+    def log_metrics(self):
+        for lane_name, lane_metrics in self.get_metrics().items():
+            for priority, metrics in lane_metrics.items():
+                if not metrics.submitted:
+                    continue
+                log.debug(
+                    f"{lane_name} lane, {priority.name} tasks: {metrics.submitted} submitted, "
+                    f"{metrics.completed} completed, {metrics.failed} failed, "
+                    f"{metrics.cancelled} cancelled, "
+                    f"max queue depth {metrics.max_queue_depth}, "
+                    f"mean wait {metrics.mean_wait_time * 1000:.1f}ms, "
+                    f"max wait {metrics.max_wait_time * 1000:.1f}ms, "
+                    f"mean run {metrics.mean_run_time * 1000:.1f}ms"
+                )
+
+    def shutdown(self, wait=False):
+        for lane in self.lanes:
+            lane.shutdown(wait=wait, cancel_futures=True)
+
+
+def _get_background_class_limits(
+    num_background_workers: int, weights: dict[TaskPriority, int]
+) -> dict[TaskPriority, int]:
+    """
+    Split the background workers of a lane between the background classes, in
+    proportion to their weights. Each class gets at least one worker, so the limits
+    only add up to more than the background workers when there are fewer of them
+    than classes, and then the lane still runs at most `num_background_workers` tasks.
+    """
+    total_weight = sum(weights.values())
+    return {
+        priority: max(1, num_background_workers * weight // total_weight)
+        for (priority, weight) in weights.items()
+    }
+
+
+def _run_initialized(key, initializer, pickled_initargs, finalizer, func, args, kwargs):
+    """This function runs in a process worker, which runs a single task at a time."""
+    with _worker_initializer_lock:
+        if (release_timer := _worker_initializer_state.pop("release_timer", None)) is not None:
+            release_timer.cancel()
+        if _worker_initializer_state.get("key") != key:
+            _release_initialized_state()
+            initializer(*pickle.loads(pickled_initargs))
+            _worker_initializer_state.update(key=key, finalizer=finalizer)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        with _worker_initializer_lock:
+            release_timer = threading.Timer(INITIALIZED_STATE_IDLE_TIMEOUT, _release_idle_state)
+            release_timer.daemon = True
+            _worker_initializer_state["release_timer"] = release_timer
+            release_timer.start()
+
+
+def _release_idle_state():
+    with _worker_initializer_lock:
+        # Otherwise, a task started after this timer fired
+        if _worker_initializer_state.get("release_timer") is threading.current_thread():
+            del _worker_initializer_state["release_timer"]
+            _release_initialized_state()
+
+
+def _release_initialized_state():
+    """Called with `_worker_initializer_lock` held."""
+    finalizer = _worker_initializer_state.pop("finalizer", None)
+    _worker_initializer_state.pop("key", None)
+    if finalizer is not None:
+        try:
+            finalizer()
+        except Exception:
+            log.exception("Failed to release the state of a process worker", exc_info=True)
+
+
+def _create_thread_pool(max_workers, thread_name_prefix):
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+
+
+def _create_process_pool(max_workers, max_tasks_per_child=None):
+    return ProcessPoolExecutor(max_workers=max_workers, max_tasks_per_child=max_tasks_per_child)
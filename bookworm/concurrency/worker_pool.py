@@ -0,0 +1,445 @@
+# coding: utf-8
+
+"""
+A pool of persistent worker processes which run generator functions, like `QueueProcess`.
+Each task is given a handle, usually a document, which is opened by unpickling it in
+the worker. Workers keep the handles they opened in an LRU cache, and tasks using
+the same handle are routed to the worker which already has it open, so that
+repeated operations on the same book do not import and open everything again.
+Workers are replaced after running a number of tasks, or when they use too much memory.
+"""
+
+from __future__ import annotations
+
+import importlib
+import inspect
+import multiprocessing as mp
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import suppress
+from functools import partial
+from itertools import count
+from traceback import format_exception
+
+import bookworm.typehints as t
+from bookworm.concurrency import QPResult, call_threaded
+from bookworm.logger import logger
+
+log = logger.getChild(__name__)
+# Seconds to wait for a retired worker to exit before terminating it
+WORKER_EXIT_TIMEOUT = 5
+
+
+def get_memory_usage() -> int:
+    """Return the resident set size of the current process in bytes, or 0 if unknown."""
+    if sys.platform == "win32":
+        return _get_windows_memory_usage()
+    with suppress(OSError, ValueError, IndexError):
+        with open("/proc/self/statm", "rb") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # The peak, rather than the current, resident set size
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def _get_windows_memory_usage() -> int:
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    kernel32 = ctypes.windll.kernel32
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    if not kernel32.K32GetProcessMemoryInfo(
+        kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb
+    ):
+        return 0
+    return counters.WorkingSetSize
+
+
+def _close_handle(handle):
+    with suppress(Exception):
+        handle.close()
+
+
+def _run_worker(conn, cancel_event, preload_modules, max_handles):
+    """The main loop of a worker process."""
+    for module in preload_modules:
+        importlib.import_module(module)
+    handles = OrderedDict()
+    try:
+        while (task := conn.recv()) is not None:
+            key, handle_payload, target, args = task
+            if key is not None and key in handles:
+                handles.move_to_end(key)
+                handle = handles[key]
+            else:
+                handle = None
+            try:
+                if handle is None:
+                    handle = pickle.loads(handle_payload)
+                    if key is not None:
+                        handles[key] = handle
+                        while len(handles) > max_handles:
+                            _close_handle(handles.popitem(last=False)[1])
+                producer = target(handle, *args)
+                for item in producer:
+                    conn.send((QPResult.OK, item))
+                    if cancel_event.is_set():
+                        producer.close()
+                        conn.send((QPResult.CANCELLED, get_memory_usage()))
+                        break
+                else:
+                    conn.send((QPResult.COMPLETED, get_memory_usage()))
+            except Exception as e:
+                # The handle may be left in an unusable state
+                if (key is not None) and (handles.pop(key, None) is not None):
+                    _close_handle(handle)
+                tb_text = "".join(format_exception(*sys.exc_info()))
+                try:
+                    conn.send((QPResult.FAILED, (e, tb_text, get_memory_usage())))
+                except Exception:
+                    # The exception could not be pickled
+                    failure = RuntimeError(f"{type(e).__name__}: {e}")
+                    conn.send((QPResult.FAILED, (failure, tb_text, get_memory_usage())))
+            finally:
+                if key is None:
+                    _close_handle(handle)
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass
+    finally:
+        for handle in handles.values():
+            _close_handle(handle)
+        conn.close()
+
+
+class _PoolWorker:
+    """The pool's view of a worker process, and the handles it has open."""
+
+    def __init__(self, process, conn, cancel_event):
+        self.process = process
+        self.conn = conn
+        self.cancel_event = cancel_event
+        self.handle_keys = OrderedDict()
+        self.num_tasks = 0
+        self.memory_usage = 0
+        self.is_broken = False
+
+    def run_task(self, key, handle, target, args):
+        self.conn.send((key, pickle.dumps(handle), target, args))
+        self.num_tasks += 1
+        # Mirror the handle cache of the worker
+        if key is not None:
+            self.handle_keys[key] = None
+            self.handle_keys.move_to_end(key)
+
+    def forget_handle(self, key):
+        self.handle_keys.pop(key, None)
+
+    def trim_handle_keys(self, max_handles):
+        while len(self.handle_keys) > max_handles:
+            self.handle_keys.popitem(last=False)
+
+
+class PooledTask:
+    """
+    A task running in a `WorkerPool`. Like `QueueProcess`, the values generated by
+    the task are received by iterating it, which is blocking, or asynchronously
+    using the map method. Stopping the iteration early cancels the task.
+    """
+
+    def __init__(self, pool, target, handle, args, key, name, cancellable):
+        self.pool = pool
+        self.target = target
+        self.handle = handle
+        self.args = args
+        self.key = key
+        self.name = name
+        self.cancellable = cancellable
+        self._lock = threading.Lock()
+        self._worker = None
+        self._is_cancelled = False
+        self._is_started = False
+        self._done_callback = None
+
+    def __repr__(self):
+        return f"<PooledTask: name={self.name}, key={self.key}>"
+
+    def cancel(self):
+        if not self.cancellable:
+            raise TypeError("Uncancellable operation")
+        with self._lock:
+            self._is_cancelled = True
+            if self._worker is not None:
+                self._worker.cancel_event.set()
+
+    def is_cancelled(self):
+        return self._is_cancelled
+
+    def add_done_callback(self, callback, *args, **kwargs):
+        self._done_callback = partial(callback, *args, **kwargs)
+
+    def __iter__(self) -> t.Iterator[t.Any]:
+        return self.iter_queue()
+
+    def iter_queue(self) -> t.Iterator[t.Any]:
+        if self._is_started:
+            raise RuntimeError("Can only iterate a task once.")
+        self._is_started = True
+        if self.is_cancelled():
+            return
+        worker = self.pool._acquire_worker(self.key)
+        worker.cancel_event.clear()
+        with self._lock:
+            self._worker = worker
+            if self._is_cancelled:
+                worker.cancel_event.set()
+        is_sent = is_finished = False
+        try:
+            self._communicate(worker.run_task, self.key, self.handle, self.target, self.args)
+            is_sent = True
+            while True:
+                flag, result = self._communicate(worker.conn.recv)
+                if flag is QPResult.OK:
+                    yield result
+                elif flag is QPResult.DEBUG:
+                    log.debug(f"REMOTE PROCESS: {result}")
+                elif flag is QPResult.COMPLETED:
+                    is_finished = True
+                    worker.memory_usage = result
+                    if self._done_callback is not None:
+                        self._done_callback()
+                    break
+                elif flag is QPResult.FAILED:
+                    is_finished = True
+                    exc_value, tb_text, worker.memory_usage = result
+                    worker.forget_handle(self.key)
+                    log.exception(f"Remote exception from {self}.\nTraceback:\n{tb_text}")
+                    raise exc_value
+                elif flag is QPResult.CANCELLED:
+                    is_finished = True
+                    worker.memory_usage = result
+                    break
+        finally:
+            with self._lock:
+                self._worker = None
+            self.pool._release_worker(worker, is_finished=(is_finished or not is_sent))
+
+    def _communicate(self, func, *args):
+        try:
+            return func(*args)
+        except (EOFError, OSError) as e:
+            self._worker.is_broken = True
+            raise BrokenProcessPool(
+                f"The worker process running {self} terminated abruptly."
+            ) from e
+
+    @call_threaded
+    def map(self, callback):
+        """Asynchronously generate values and invoke the given callback with each generated value."""
+        for value in self:
+            callback(value)
+
+
+class WorkerPool:
+    """
+    Runs generator functions in persistent worker processes, like `QueueProcess`.
+    The modules in `preload_modules` are imported by each worker when it starts.
+    A worker is replaced after running `max_tasks_per_worker` tasks, or when its
+    resident memory exceeds `max_worker_memory` bytes.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_handles_per_worker: int = 4,
+        max_tasks_per_worker: int = 50,
+        max_worker_memory: int = 512 * 1024 * 1024,
+        preload_modules: t.Iterable[str] = (),
+        name: str = "pool-worker",
+    ):
+        self.max_workers = max_workers
+        self.max_handles_per_worker = max_handles_per_worker
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.max_worker_memory = max_worker_memory
+        self.preload_modules = tuple(preload_modules)
+        self.name = name
+        self._condition = threading.Condition()
+        self._workers = []
+        self._idle_workers = []
+        self._worker_counter = count(1)
+        self._is_shutdown = False
+
+    def submit(
+        self,
+        target: t.Callable[..., t.Iterator[t.Any]],
+        handle: t.Any,
+        args: tuple = (),
+        *,
+        key: t.Hashable = None,
+        name: str = None,
+        cancellable: bool = True,
+    ) -> PooledTask:
+        """
+        Return a task which calls `target(handle, *args)` in a worker, when iterated.
+        The handle is pickled to be sent to the worker. If `key` is given, the worker
+        keeps the unpickled handle open, and reuses it for later tasks with the same key.
+        Otherwise, the handle is closed when the task is done.
+        """
+        assert inspect.isgeneratorfunction(
+            target
+        ), "WorkerPool target should be a generator function."
+        return PooledTask(self, target, handle, args, key, name, cancellable)
+
+    def prestart(self, num_workers: int = 1):
+        """Start workers ahead of the first tasks, so that they are already preloaded."""
+        with self._condition:
+            while not self._is_shutdown and len(self._workers) < min(
+                num_workers, self.max_workers
+            ):
+                self._idle_workers.append(self._start_worker())
+
+    def shutdown(self):
+        """Terminate all the workers. Tasks which are still running fail."""
+        with self._condition:
+            self._is_shutdown = True
+            workers = self._workers.copy()
+            self._workers.clear()
+            self._idle_workers.clear()
+            self._condition.notify_all()
+        for worker in workers:
+            with suppress(Exception):
+                worker.process.terminate()
+                worker.conn.close()
+
+    def _start_worker(self) -> _PoolWorker:
+        conn, worker_conn = mp.Pipe(duplex=True)
+        cancel_event = mp.Event()
+        process = mp.Process(
+            target=_run_worker,
+            args=(
+                worker_conn,
+                cancel_event,
+                self.preload_modules,
+                self.max_handles_per_worker,
+            ),
+            name=f"{self.name}-{next(self._worker_counter)}",
+            daemon=True,
+        )
+        process.start()
+        worker_conn.close()
+        worker = _PoolWorker(process, conn, cancel_event)
+        self._workers.append(worker)
+        log.debug(f"Started worker process {process.name} (PID: {process.pid}).")
+        return worker
+
+    def _acquire_worker(self, key) -> _PoolWorker:
+        """
+        Prefer an idle worker which has the handle open, then any idle worker,
+        and only then start a new one. Wait if all workers are busy.
+        """
+        with self._condition:
+            while True:
+                if self._is_shutdown:
+                    raise RuntimeError("cannot schedule new tasks after shutdown")
+                worker = None
+                if key is not None:
+                    worker = next(
+                        (w for w in self._idle_workers if key in w.handle_keys), None
+                    )
+                if worker is None and self._idle_workers:
+                    worker = min(self._idle_workers, key=lambda w: len(w.handle_keys))
+                if worker is not None:
+                    self._idle_workers.remove(worker)
+                    return worker
+                if len(self._workers) < self.max_workers:
+                    return self._start_worker()
+                self._condition.wait()
+
+    def _release_worker(self, worker, is_finished):
+        if not is_finished and not worker.is_broken:
+            # The task is still running, wait until the worker notices the cancellation
+            worker.cancel_event.set()
+            threading.Thread(
+                target=self._drain_and_release_worker,
+                args=(worker,),
+                name=f"{worker.process.name}-drain",
+                daemon=True,
+            ).start()
+            return
+        worker.trim_handle_keys(self.max_handles_per_worker)
+        with self._condition:
+            if self._is_shutdown or worker not in self._workers:
+                return
+            if worker.is_broken or self._should_recycle(worker):
+                self._workers.remove(worker)
+                self._retire_worker(worker)
+            else:
+                self._idle_workers.append(worker)
+            self._condition.notify()
+
+    def _drain_and_release_worker(self, worker):
+        try:
+            while True:
+                flag, result = worker.conn.recv()
+                if flag in (QPResult.COMPLETED, QPResult.CANCELLED):
+                    worker.memory_usage = result
+                    break
+                elif flag is QPResult.FAILED:
+                    worker.memory_usage = result[2]
+                    break
+        except (EOFError, OSError):
+            worker.is_broken = True
+        self._release_worker(worker, is_finished=True)
+
+    def _should_recycle(self, worker) -> bool:
+        if worker.num_tasks >= self.max_tasks_per_worker:
+            log.debug(f"Recycling {worker.process.name} after {worker.num_tasks} tasks.")
+            return True
+        if worker.memory_usage > self.max_worker_memory:
+            log.debug(
+                f"Recycling {worker.process.name}, which uses "
+                f"{worker.memory_usage // (1024 * 1024)}MiB of memory."
+            )
+            return True
+        return False
+
+    def _retire_worker(self, worker):
+        with suppress(OSError, ValueError):
+            worker.conn.send(None)
+        worker.conn.close()
+        threading.Thread(
+            target=self._join_worker_process,
+            args=(worker.process,),
+            name=f"{worker.process.name}-join",
+            daemon=True,
+        ).start()
+
+    @staticmethod
+    def _join_worker_process(process):
+        process.join(WORKER_EXIT_TIMEOUT)
+        if process.is_alive():
+            process.terminate()
+            process.join()
@@ -25,8 +25,13 @@ class ConfigProvider:
 
     def __init__(self):
         self.config_file = str(Path(config_path(f"{app.name}.ini")))
+        # Parse the text of the spec, rather than the shared stream, which
+        # would be left exhausted for the providers created after this one
         self.spec = ConfigObj(
-            config_spec, encoding="UTF8", list_values=False, _inspec=True
+            config_spec.getvalue().splitlines(),
+            encoding="UTF8",
+            list_values=False,
+            _inspec=True,
         )
         self.validator = Validator()
         self.validate_and_write()
@@ -15,6 +15,8 @@ config_spec = StringIO(
     include_page_label = boolean(default=False)
     show_reading_progress_percentage = boolean(default=True)
     use_continuous_reading = boolean(default=True)
+    progressive_document_loading = boolean(default=False)
+    index_documents_for_search = boolean(default=True)
 [history]
     recent_terms = list(default=list())
     last_folder = string(default="")
@@ -31,5 +33,8 @@ config_spec = StringIO(
     text_view_margins = integer(default=10, min=0, max=100)
     text_wrap = boolean(default=False)
 [advanced]
+    prefetch_pages_ahead = integer(default=2, min=0, max=20)
+    prefetch_pages_behind = integer(default=1, min=0, max=20)
+    prefetch_memory_ceiling = integer(default=32, min=0)
 """
 )
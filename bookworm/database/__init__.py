@@ -4,24 +4,29 @@
 Persistent storage using SQLlite3
 """
 import os
-from pathlib import Path
-import sqlite3
-import sys
-
-from alembic import command
-from alembic.config import Config
-from alembic.migration import MigrationContext
-from sqlalchemy import create_engine, text
+from contextlib import contextmanager
+import time
+import weakref
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import scoped_session, sessionmaker
 
-from bookworm import app
 from bookworm.logger import logger
-from bookworm import paths
 from bookworm.paths import db_path as get_db_path
 
+from .maintenance import create_sqlalchemy_maintenance_target, database_maintenance
+from .migrations import (
+    get_head_revision,
+    get_script_location,
+    get_stored_revision,
+    get_table_names,
+    upgrade_schema,
+)
 from .models import *
 
 log = logger.getChild(__name__)
+# The maintenance target of each initialized engine, so that its listeners are added once
+_engine_maintenance_targets = weakref.WeakKeyDictionary()
 
 
 def get_db_url() -> str:
@@ -29,45 +34,97 @@ def get_db_url() -> str:
     return f"sqlite:///{db_path}"
 
 
+# The write-ahead log lets the readers carry on while a write is being committed.
+# With it, syncing the log at checkpoints only is enough to keep the database intact.
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", 5000),
+    ("cache_size", -16 * 1024),
+    ("mmap_size", 64 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+)
+# Number of read-only connections kept open for reading in the background
+READ_POOL_SIZE = 4
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # Setting it waits for writers, and only takes effect when the database is created
+    if dbapi_connection.execute("PRAGMA page_count").fetchone()[0] == 0:
+        dbapi_connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    for name, value in SQLITE_PRAGMAS:
+        dbapi_connection.execute(f"PRAGMA {name}={value}")
+
+
+def _set_read_only_sqlite_pragmas(dbapi_connection, connection_record):
+    dbapi_connection.execute("PRAGMA query_only=1")
+    for name, value in SQLITE_PRAGMAS:
+        if name != "journal_mode":
+            dbapi_connection.execute(f"PRAGMA {name}={value}")
+
+
+def _create_read_engine(engine, **kwargs):
+    if engine.url.database in (None, "", ":memory:"):
+        # Other connections can not see in-memory databases
+        return engine
+    if "poolclass" not in kwargs:
+        kwargs.update(pool_size=READ_POOL_SIZE, max_overflow=0)
+    read_engine = create_engine(
+        engine.url, connect_args={"check_same_thread": False}, **kwargs
+    )
+    event.listen(read_engine, "connect", _set_read_only_sqlite_pragmas)
+    return read_engine
+
+
+@contextmanager
+def read_session():
+    """
+    A session which uses the pool of read-only connections, for reading without
+    waiting on writes. It is closed on exit, so that each use sees the latest
+    committed state of the database, and the objects read with it are detached.
+    """
+    session = Base.read_session()
+    try:
+        yield session
+    finally:
+        Base.read_session.remove()
+
+
 def init_database(engine=None, url: str = None, **kwargs) -> bool:
     if not url:
         url = get_db_url()
     if engine == None:
         engine = create_engine(url, **kwargs)
+    if not event.contains(engine, "connect", _set_sqlite_pragmas):
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    if (maintenance_target := _engine_maintenance_targets.get(engine)) is None:
+        maintenance_target = create_sqlalchemy_maintenance_target("database", engine)
+        _engine_maintenance_targets[engine] = maintenance_target
+    database_maintenance.register(maintenance_target)
     log.debug(f"Using url {url} ")
+    started = time.perf_counter()
     with engine.connect() as conn:
-        context = MigrationContext.configure(conn)
-        rev = context.get_current_revision()
-        # let's check for the book table
-        # Should it be too ambiguous, we'd have to revisit what tables should be checked to determine whether the DB is at the baseline point
-        cursor = conn.execute(
-            text("SELECT name FROM sqlite_master WHERE type='table';")
-        )
-        tables = [row[0] for row in cursor.fetchall()]
-        is_baseline = tables != None and "book" in tables and rev == None
-    log.info(f"Current revision is {rev}")
-    log.info("Running database migrations and setup")
-    cfg_file = ""
-    script_location = "alembic"
-    if app.is_frozen:
-        cfg_file = sys._MEIPASS
-        script_location = paths.app_path("alembic")
-
-    cfg = Config(Path(cfg_file, "alembic.ini"))
-    # we set this attribute in order to prevent alembic from configuring logging if we're running the commands programmatically.
-    # This is because otherwise our loggers would be overridden
-    cfg.attributes["configure_logger"] = False
-    cfg.set_main_option("script_location", str(script_location))
-    cfg.set_main_option("sqlalchemy.url", url)
-    if rev == None:
+        tables = get_table_names(conn)
+        rev = get_stored_revision(conn, tables)
+    # let's check for the book table
+    # Should it be too ambiguous, we'd have to revisit what tables should be checked to determine whether the DB is at the baseline point
+    is_baseline = "book" in tables and rev == None
+    if (rev is not None) and (rev == get_head_revision(get_script_location())):
+        # Alembic is only needed when the schema is behind
+        log.info(f"The database schema is at the latest revision {rev}")
+    else:
+        log.info(f"Current revision is {rev}")
+        log.info("Running database migrations and setup")
         if is_baseline:
             log.info(
                 "No revision was found, but the database appears to be at the baseline required to begin tracking."
             )
-            log.info("Stamping alembic revision")
-            command.stamp(cfg, "28099038d8d6")
-    command.upgrade(cfg, "head")
+        upgrade_schema(url, stamp_baseline=is_baseline)
+    log.info(f"Checked the database schema in {time.perf_counter() - started:.3f} seconds")
     Base.session = scoped_session(
         sessionmaker(engine, autocommit=False, autoflush=False)
     )
+    Base.read_session = scoped_session(
+        sessionmaker(_create_read_engine(engine, **kwargs), autocommit=False, autoflush=False)
+    )
     return engine
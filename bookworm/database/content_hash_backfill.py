@@ -0,0 +1,338 @@
+# coding: utf-8
+
+"""
+Fills in the content hash of the stored document records which were created
+before documents were identified by their content, so that their history can be
+deduplicated without waiting for each document to be opened again.
+
+The documents are hashed at indexing priority by the recycled process workers of the
+task scheduler, with a lowered process priority, and the backfill rests between rounds
+of work so the rest of the system stays responsive.
+The hashes are written back in batches, merging the records of the same document
+the way the reader does when a document is opened.
+Records are only updated once they are hashed, so an interrupted backfill
+resumes with the remaining records the next time it runs. Documents which can not
+be hashed are remembered by the state of their file, so they are only tried
+again after the file changes.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from concurrent.futures import BrokenExecutor
+
+import attr
+import more_itertools
+from sqlalchemy.exc import SQLAlchemyError
+
+from bookworm import typehints as t
+from bookworm.concurrency import TaskPriority, task_scheduler
+from bookworm.document import create_document
+from bookworm.document.cache_utils import get_file_stat_key, get_fingerprint_cache
+from bookworm.document.uri import DocumentUri
+from bookworm.logger import logger
+from bookworm.signals import app_shuttingdown, content_hash_backfill_progressed
+
+from .models import Base, Book, DocumentPositionInfo, PinnedDocument, RecentDocument
+
+log = logger.getChild(__name__)
+BACKFILL_MODELS = (Book, DocumentPositionInfo, RecentDocument, PinnedDocument)
+# Number of hashed documents written to the database in a single transaction
+BACKFILL_BATCH_SIZE = 16
+# The fraction of the time the workers may spend hashing; they rest for the remainder
+BACKFILL_DUTY_CYCLE = 0.25
+# The longest rest between two rounds of hashing, in seconds
+BACKFILL_MAX_PAUSE = 30.0
+# Added to the niceness of the worker processes on POSIX systems. Unless it was
+# set explicitly, the I/O priority of a process follows its niceness.
+BACKFILL_WORKER_NICENESS = 10
+# Lowers the CPU, I/O, and memory priority of the calling process on Windows
+PROCESS_MODE_BACKGROUND_BEGIN = 0x00100000
+# Fingerprint cache keys of the documents which can not be hashed
+UNHASHABLE_DOCUMENT_KEY_PREFIX = "backfill-unhashable"
+# The backfill started with the application
+_app_content_hash_backfill = None
+
+
+@attr.s(auto_attribs=True, slots=True, frozen=True)
+class PendingDocument:
+    """A document whose stored records do not have a content hash yet."""
+
+    uri_key: str
+    uri: DocumentUri
+
+
+@attr.s(auto_attribs=True, slots=True, frozen=True)
+class ContentHashBackfillProgress:
+    total: int
+    hashed: int = 0
+    skipped: int = 0
+    failed: int = 0
+
+    @property
+    def processed(self) -> int:
+        return self.hashed + self.skipped + self.failed
+
+    @property
+    def is_done(self) -> bool:
+        return self.processed >= self.total
+
+
+def get_pending_documents(session) -> list[PendingDocument]:
+    """Return the documents which have records without a content hash, oldest first."""
+    pending = {}
+    for model in BACKFILL_MODELS:
+        rows = (
+            session.query(model.uri_key, model.uri)
+            .filter(model.content_hash.is_(None), model.uri_key.isnot(None))
+            .order_by(model.id.asc())
+        )
+        for uri_key, uri in rows:
+            pending.setdefault(uri_key, PendingDocument(uri_key=uri_key, uri=uri))
+    return list(pending.values())
+
+
+def merge_records_with_content_hash(session, model, content_hash: str) -> None:
+    """
+    Merge the records of the given model which have the given content hash and
+    the same format. Records of files which still exist are kept in preference.
+    """
+    records = (
+        session.query(model)
+        .filter(model.content_hash == content_hash)
+        .order_by(model.id.asc())
+        .all()
+    )
+    records_by_format = {}
+    for record in records:
+        records_by_format.setdefault(record.uri.format, []).append(record)
+    for matching_records in records_by_format.values():
+        if len(matching_records) < 2:
+            continue
+        record = min(
+            matching_records,
+            key=lambda candidate: (not os.path.isfile(candidate.uri.path), candidate.id),
+        )
+        duplicates = [candidate for candidate in matching_records if candidate is not record]
+        record.merge_duplicates(session, duplicates)
+        for duplicate in duplicates:
+            session.delete(duplicate)
+    session.flush()
+
+
+def _get_unhashable_document_key(uri) -> str | None:
+    """Return the key identifying the file of the given document as it is now, if it exists."""
+    if not os.path.isfile(uri.path):
+        return None
+    return f"{UNHASHABLE_DOCUMENT_KEY_PREFIX}:{get_file_stat_key(uri.path)}:{uri.format}"
+
+
+def _lower_worker_priority():
+    """Lowers the priority of the calling process, which only runs a single task."""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetPriorityClass(
+                kernel32.GetCurrentProcess(), PROCESS_MODE_BACKGROUND_BEGIN
+            )
+        else:
+            os.nice(BACKFILL_WORKER_NICENESS)
+    except OSError:
+        pass
+
+
+def _compute_content_hash(uri) -> str | None:
+    """This function runs in a recycled process worker of the task scheduler."""
+    _lower_worker_priority()
+    document = create_document(uri)
+    try:
+        return document.get_content_hash()
+    finally:
+        document.close()
+
+
+class ContentHashBackfill:
+    """
+    Computes the missing content hashes of the stored document records.
+    Call `run` to backfill in the calling thread, or `start` to backfill in a
+    background thread. Progress is reported to `progress_callback`, and
+    using the `content_hash_backfill_progressed` signal.
+    """
+
+    def __init__(
+        self,
+        session_factory: t.Callable[[], t.Any] = None,
+        max_workers: int = None,
+        duty_cycle: float = BACKFILL_DUTY_CYCLE,
+        batch_size: int = BACKFILL_BATCH_SIZE,
+        progress_callback: t.Callable[[ContentHashBackfillProgress], None] = None,
+    ):
+        self.session_factory = session_factory or Base.session.session_factory
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 1) // 4)
+        self.duty_cycle = duty_cycle
+        self.batch_size = batch_size
+        self.progress_callback = progress_callback
+        self.progress = None
+        self._cancel_event = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self.is_running():
+            return
+        self._cancel_event.clear()
+        self._thread = threading.Thread(
+            target=self._run_in_background,
+            name="bookworm_content_hash_backfill",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def cancel(self) -> None:
+        """Stop after the documents being hashed are done. Their hashes are still stored."""
+        self._cancel_event.set()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def join(self, timeout: float = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run_in_background(self):
+        try:
+            self.run()
+        except Exception:
+            log.exception("The content hash backfill has failed", exc_info=True)
+
+    def run(self) -> ContentHashBackfillProgress:
+        session = self.session_factory()
+        try:
+            pending_documents = get_pending_documents(session)
+        finally:
+            session.close()
+        self._report(ContentHashBackfillProgress(total=len(pending_documents)))
+        if not pending_documents:
+            return self.progress
+        log.info(f"Backfilling the content hash of {len(pending_documents)} documents.")
+        documents_to_hash = []
+        with get_fingerprint_cache() as cache:
+            for pending in pending_documents:
+                key = _get_unhashable_document_key(pending.uri)
+                if key is None or key in cache:
+                    self._update_progress(skipped=1)
+                else:
+                    documents_to_hash.append((pending, key))
+        self._report(self.progress)
+        hashed_documents = []
+        # Each process runs a single task, so lowering its priority does not affect other tasks
+        executor = task_scheduler.recycled_process_executor(TaskPriority.INDEXING, group=self)
+        try:
+            for window in more_itertools.chunked(documents_to_hash, self.max_workers):
+                if self._cancel_event.is_set():
+                    break
+                started = time.monotonic()
+                futures = [
+                    (pending, key, executor.submit(_compute_content_hash, pending.uri))
+                    for (pending, key) in window
+                ]
+                for pending, key, future in futures:
+                    try:
+                        content_hash = future.result()
+                    except BrokenExecutor:
+                        # A worker has crashed, which is blamed on the documents it was given.
+                        # The scheduler replaces the broken process pool.
+                        log.error(f"A backfill worker has crashed while hashing {pending.uri}")
+                    except Exception as e:
+                        log.warning(f"Failed to compute the content hash of {pending.uri}: {e!r}")
+                    else:
+                        if content_hash is not None:
+                            hashed_documents.append((pending, content_hash))
+                            continue
+                        # Documents without text have no content hash
+                        self._mark_unhashable(key)
+                        self._update_progress(skipped=1)
+                        continue
+                    self._mark_unhashable(key)
+                    self._update_progress(failed=1)
+                if len(hashed_documents) >= self.batch_size:
+                    self._write_hashed_documents(hashed_documents)
+                    hashed_documents = []
+                self._report(self.progress)
+                self._rest(time.monotonic() - started)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            if hashed_documents:
+                self._write_hashed_documents(hashed_documents)
+                self._report(self.progress)
+        log.info(f"Content hash backfill finished: {self.progress}")
+        return self.progress
+
+    def _rest(self, busy_time):
+        if self.duty_cycle >= 1:
+            return
+        pause = busy_time * (1 - self.duty_cycle) / self.duty_cycle
+        self._cancel_event.wait(min(pause, BACKFILL_MAX_PAUSE))
+
+    @staticmethod
+    def _mark_unhashable(key):
+        with get_fingerprint_cache() as cache:
+            cache.set(key, True)
+
+    def _write_hashed_documents(self, hashed_documents):
+        session = self.session_factory()
+        try:
+            for pending, content_hash in hashed_documents:
+                for model in BACKFILL_MODELS:
+                    session.query(model).filter(
+                        model.uri_key == pending.uri_key, model.content_hash.is_(None)
+                    ).update(
+                        model.get_content_hash_update_values(content_hash),
+                        synchronize_session=False,
+                    )
+                    merge_records_with_content_hash(session, model, content_hash)
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            # The content hashes are also stored by file fingerprint,
+            # so these documents will be quick to hash on the next run
+            log.exception("Failed to store the backfilled content hashes", exc_info=True)
+            self._update_progress(failed=len(hashed_documents))
+        else:
+            self._update_progress(hashed=len(hashed_documents))
+        finally:
+            session.close()
+
+    def _update_progress(self, **increments):
+        self.progress = attr.evolve(
+            self.progress,
+            **{
+                field: getattr(self.progress, field) + increment
+                for (field, increment) in increments.items()
+            },
+        )
+
+    def _report(self, progress):
+        self.progress = progress
+        if self.progress_callback is not None:
+            self.progress_callback(progress)
+        content_hash_backfill_progressed.send(self, progress=progress)
+
+
+def start_content_hash_backfill() -> ContentHashBackfill:
+    """Start backfilling the missing content hashes in the background."""
+    global _app_content_hash_backfill
+    if _app_content_hash_backfill is None:
+        _app_content_hash_backfill = ContentHashBackfill()
+    _app_content_hash_backfill.start()
+    return _app_content_hash_backfill
+
+
+@app_shuttingdown.connect
+def _cancel_content_hash_backfill(sender):
+    if _app_content_hash_backfill is not None:
+        _app_content_hash_backfill.cancel()
@@ -0,0 +1,434 @@
+# coding: utf-8
+
+"""
+Scheduled maintenance of the SQLite databases of Bookworm.
+
+Instead of optimizing the database each time a connection is closed,
+connections are kept open, and the maintenance tasks run in the background
+when a database has been idle for a while. Each task runs once enough rows have
+been changed since it last ran, as measured by the connections of the database:
+
+- `PRAGMA optimize` refreshes the statistics of the query planner.
+- `PRAGMA wal_checkpoint(TRUNCATE)` moves the write-ahead log into the database
+  and truncates it, so it does not keep growing and slowing down reads.
+- `PRAGMA incremental_vacuum` returns the pages freed by deleting rows to the
+  file system. Databases created before incremental vacuuming was enabled
+  are converted with a full `VACUUM` once enough of their pages are free,
+  if they are small enough for this not to delay closing the application.
+- The `merge` and `optimize` commands of the full-text indexes combine the
+  segments created by many small writes.
+"""
+
+from __future__ import annotations
+
+import enum
+import os
+import threading
+import time
+from datetime import datetime
+from functools import partial
+
+import attr
+from sqlalchemy import event as sa_event
+
+from bookworm import typehints as t
+from bookworm.logger import logger
+from bookworm.signals import app_shuttingdown, app_started
+
+log = logger.getChild(__name__)
+# Interval between two checks of whether the databases are idle, in seconds
+MAINTENANCE_CHECK_INTERVAL = 15
+# A database is idle when none of its rows were changed for this many seconds
+MAINTENANCE_IDLE_TIME = 60
+# Number of freed pages returned to the file system in one go by incremental vacuuming
+INCREMENTAL_VACUUM_STEP = 2048
+# Rows examined per index by `PRAGMA optimize`, which bounds the time it takes
+ANALYSIS_LIMIT = 400
+# How long closing the application waits for a running maintenance task, in seconds
+MAINTENANCE_STOP_TIMEOUT = 5
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class MaintenanceTask(str, enum.Enum):
+    OPTIMIZE = "optimize"
+    WAL_CHECKPOINT = "wal_checkpoint"
+    VACUUM = "vacuum"
+    FTS_MERGE = "fts_merge"
+    FTS_OPTIMIZE = "fts_optimize"
+
+
+@attr.s(auto_attribs=True, slots=True, frozen=True)
+class MaintenanceThresholds:
+    """When maintenance tasks become due, mostly by the number of rows changed since they ran."""
+
+    optimize_changes: int = 1_000
+    wal_checkpoint_changes: int = 1_000
+    wal_checkpoint_size: int = 4 * 1024 * 1024
+    vacuum_free_pages: int = 1024
+    # Free fraction of a database without incremental vacuuming which warrants a full vacuum
+    full_vacuum_free_fraction: float = 0.25
+    # A full vacuum can not be interrupted, so larger databases are not vacuumed when idle
+    full_vacuum_max_size: int = 64 * 1024 * 1024
+    fts_merge_changes: int = 5_000
+    fts_optimize_changes: int = 100_000
+
+
+@attr.s(auto_attribs=True, slots=True, frozen=True)
+class DatabaseStats:
+    name: str
+    filename: str
+    file_size: int
+    wal_size: int
+    page_size: int
+    page_count: int
+    free_pages: int
+    auto_vacuum: int
+    total_changes: int
+    # Rows changed since each task last ran
+    pending_changes: dict[MaintenanceTask, int]
+    # Total time spent running each task, in seconds
+    time_spent: dict[MaintenanceTask, float]
+    runs: dict[MaintenanceTask, int]
+    last_maintained_on: t.Optional[datetime]
+
+    @property
+    def free_size(self) -> int:
+        return self.free_pages * self.page_size
+
+
+class SQLiteChangeCounter:
+    """
+    Counts the rows changed using the connections of a database, including the ones
+    which were closed. The counts are read from SQLite, so counting costs nothing
+    until they are read, which may be done from any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = {}
+        self._retired_changes = 0
+
+    def register(self, connection, get_total_changes: t.Callable[[t.Any], int]) -> None:
+        with self._lock:
+            self._connections[id(connection)] = (connection, get_total_changes)
+
+    def retire(self, connection) -> None:
+        with self._lock:
+            if (entry := self._connections.pop(id(connection), None)) is not None:
+                self._retired_changes += self._get_changes(*entry)
+
+    def get_total_changes(self) -> int:
+        with self._lock:
+            return self._retired_changes + sum(
+                self._get_changes(*entry) for entry in self._connections.values()
+            )
+
+    @staticmethod
+    def _get_changes(connection, get_total_changes):
+        try:
+            return get_total_changes(connection)
+        except Exception:
+            # Closed without being retired
+            return 0
+
+
+class SQLiteMaintenanceTarget:
+    """
+    A database to maintain. `execute` runs a statement in autocommit mode
+    and returns its rows, and `change_counter` counts the rows changed in the database.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        execute: t.Callable[[str], list[tuple]],
+        change_counter: SQLiteChangeCounter,
+        fts_tables: t.Iterable[str] = (),
+        thresholds: MaintenanceThresholds = None,
+    ):
+        self.name = name
+        self.execute = execute
+        self.change_counter = change_counter
+        self.fts_tables = tuple(fts_tables)
+        self.thresholds = thresholds or MaintenanceThresholds()
+        self.time_spent = dict.fromkeys(MaintenanceTask, 0.0)
+        self.runs = dict.fromkeys(MaintenanceTask, 0)
+        self.last_maintained_on = None
+        # Rows changed by the maintenance tasks themselves
+        self.own_changes = 0
+        total_changes = change_counter.get_total_changes()
+        self._changes_at_last_run = dict.fromkeys(MaintenanceTask, total_changes)
+        self._task_runners = {
+            MaintenanceTask.OPTIMIZE: self._optimize,
+            MaintenanceTask.WAL_CHECKPOINT: self._checkpoint_wal,
+            MaintenanceTask.VACUUM: self._vacuum,
+            MaintenanceTask.FTS_MERGE: partial(self._run_fts_command, "merge"),
+            MaintenanceTask.FTS_OPTIMIZE: partial(self._run_fts_command, "optimize"),
+        }
+
+    def _get_pragma(self, name):
+        return self.execute(f"PRAGMA {name}")[0][0]
+
+    @property
+    def filename(self) -> str:
+        for (_seq, name, filename) in self.execute("PRAGMA database_list"):
+            if name == "main":
+                return filename
+
+    def get_pending_changes(self) -> dict[MaintenanceTask, int]:
+        total_changes = self.change_counter.get_total_changes()
+        return {
+            task: total_changes - changes for (task, changes) in self._changes_at_last_run.items()
+        }
+
+    def get_stats(self) -> DatabaseStats:
+        filename = self.filename
+        wal_filename = f"{filename}-wal"
+        return DatabaseStats(
+            name=self.name,
+            filename=filename,
+            file_size=os.path.getsize(filename) if os.path.isfile(filename) else 0,
+            wal_size=os.path.getsize(wal_filename) if os.path.isfile(wal_filename) else 0,
+            page_size=self._get_pragma("page_size"),
+            page_count=self._get_pragma("page_count"),
+            free_pages=self._get_pragma("freelist_count"),
+            auto_vacuum=self._get_pragma("auto_vacuum"),
+            total_changes=self.change_counter.get_total_changes(),
+            pending_changes=self.get_pending_changes(),
+            time_spent=dict(self.time_spent),
+            runs=dict(self.runs),
+            last_maintained_on=self.last_maintained_on,
+        )
+
+    def get_due_tasks(self) -> list[MaintenanceTask]:
+        stats = self.get_stats()
+        changes = stats.pending_changes
+        thresholds = self.thresholds
+        due_tasks = []
+        if changes[MaintenanceTask.OPTIMIZE] >= thresholds.optimize_changes:
+            due_tasks.append(MaintenanceTask.OPTIMIZE)
+        if self.fts_tables:
+            if changes[MaintenanceTask.FTS_OPTIMIZE] >= thresholds.fts_optimize_changes:
+                due_tasks.append(MaintenanceTask.FTS_OPTIMIZE)
+            elif changes[MaintenanceTask.FTS_MERGE] >= thresholds.fts_merge_changes:
+                due_tasks.append(MaintenanceTask.FTS_MERGE)
+        if stats.free_pages >= thresholds.vacuum_free_pages and (
+            stats.auto_vacuum == AUTO_VACUUM_INCREMENTAL
+            or (
+                stats.free_pages >= stats.page_count * thresholds.full_vacuum_free_fraction
+                and stats.file_size <= thresholds.full_vacuum_max_size
+            )
+        ):
+            due_tasks.append(MaintenanceTask.VACUUM)
+        # Checkpoint last, so the log written by the other tasks is truncated as well
+        if stats.wal_size and (
+            stats.wal_size >= thresholds.wal_checkpoint_size
+            or changes[MaintenanceTask.WAL_CHECKPOINT] >= thresholds.wal_checkpoint_changes
+        ):
+            due_tasks.append(MaintenanceTask.WAL_CHECKPOINT)
+        return due_tasks
+
+    def run_maintenance(
+        self,
+        tasks: t.Iterable[MaintenanceTask] = None,
+        should_stop: t.Callable[[], bool] = lambda: False,
+    ) -> list[MaintenanceTask]:
+        """Run the given tasks, or the due ones. Return the tasks which were run."""
+        tasks = self.get_due_tasks() if tasks is None else list(tasks)
+        completed_tasks = []
+        for task in tasks:
+            if should_stop():
+                break
+            changes = self.change_counter.get_total_changes()
+            started = time.perf_counter()
+            try:
+                self._task_runners[task](should_stop)
+            except Exception:
+                log.exception(f"Failed to run {task.value} on the {self.name} database")
+                continue
+            finally:
+                self.time_spent[task] += time.perf_counter() - started
+            self.runs[task] += 1
+            self._changes_at_last_run[task] = changes
+            completed_tasks.append(task)
+        if completed_tasks:
+            self.last_maintained_on = datetime.now()
+            log.debug(f"Maintained the {self.name} database: {self.get_stats()}")
+        return completed_tasks
+
+    def _optimize(self, should_stop):
+        self.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+        self.execute("PRAGMA optimize")
+
+    def _checkpoint_wal(self, should_stop):
+        (is_busy, _log_pages, _checkpointed_pages) = self.execute(
+            "PRAGMA wal_checkpoint(TRUNCATE)"
+        )[0]
+        if is_busy:
+            raise RuntimeError("The write-ahead log is in use")
+
+    def _vacuum(self, should_stop):
+        if self._get_pragma("auto_vacuum") != AUTO_VACUUM_INCREMENTAL:
+            # Converting to incremental vacuuming requires rebuilding the database
+            self.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self.execute("VACUUM")
+            return
+        while not should_stop() and self._get_pragma("freelist_count"):
+            self.execute(f"PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_STEP})")
+
+    def _run_fts_command(self, command, should_stop):
+        for table in self.fts_tables:
+            if should_stop():
+                return
+            if command == "merge":
+                self.execute(f"INSERT INTO {table}({table}, rank) VALUES('merge', 500)")
+            else:
+                self.execute(f"INSERT INTO {table}({table}) VALUES('{command}')")
+            # Each command counts as a changed row
+            self.own_changes += 1
+
+    def get_changes_by_others(self) -> int:
+        """The number of rows changed, other than by the maintenance tasks."""
+        return self.change_counter.get_total_changes() - self.own_changes
+
+
+class SQLiteMaintenanceScheduler:
+    """Runs the due maintenance tasks of the registered databases when they are idle."""
+
+    def __init__(
+        self,
+        check_interval: float = MAINTENANCE_CHECK_INTERVAL,
+        idle_time: float = MAINTENANCE_IDLE_TIME,
+    ):
+        self.check_interval = check_interval
+        self.idle_time = idle_time
+        self._targets = {}
+        self._last_changes = {}
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def register(self, target: SQLiteMaintenanceTarget) -> None:
+        """Register a database to maintain, replacing the one with the same name."""
+        with self._lock:
+            self._targets[target.name] = target
+            self._last_changes[target.name] = (target.get_changes_by_others(), time.monotonic())
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            self._targets.pop(name, None)
+            self._last_changes.pop(name, None)
+
+    def get_target(self, name: str) -> t.Optional[SQLiteMaintenanceTarget]:
+        return self._targets.get(name)
+
+    def get_stats(self) -> dict[str, DatabaseStats]:
+        with self._lock:
+            return {name: target.get_stats() for (name, target) in self._targets.items()}
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="bookworm_database_maintenance", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, optimize: bool = True, timeout: float = MAINTENANCE_STOP_TIMEOUT) -> None:
+        """
+        Stop the scheduler, and optimize the databases changed since they were last optimized.
+        Wait at most `timeout` seconds for a running task to stop, and do not optimize if it
+        is still running, as the maintenance thread will not outlive the application.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                log.warning("Database maintenance is still running, not waiting for it.")
+                return
+        if not optimize:
+            return
+        with self._lock:
+            for target in self._targets.values():
+                if target.get_pending_changes()[MaintenanceTask.OPTIMIZE]:
+                    target.run_maintenance([MaintenanceTask.OPTIMIZE])
+
+    def _run(self):
+        while not self._stop_event.wait(self.check_interval):
+            try:
+                self.run_idle_maintenance()
+            except Exception:
+                log.exception("Database maintenance has failed", exc_info=True)
+
+    def is_idle(self, target: SQLiteMaintenanceTarget) -> bool:
+        """Whether none of the rows of the database were changed for `idle_time` seconds."""
+        changes = target.get_changes_by_others()
+        last_changes, last_changed_at = self._last_changes[target.name]
+        now = time.monotonic()
+        if changes != last_changes:
+            self._last_changes[target.name] = (changes, now)
+            return False
+        return (now - last_changed_at) >= self.idle_time
+
+    def run_idle_maintenance(self) -> dict[str, list[MaintenanceTask]]:
+        """Run the due tasks of the idle databases. Return the tasks run for each database."""
+        completed_tasks = {}
+        with self._lock:
+            for (name, target) in self._targets.items():
+                if not self.is_idle(target):
+                    continue
+                # Stop when the database is written to while it is being maintained
+                changes = target.get_changes_by_others()
+                if tasks := target.run_maintenance(
+                    should_stop=lambda target=target, changes=changes: (
+                        self._stop_event.is_set()
+                        or target.get_changes_by_others() != changes
+                    )
+                ):
+                    completed_tasks[name] = tasks
+        return completed_tasks
+
+
+def create_sqlalchemy_maintenance_target(name: str, engine) -> SQLiteMaintenanceTarget:
+    """
+    Create a maintenance target for the SQLite database of the given engine.
+    Only the rows changed using connections created after this call are counted.
+    """
+    change_counter = SQLiteChangeCounter()
+
+    @sa_event.listens_for(engine, "connect")
+    def _register_connection(dbapi_connection, connection_record):
+        change_counter.register(dbapi_connection, lambda conn: conn.total_changes)
+
+    @sa_event.listens_for(engine, "close")
+    def _retire_connection(dbapi_connection, connection_record):
+        change_counter.retire(dbapi_connection)
+
+    def execute(sql):
+        connection = engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            try:
+                rows = cursor.execute(sql).fetchall()
+            finally:
+                cursor.close()
+            connection.commit()
+            return rows
+        finally:
+            connection.close()
+
+    return SQLiteMaintenanceTarget(name, execute=execute, change_counter=change_counter)
+
+
+database_maintenance = SQLiteMaintenanceScheduler()
+
+
+@app_started.connect
+def _start_database_maintenance(sender):
+    database_maintenance.start()
+
+
+@app_shuttingdown.connect
+def _stop_database_maintenance(sender):
+    database_maintenance.stop()
@@ -0,0 +1,88 @@
+# coding: utf-8
+
+"""
+Brings the schema of the database up to date using the bundled Alembic migrations.
+Alembic, and the migration scripts, are only loaded when the schema is behind
+the bundled head revision, which is read from the scripts without importing them.
+"""
+
+from __future__ import annotations
+
+import functools
+import re
+import sys
+from pathlib import Path
+
+from sqlalchemy import text
+
+from bookworm import app, paths
+from bookworm import typehints as t
+from bookworm.logger import logger
+
+log = logger.getChild(__name__)
+# The revision of databases created before Alembic was used
+BASELINE_REVISION = "28099038d8d6"
+REVISION_PATTERN = re.compile(r"^revision(?:\s*:[^=]*)?\s*=\s*['\"](\w+)['\"]", re.MULTILINE)
+DOWN_REVISION_PATTERN = re.compile(r"^down_revision(?:\s*:[^=]*)?\s*=\s*(.+)$", re.MULTILINE)
+REVISION_ID_PATTERN = re.compile(r"['\"](\w+)['\"]")
+
+
+def get_script_location() -> Path:
+    if app.is_frozen:
+        return paths.app_path("alembic")
+    return Path("alembic")
+
+
+def get_alembic_config(url: str):
+    from alembic.config import Config
+
+    cfg_file = sys._MEIPASS if app.is_frozen else ""
+    cfg = Config(Path(cfg_file, "alembic.ini"))
+    # we set this attribute in order to prevent alembic from configuring logging if we're running the commands programmatically.
+    # This is because otherwise our loggers would be overridden
+    cfg.attributes["configure_logger"] = False
+    cfg.set_main_option("script_location", str(get_script_location()))
+    cfg.set_main_option("sqlalchemy.url", url)
+    return cfg
+
+
+@functools.cache
+def get_head_revision(script_location: Path) -> t.Optional[str]:
+    """
+    Return the head revision of the migration scripts in the given location, or
+    None if there is no single head. The scripts are read as text, not imported.
+    """
+    revisions = set()
+    down_revisions = set()
+    for script in Path(script_location, "versions").glob("*.py"):
+        source = script.read_text(encoding="utf-8")
+        if (match := REVISION_PATTERN.search(source)) is None:
+            continue
+        revisions.add(match[1])
+        if (match := DOWN_REVISION_PATTERN.search(source)) is not None:
+            down_revisions.update(REVISION_ID_PATTERN.findall(match[1]))
+    heads = revisions - down_revisions
+    if len(heads) == 1:
+        return heads.pop()
+
+
+def get_table_names(conn) -> list[str]:
+    cursor = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table';"))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def get_stored_revision(conn, tables: t.Iterable[str]) -> t.Optional[str]:
+    if "alembic_version" not in tables:
+        return None
+    return conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+
+
+def upgrade_schema(url: str, stamp_baseline: bool = False) -> None:
+    """Run the migrations needed to bring the database at the given url up to date."""
+    from alembic import command
+
+    cfg = get_alembic_config(url)
+    if stamp_baseline:
+        log.info("Stamping alembic revision")
+        command.stamp(cfg, BASELINE_REVISION)
+    command.upgrade(cfg, "head")
@@ -21,6 +21,7 @@ from sqlalchemy.orm import (
     Query,
     scoped_session,
     declarative_base,
+    validates,
 )
 
 from bookworm.document.uri import DocumentUri
@@ -90,7 +91,23 @@ class DocumentBase(Base, GetOrCreateMixin):
     id = sa.Column(sa.Integer, primary_key=True)
     title = sa.Column(sa.String(512), nullable=False)
     uri = sa.Column(DocumentUriDBType(1024), nullable=False, unique=True, index=True)
-    content_hash = sa.Column(sa.TEXT, nullable=True)
+    # The uri without the openner args, which identifies the document regardless of them
+    uri_key = sa.Column(sa.String(1024), nullable=True, index=True)
+    content_hash = sa.Column(sa.TEXT, nullable=True, index=True)
+
+    @validates("uri")
+    def _set_uri_key(self, key, uri):
+        self.uri_key = uri.to_key_string()
+        return uri
+
+    @classmethod
+    def get_by_uri_key(cls, uri):
+        """Return the first record of the given document, ignoring the openner args."""
+        return (
+            cls.query.filter(cls.uri_key == uri.to_key_string())
+            .order_by(cls.id.asc())
+            .first()
+        )
 
     @classmethod
     def get_or_create(cls, *args, **kwargs):
@@ -100,10 +117,47 @@ class DocumentBase(Base, GetOrCreateMixin):
         session.commit()
         return instance
 
+    @classmethod
+    def get_content_hash_update_values(cls, content_hash):
+        """
+        Values for setting the content hash of records in bulk, which keep
+        the columns that are updated automatically, such as timestamps, as they are.
+        """
+        values = {cls.content_hash: content_hash}
+        for column in cls.__table__.columns:
+            if column.onupdate is not None:
+                values[column] = column
+        return values
+
+    def merge_duplicates(self, session, duplicates):
+        """
+        Take over the state of the given records, which refer to the same document.
+        The duplicates are not deleted by this method.
+        """
+
+    def _merge_latest_timestamp(self, column_name, duplicates):
+        """Keep the latest of the timestamps of this record and its duplicates, if any."""
+        timestamps = [
+            timestamp
+            for candidate in [self, *duplicates]
+            if (timestamp := getattr(candidate, column_name)) is not None
+        ]
+        if timestamps:
+            setattr(self, column_name, max(timestamps))
+
 
 class Book(DocumentBase):
     __tablename__ = "book"
 
+    def merge_duplicates(self, session, duplicates):
+        duplicate_ids = [duplicate.id for duplicate in duplicates]
+        if not duplicate_ids:
+            return
+        for annotation_model in (Bookmark, Note, Quote):
+            session.query(annotation_model).filter(
+                annotation_model.book_id.in_(duplicate_ids)
+            ).update({annotation_model.book_id: self.id}, synchronize_session=False)
+
     @property
     def identifier(self):
         return self.uri.to_uri_string()
@@ -122,6 +176,14 @@ class DocumentPositionInfo(DocumentBase):
         self.last_position = pos
         self.session.commit()
 
+    def merge_duplicates(self, session, duplicates):
+        if self.get_last_position() != (0, 0):
+            return
+        for duplicate in duplicates:
+            if duplicate.get_last_position() != (0, 0):
+                self.last_page, self.last_position = duplicate.get_last_position()
+                return
+
 
 class RecentDocument(DocumentBase):
     __tablename__ = "recent_document"
@@ -133,6 +195,9 @@ class RecentDocument(DocumentBase):
         self.last_opened_on = datetime.utcnow()
         self.session.commit()
 
+    def merge_duplicates(self, session, duplicates):
+        self._merge_latest_timestamp("last_opened_on", duplicates)
+
     @classmethod
     def get_recents(cls, limit=10):
         return cls.query.order_by(cls.last_opened_on.desc()).limit(limit).all()
@@ -163,6 +228,14 @@ class PinnedDocument(DocumentBase):
             .all()
         )
 
+    def merge_duplicates(self, session, duplicates):
+        self._merge_latest_timestamp("last_opened_on", duplicates)
+        self.is_pinned = any(candidate.is_pinned for candidate in [self, *duplicates])
+        # Records created before the column had a default have no order
+        self.pinning_order = max(
+            (candidate.pinning_order or 0) for candidate in [self, *duplicates]
+        )
+
     def pin(self):
         if self.is_pinned:
             return
@@ -26,9 +26,11 @@ from .exceptions import (
     DocumentIOError,
     DocumentRestrictedError,
     PaginationError,
+    UnsupportedDocumentFormatError,
 )
 from .features import READING_MODE_LABELS, DocumentCapability, ReadingMode
-from .formats import *
+from .formats import DOCUMENT_FORMATS
+from .registry import DocumentFormat, document_formats
 from .uri import DocumentUri
 
 
@@ -45,3 +47,19 @@ def create_document(uri, read=True):
         except ChangeDocument as e:
             return create_document(e.new_uri, read)
     return document
+
+
+def probe_document(uri) -> DocumentInfo:
+    """
+    Return the metadata and the cover image of a document, reading only
+    as much of it as its format requires.
+    """
+    doc_cls = BaseDocument.get_document_class_given_format(uri.format.lower())
+    if doc_cls is None:
+        raise UnsupportedDocumentFormatError(
+            f"Document Format {uri.format} is not supported."
+        )
+    try:
+        return doc_cls.probe(uri)
+    except ChangeDocument as e:
+        return probe_document(e.new_uri)
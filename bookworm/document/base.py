@@ -3,18 +3,20 @@
 from __future__ import annotations
 
 import gc
+import sys
+import threading
+import weakref
 from abc import ABCMeta, abstractmethod
 from collections.abc import Iterable, Sequence
-from functools import cached_property, lru_cache, wraps
+from functools import cached_property, wraps
 from pathlib import Path
 
 from blake3 import blake3
 import pywhatlang
-from more_itertools import flatten
 from selectolax.parser import HTMLParser
 
 from bookworm import typehints as t
-from bookworm.concurrency import QueueProcess, call_threaded
+from bookworm.concurrency import call_threaded, document_worker_pool
 from bookworm.i18n import LocaleInfo
 from bookworm.image_io import ImageIO
 from bookworm.logger import logger
@@ -25,13 +27,22 @@ from bookworm.utils import (
     remove_excess_blank_lines,
 )
 
+from . import cache_utils
+from . import identity
 from . import operations as doctools
+from . import search_index
 from .elements import *
 from .exceptions import DocumentIOError, PaginationError, UnsupportedDocumentFormatError
 from .features import DocumentCapability, ReadingMode
+from .page_cache import cached_page_method, page_cache
+from .registry import DocumentFormatRegistry, document_formats
+from .section_index import SectionIntervalIndex
+from .shared_text import SharedTextSnapshot
 
 log = logger.getChild(__name__)
-PAGE_CACHE_CAPACITY = 300
+_shared_text_lock = threading.Lock()
+# A content hash may be None for documents without text
+_CONTENT_HASH_UNKNOWN = object()
 
 
 class BaseDocument(Sequence, Iterable, metaclass=ABCMeta):
@@ -55,33 +66,52 @@ class BaseDocument(Sequence, Iterable, metaclass=ABCMeta):
     supported_reading_modes: t.Tuple[ReadingMode] = (ReadingMode.DEFAULT,)
     default_reading_mode: ReadingMode = ReadingMode.DEFAULT
 
-    document_classes: dict[str, t.ForwardRef("BaseDocument")] = {}
-    """A dict of subclasses representing supported document types."""
+    document_formats: DocumentFormatRegistry = document_formats
+    """The supported document formats, whose classes are imported on first use."""
+
+    _shared_text: SharedTextSnapshot = None
+    """The page texts of this document, when published to worker processes."""
+
+    _search_index: tuple[str, search_index.DocumentSearchIndex] = None
+    """The key and the search index of this document, once loaded from the cache."""
 
     @classmethod
     def __init_subclass__(cls, *args, **kwargs):
         super().__init_subclass__(*args, **kwargs)
-        if (cls.format is not None) and cls.check():
-            cls.document_classes[cls.format.lower()] = cls
+        if cls.format is not None:
+            cls.document_formats.register_class(cls)
 
     @classmethod
     def get_document_class_given_format(cls, format: str) -> BaseDocument:
-        return cls.document_classes.get(format.lower())
+        return cls.document_formats.get_document_class(format)
 
     @classmethod
     def get_supported_file_extensions(cls):
-        exts = flatten(
-            doc_cls.extensions
-            for doc_cls in cls.document_classes.values()
-            if doc_cls.extensions is not None
-        )
-        return frozenset(ext.lstrip("*") for ext in exts)
+        return cls.document_formats.get_supported_file_extensions()
 
     @classmethod
     def check(cls) -> bool:
-        """Return True if this document format is supported based on the user's environment."""
+        """
+        Return True if this document format is supported based on the user's environment.
+        The formats declared in `bookworm.document.formats` are checked using their
+        `requirement` instead, without importing their class.
+        """
         return True
 
+    @classmethod
+    def probe(cls, uri: DocumentUri) -> DocumentInfo:
+        """
+        Return the metadata and the cover image of the document at the given uri.
+        Formats which can get these without reading the whole document should
+        override this, since the default implementation reads the document.
+        """
+        document = cls(uri)
+        document.read()
+        try:
+            return DocumentInfo.from_document(document)
+        finally:
+            document.close()
+
     def __init__(self, uri):
         self.uri = uri
         self._is_read = False
@@ -97,7 +127,10 @@ class BaseDocument(Sequence, Iterable, metaclass=ABCMeta):
 
     def __getstate__(self) -> dict:
         """Support for pickling."""
-        return dict(uri=self.uri)
+        state = dict(uri=self.uri)
+        if self._shared_text is not None:
+            state["_shared_text"] = self._shared_text
+        return state
 
     def __setstate__(self, state: dict) -> None:
         """Support for unpickling."""
@@ -127,6 +160,21 @@ class BaseDocument(Sequence, Iterable, metaclass=ABCMeta):
         """Return a unique identifier for this document."""
         return self.uri.to_uri_string()
 
+    @cached_property
+    def file_fingerprint(self) -> str:
+        """Return a fingerprint of the raw contents of the file of this document."""
+        return cache_utils.get_file_fingerprint(self.get_file_system_path())
+
+    @cached_property
+    def text_cache_key(self) -> str:
+        """Identifies the text of this document as extracted with the current reading options."""
+        reading_mode = int(self.reading_options.reading_mode)
+        return f"{self.file_fingerprint}:{self.format}:{reading_mode}"
+
+    @cached_property
+    def page_section_index(self) -> SectionIntervalIndex:
+        return SectionIntervalIndex.from_pagers(self.toc_tree)
+
     @abstractmethod
     def read(self) -> None:
         """
@@ -158,23 +206,45 @@ class BaseDocument(Sequence, Iterable, metaclass=ABCMeta):
 
     def get_content_hash(self) -> str | None:
         """
-        Generates the content hash for this document
-        subclasses may override this if necessary, such as in the case of SinglePageDocument
+        Return the content hash of this document.
+        Content hashes which are expensive to compute are stored by the
+        fingerprint of the file, so the text of a document is only extracted once.
         """
         if hasattr(self, "_content_hash"):
             return self._content_hash
+        if self.can_compute_content_hash_quickly():
+            self._content_hash = self._compute_content_hash()
+            return self._content_hash
+        content_hash = identity.get_stored_content_hash(self, default=_CONTENT_HASH_UNKNOWN)
+        if content_hash is _CONTENT_HASH_UNKNOWN:
+            content_hash = self._compute_content_hash()
+            identity.store_content_hash(self, content_hash)
+        self._content_hash = content_hash
+        return self._content_hash
+
+    def _compute_content_hash(self) -> str | None:
+        """
+        Generates the content hash for this document
+        subclasses may override this if necessary, such as in the case of SinglePageDocument
+        """
         if not self._is_read:
             self.read()
-        self._content_hash = self._hash_document_pages(
-            page.get_text() for page in self
-        )
-        return self._content_hash
+        return self._hash_document_pages(page.get_text() for page in self)
+
+    def can_compute_content_hash_quickly(self) -> bool:
+        """Whether the content hash can be computed without extracting the text of the whole document."""
+        return False
 
     def close(self) -> None:
         """Perform the actual IO operations for unloading the ebook.
         Subclasses should call super to ensure the standard behavior.
         """
         self._is_read = False
+        page_cache.drop_document(self)
+        if self._shared_text is not None:
+            self._shared_text.close()
+            self._shared_text = None
+        self._search_index = None
         gc.collect()
 
     @abstractmethod
@@ -211,11 +281,25 @@ class BaseDocument(Sequence, Iterable, metaclass=ABCMeta):
     def metadata(self) -> BookMetadata:
         """Return a `BookMetadata` object holding info about this book."""
 
-    @lru_cache(maxsize=1000)
+    @cached_page_method
     def get_page_content(self, page_number: int) -> str:
         """Convenience method: return the text content of a page."""
+        if self._shared_text is not None:
+            return self._shared_text.get_page_text(page_number)
         return self[page_number].get_text()
 
+    def is_page_content_cached(self, page_number: int) -> bool:
+        return page_cache.contains(
+            self, (BaseDocument.get_page_content.page_cache_key, page_number)
+        )
+
+    def get_cached_page_size(self, page_number: int) -> int:
+        """Return the memory held by the cached content and page object of a page, in bytes."""
+        cache_keys = [BaseDocument.get_page_content.page_cache_key]
+        if (page_cache_key := getattr(self.get_page, "page_cache_key", None)) is not None:
+            cache_keys.append(page_cache_key)
+        return page_cache.get_entries_size(self, [(key, page_number) for key in cache_keys])
+
     def get_page_image(self, page_number: int, zoom_factor: float = 1.0) -> ImageIO:
         """Convenience method: return the image of a page."""
         return self[page_number].get_image(zoom_factor)
@@ -229,6 +313,16 @@ class BaseDocument(Sequence, Iterable, metaclass=ABCMeta):
             return filepath
         raise DocumentIOError(f"File {filepath} does not exist.")
 
+    def get_worker_handle_key(self) -> tuple:
+        """
+        Identifies the handle to this document kept open by the document worker
+        processes. A file which changed since it was opened there is opened again.
+        """
+        try:
+            return (self.uri, cache_utils.get_file_stat_key(self.uri.path))
+        except OSError:
+            return (self.uri, None)
+
     @classmethod
     def should_read_async(cls):
         return DocumentCapability.ASYNC_READ in cls.capabilities
@@ -237,6 +331,10 @@ class BaseDocument(Sequence, Iterable, metaclass=ABCMeta):
     def uses_chapter_by_chapter_navigation_model(self):
         return self.default_reading_mode is ReadingMode.CHAPTER_BASED
 
+    @classmethod
+    def can_read_progressively(cls):
+        return DocumentCapability.PROGRESSIVE_READ in cls.capabilities
+
     @classmethod
     def supports_structural_navigation(cls):
         return DocumentCapability.STRUCTURED_NAVIGATION in cls.capabilities
@@ -275,28 +373,72 @@ class BaseDocument(Sequence, Iterable, metaclass=ABCMeta):
             return LocaleInfo(lang_code).parent
         return LocaleInfo(hint_language)
 
+    def publish_shared_text(self) -> SharedTextSnapshot | None:
+        """
+        Publish the page texts of this document to shared memory, if they are readily
+        available, so that worker processes do not need to extract them again.
+        """
+        with _shared_text_lock:
+            if self._shared_text is None:
+                if (page_texts := self._get_page_texts_for_sharing()) is not None:
+                    self._shared_text = SharedTextSnapshot.publish(page_texts)
+            return self._shared_text
+
+    def _get_page_texts_for_sharing(self) -> list[str] | None:
+        if (index := search_index.load_search_index(self)) is not None:
+            return index.page_texts
+
     def export_to_text(self, target_filename: t.PathLike):
-        return QueueProcess(
-            target=doctools.export_to_plain_text,
-            args=(self, target_filename),
+        self.publish_shared_text()
+        if (num_workers := doctools.get_export_worker_count(self)) > 1:
+            return doctools.export_to_plain_text_in_parallel(
+                self, target_filename, num_workers
+            )
+        return document_worker_pool.submit(
+            doctools.export_to_plain_text,
+            self,
+            args=(target_filename,),
+            key=self.get_worker_handle_key(),
             name="document-export",
         )
 
     def search(self, request: doctools.SearchRequest):
-        yield from QueueProcess(
-            target=doctools.search_book, args=(self, request), name="document-search"
+        if (index := search_index.load_search_index(self)) is not None:
+            if (resultsets := index.search_pages(self, request)) is not None:
+                yield from resultsets
+                return
+        else:
+            search_index.ensure_search_index(self)
+        self.publish_shared_text()
+        if (num_workers := doctools.get_search_worker_count(request)) > 1:
+            yield from doctools.search_book_in_parallel(self, request, num_workers)
+            return
+        yield from document_worker_pool.submit(
+            doctools.search_book,
+            self,
+            args=(request,),
+            key=self.get_worker_handle_key(),
+            name="document-search",
         )
 
 
 class BasePage(metaclass=ABCMeta):
-    """Represents a page from the document."""
+    """
+    Represents a page from the document.
+    Pages only hold a weak reference to their document, so that the pages kept
+    in the page cache do not keep a document which is no longer used alive.
+    """
 
-    __slots__ = ["document", "index"]
+    __slots__ = ["_document_ref", "index"]
 
     def __init__(self, document: BaseDocument, index: int):
-        self.document = document
+        self._document_ref = weakref.ref(document)
         self.index = index
 
+    @property
+    def document(self) -> BaseDocument:
+        return self._document_ref()
+
     def __repr__(self):
         return f"<{self.__class__.__name__}: {self.index}>"
 
@@ -304,6 +446,10 @@ class BasePage(metaclass=ABCMeta):
     def get_text(self) -> str:
         """Return the text content or raise NotImplementedError."""
 
+    def get_memory_footprint(self) -> int:
+        """Return an estimate of the memory used by this page, in bytes."""
+        return sys.getsizeof(self)
+
     def get_image(self, zoom_factor: float) -> ImageIO:
         """
         Return page image as `ImageIO`
@@ -375,13 +521,7 @@ class BasePage(metaclass=ABCMeta):
     @cached_property
     def section(self) -> Section:
         """The (most specific) section that this page blongs to."""
-        rv = self.document.toc_tree
-        for sect in rv.iter_children():
-            if self.index in sect.pager:
-                rv = sect
-                if sect.pager.first > self.index:
-                    break
-        return rv
+        return self.document.page_section_index.get(self.index)
 
     @property
     def is_first_of_section(self) -> bool:
@@ -426,11 +566,12 @@ class SinglePageDocument(BaseDocument):
     def get_content(self) -> str:
         """Get the content of this document."""
 
-    def get_content_hash(self) -> str | None:
-        if hasattr(self, "_content_hash"):
-            return self._content_hash
-        self._content_hash = self._hash_document_text(self.get_content())
-        return self._content_hash
+    def _compute_content_hash(self) -> str | None:
+        return self._hash_document_text(self.get_content())
+
+    def can_compute_content_hash_quickly(self) -> bool:
+        # The content is already loaded in memory
+        return True
 
     def get_page(self, index: int) -> SinglePage:
         return SinglePage(self, index)
@@ -439,15 +580,26 @@ class SinglePageDocument(BaseDocument):
     def language(self) -> str:
         return self.get_language(samples=self.get_content()[:2000], is_html=False)
 
+    def wait_for_position(self, pos: int) -> None:
+        """
+        Block until the text at the given position is available.
+        Documents that load their content progressively should override this.
+        """
+
+    def wait_until_loaded(self) -> None:
+        """Block until the whole content is available."""
+
+    def _get_page_texts_for_sharing(self) -> list[str]:
+        self.wait_until_loaded()
+        return [self.get_content()]
+
+    @cached_property
+    def text_section_index(self) -> SectionIntervalIndex:
+        return SectionIntervalIndex.from_text_ranges(self.toc_tree)
+
     def get_section_at_position(self, pos):
         """Return the section at the given position."""
-        rv = self.toc_tree
-        for sect in rv.iter_children():
-            if pos in sect.text_range:
-                rv = sect
-                if sect.text_range.start > pos:
-                    break
-        return rv
+        return self.text_section_index.get(pos)
 
     def get_document_semantic_structure(self):
         raise NotImplementedError
@@ -462,16 +614,30 @@ class SinglePageDocument(BaseDocument):
         raise NotImplementedError
 
     def search(self, request: doctools.SearchRequest):
-        text = self.get_content()[request.text_range.as_slice()]
-        yield from QueueProcess(
-            target=doctools.search_single_page_document,
-            args=(
-                text,
-                request,
-            ),
+        if (index := search_index.load_search_index(self)) is not None:
+            if (resultsets := index.search_text(self.get_content(), request)) is not None:
+                yield from resultsets
+                return
+        else:
+            search_index.ensure_search_index(self)
+        # Without a key, the worker detaches from the snapshot after the search,
+        # rather than keeping it alive after this document has freed it
+        yield from document_worker_pool.submit(
+            doctools.search_shared_text,
+            self.publish_shared_text(),
+            args=(request,),
             name="document-search",
         )
 
+    def export_to_text(self, target_filename: t.PathLike):
+        # Like search, export from the published text rather than reading the document again
+        return document_worker_pool.submit(
+            doctools.export_shared_text_to_plain_text,
+            self.publish_shared_text(),
+            args=(self.metadata.title, target_filename),
+            name="document-export",
+        )
+
 
 class DummyDocument(BaseDocument):
     """Implements core document methods for a dummy document."""
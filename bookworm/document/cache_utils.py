@@ -1,9 +1,16 @@
 """Caching utilities"""
 
+import os
+from functools import lru_cache
 from pathlib import Path
 
+from blake3 import blake3
 from diskcache import Cache
 
+from bookworm.paths import home_data_path
+
+FINGERPRINT_CACHE_SIZE_LIMIT = 32 * 1024 * 1024
+
 
 def is_document_modified(key: str, path: Path, cache: Cache) -> bool:
     """
@@ -22,3 +29,44 @@ def is_document_modified(key: str, path: Path, cache: Cache) -> bool:
 def set_document_modified_time(key: str, path: Path, cache: Cache) -> bool:
     key = f"{key}_meta"
     cache.set(key, path.stat().st_mtime)
+
+
+def get_fingerprint_cache() -> Cache:
+    return Cache(
+        os.fspath(home_data_path(".document_fingerprints")),
+        size_limit=FINGERPRINT_CACHE_SIZE_LIMIT,
+        eviction_policy="least-recently-used",
+    )
+
+
+def get_file_stat_key(path: Path) -> str:
+    """Identifies the given file as it is now, by its path, size, and modification time."""
+    path = Path(path).resolve()
+    stat = path.stat()
+    return f"{os.fspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def hash_file(path: Path) -> str:
+    """Hash the raw contents of the given file, using all the available cores."""
+    hasher = blake3(max_threads=blake3.AUTO)
+    hasher.update_mmap(path)
+    return hasher.hexdigest()
+
+
+def get_file_fingerprint(path: Path) -> str:
+    """
+    Return a fingerprint of the raw contents of the given file.
+    Fingerprints are stored by path, size, and modification time,
+    so the file is only hashed again after it changes.
+    """
+    return _get_file_fingerprint(get_file_stat_key(path), os.fspath(path))
+
+
+@lru_cache(maxsize=256)
+def _get_file_fingerprint(stat_key: str, path: str) -> str:
+    key = f"file:{stat_key}"
+    with get_fingerprint_cache() as cache:
+        if (fingerprint := cache.get(key)) is None:
+            fingerprint = hash_file(path)
+            cache.set(key, fingerprint)
+    return fingerprint
@@ -223,23 +223,31 @@ class DocumentInfo:
 
     @classmethod
     def from_document(cls, document):
-        metadata = document.metadata
-        return cls(
+        return cls.from_book_metadata(
             uri=document.uri,
-            title=metadata.title,
+            metadata=document.metadata,
             language=document.language,
-            description=metadata.description,
             number_of_pages=(
                 len(document) if not document.is_single_page_document() else None
             ),
             number_of_sections=(
                 len(document.toc_tree) if document.has_toc_tree() else None
             ),
+            cover_image=document.get_cover_image(),
+        )
+
+    @classmethod
+    def from_book_metadata(cls, uri, metadata: BookMetadata, language: LocaleInfo, **kwargs):
+        return cls(
+            uri=uri,
+            title=metadata.title,
+            language=language,
+            description=metadata.description,
             authors=metadata.author,
             creation_date=metadata.creation_date,
             publication_date=metadata.publication_year,
             publisher=metadata.publisher,
-            cover_image=document.get_cover_image(),
+            **kwargs,
         )
 
     def __dict_value_serializer(self, instance, field, value):
@@ -37,6 +37,8 @@ class DocumentCapability(IntFlag):
     """
     INTERNAL_ANCHORS = auto()
     """Does this document support internal links."""
+    PROGRESSIVE_READ = auto()
+    """Can this document expose its content before it is fully loaded?"""
 
 
 class ReadingMode(IntEnum):
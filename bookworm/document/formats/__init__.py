@@ -1,14 +1,261 @@
 # coding: utf-8
 
-from .archive import ArchivedDocument
-from .epub import EpubDocument
-from .fb2 import FB2Document, FitzFB2Document
-from .html import FileSystemHtmlDocument, WebHtmlDocument
-from .markdown import MarkdownDocument
-from .mobi import MobiDocument
-from .odf import OdfTextDocument
-from .pandoc import DocbookDocument, RtfDocument
-from .pdf import FitzPdfDocument
-from .plain_text import PlainTextDocument
-from .powerpoint import PowerpointPresentation
-from .word import WordDocument
+"""
+Declares the supported document formats.
+The modules implementing them are imported on first use, see `bookworm.document.registry`.
+"""
+
+from __future__ import annotations
+
+from ..features import DocumentCapability as DC
+from ..registry import DocumentFormat, document_formats
+
+FITZ_CAPABILITIES = (
+    DC.TOC_TREE
+    | DC.METADATA
+    | DC.GRAPHICAL_RENDERING
+    | DC.IMAGE_EXTRACTION
+    | DC.STRUCTURED_NAVIGATION
+    | DC.LINKS
+)
+HTML_CAPABILITIES = (
+    DC.TOC_TREE
+    | DC.METADATA
+    | DC.SINGLE_PAGE
+    | DC.STRUCTURED_NAVIGATION
+    | DC.TEXT_STYLE
+    | DC.ASYNC_READ
+    | DC.LINKS
+    | DC.INTERNAL_ANCHORS
+)
+
+
+def _pandoc_is_installed() -> bool:
+    from bookworm import pandoc
+
+    return bool(pandoc.is_pandoc_installed())
+
+
+def _pandoc_is_not_installed() -> bool:
+    return not _pandoc_is_installed()
+
+
+DOCUMENT_FORMATS = (
+    DocumentFormat(
+        format="archive",
+        # Translators: the name of a document file format
+        name=_("Archive File"),
+        extensions=("*.zip", "*.rar"),
+        class_path=f"{__name__}.archive:ArchivedDocument",
+        capabilities=DC.ASYNC_READ,
+    ),
+    DocumentFormat(
+        format="epub",
+        # Translators: the name of a document file format
+        name=_("Electronic Publication (EPUB)"),
+        extensions=("*.epub",),
+        class_path=f"{__name__}.epub:EpubDocument",
+        capabilities=HTML_CAPABILITIES | DC.PROGRESSIVE_READ,
+    ),
+    DocumentFormat(
+        format="xps",
+        # Translators: the name of a document file format
+        name=_("XPS Document"),
+        extensions=("*.xps", "*.oxps"),
+        class_path=f"{__name__}.fitz:FitzXpsDocument",
+        capabilities=FITZ_CAPABILITIES,
+    ),
+    DocumentFormat(
+        format="cbz",
+        # Translators: the name of a document file format
+        name=_("Comic Book Archive"),
+        extensions=("*.cbz",),
+        class_path=f"{__name__}.fitz:FitzCBZDocument",
+        capabilities=FITZ_CAPABILITIES,
+    ),
+    DocumentFormat(
+        format="fb2",
+        # Translators: the name of a document file format
+        name=_("Fiction Book (FB2)"),
+        extensions=("*.fb2",),
+        class_path=f"{__name__}.fb2:FB2Document",
+        capabilities=HTML_CAPABILITIES,
+        requirement=_pandoc_is_installed,
+    ),
+    DocumentFormat(
+        format="fb2fitz",
+        # Translators: the name of a document file format
+        name=_("Fiction Book (FB2)"),
+        extensions=("*.fb2",),
+        class_path=f"{__name__}.fb2:FitzFB2Document",
+        capabilities=FITZ_CAPABILITIES,
+        requirement=_pandoc_is_not_installed,
+    ),
+    DocumentFormat(
+        format="html",
+        # Translators: the name of a document file format
+        name=_("HTML Document"),
+        extensions=("*.html", "*.htm", "*.xhtml"),
+        class_path=f"{__name__}.html:FileSystemHtmlDocument",
+        capabilities=HTML_CAPABILITIES,
+    ),
+    DocumentFormat(
+        format="webpage",
+        name=None,
+        extensions=(),
+        class_path=f"{__name__}.html:WebHtmlDocument",
+        capabilities=HTML_CAPABILITIES,
+        internal=True,
+    ),
+    DocumentFormat(
+        format="markdown",
+        # Translators: the name of a document file format
+        name=_("Markdown File"),
+        extensions=("*.md",),
+        class_path=f"{__name__}.markdown:MarkdownDocument",
+        capabilities=HTML_CAPABILITIES,
+    ),
+    DocumentFormat(
+        format="mobi",
+        # Translators: the name of a document file format
+        name=_("Kindle eBook"),
+        extensions=("*.mobi", "*.azw3"),
+        class_path=f"{__name__}.mobi:MobiDocument",
+        capabilities=DC.ASYNC_READ,
+    ),
+    DocumentFormat(
+        format="odt",
+        # Translators: the name of a document file format
+        name=_("Open Document Text"),
+        extensions=("*.odt",),
+        class_path=f"{__name__}.odf:OdfTextDocument",
+        capabilities=DC.ASYNC_READ,
+    ),
+    DocumentFormat(
+        format="odp",
+        # Translators: the name of a document file format
+        name=_("Open Document Presentation"),
+        extensions=("*.odp",),
+        class_path=f"{__name__}.odf:OdfPresentation",
+        capabilities=(
+            DC.TOC_TREE
+            | DC.METADATA
+            | DC.STRUCTURED_NAVIGATION
+            | DC.TEXT_STYLE
+            | DC.ASYNC_READ
+            | DC.LINKS
+        ),
+    ),
+    DocumentFormat(
+        format="rtf",
+        # Translators: the name of a document file format
+        name=_("Rich Text Document"),
+        extensions=("*.rtf",),
+        class_path=f"{__name__}.pandoc:RtfDocument",
+        capabilities=HTML_CAPABILITIES,
+        requirement=_pandoc_is_installed,
+    ),
+    DocumentFormat(
+        format="docbook",
+        # Translators: the name of a document file format
+        name=_("Docbook Document"),
+        extensions=("*.docbook",),
+        class_path=f"{__name__}.pandoc:DocbookDocument",
+        capabilities=HTML_CAPABILITIES,
+        requirement=_pandoc_is_installed,
+    ),
+    DocumentFormat(
+        format="ipynb",
+        # Translators: the name of a document file format
+        name=_("Jupyter notebook"),
+        extensions=("*.ipynb",),
+        class_path=f"{__name__}.pandoc:JupyterNotebookDocument",
+        capabilities=HTML_CAPABILITIES,
+        requirement=_pandoc_is_installed,
+    ),
+    DocumentFormat(
+        format="latex",
+        # Translators: the name of a document file format
+        name=_("LaTeX Document"),
+        extensions=("*.tex",),
+        class_path=f"{__name__}.pandoc:LaTeXDocument",
+        capabilities=HTML_CAPABILITIES,
+        requirement=_pandoc_is_installed,
+    ),
+    DocumentFormat(
+        format="t2t",
+        # Translators: the name of a document file format
+        name=_("Text2Tags Document"),
+        extensions=("*.t2t",),
+        class_path=f"{__name__}.pandoc:Text2TagsDocument",
+        capabilities=HTML_CAPABILITIES,
+        requirement=_pandoc_is_installed,
+    ),
+    DocumentFormat(
+        format="man",
+        # Translators: the name of a document file format
+        name=_("Unix manual page"),
+        extensions=tuple(f"*.{i}" for i in range(1, 9)),
+        class_path=f"{__name__}.pandoc:ManPageDocument",
+        capabilities=HTML_CAPABILITIES,
+        requirement=_pandoc_is_installed,
+    ),
+    DocumentFormat(
+        format="pdf",
+        # Translators: the name of a document file format
+        name=_("Portable Document (PDF)"),
+        extensions=("*.pdf",),
+        class_path=f"{__name__}.pdf:FitzPdfDocument",
+        capabilities=FITZ_CAPABILITIES | DC.PAGE_LABELS,
+    ),
+    DocumentFormat(
+        format="txt",
+        # Translators: the name of a document file format
+        name=_("Plain Text File"),
+        extensions=("*.txt",),
+        class_path=f"{__name__}.plain_text:PlainTextDocument",
+        capabilities=DC.SINGLE_PAGE | DC.LINKS | DC.STRUCTURED_NAVIGATION,
+    ),
+    DocumentFormat(
+        format="pptx",
+        # Translators: the name of a document file format
+        name=_("PowerPoint Presentation"),
+        extensions=("*.pptx",),
+        class_path=f"{__name__}.powerpoint:PowerpointPresentation",
+        capabilities=(
+            DC.TOC_TREE | DC.METADATA | DC.STRUCTURED_NAVIGATION | DC.LINKS | DC.TEXT_STYLE
+        ),
+    ),
+    DocumentFormat(
+        format="docx",
+        # Translators: the name of a document file format
+        name=_("Word Document"),
+        extensions=("*.docx",),
+        class_path=f"{__name__}.word:WordDocument",
+        capabilities=HTML_CAPABILITIES,
+    ),
+    DocumentFormat(
+        format="doc",
+        # Translators: the name of a document file format
+        name=_("Word 97 - 2003 Document"),
+        extensions=("*.doc",),
+        class_path=f"{__name__}.word:Word97Document",
+        capabilities=DC.ASYNC_READ,
+        requirement=_pandoc_is_installed,
+    ),
+)
+
+_LAZY_DOCUMENT_CLASSES = {
+    document_format.class_name: document_format for document_format in DOCUMENT_FORMATS
+}
+
+
+def __getattr__(name):
+    # The document classes are importable from here, without importing all of them at once
+    if (document_format := _LAZY_DOCUMENT_CLASSES.get(name)) is not None:
+        return document_format.load()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+for _document_format in DOCUMENT_FORMATS:
+    document_formats.register(_document_format)
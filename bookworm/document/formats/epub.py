@@ -5,9 +5,12 @@ from __future__ import annotations
 import collections.abc
 import itertools
 import os
+import posixpath
 import string
+import threading
+import zipfile
 from contextlib import suppress
-from functools import cached_property, lru_cache
+from functools import cached_property
 from io import StringIO
 from pathlib import Path, PurePosixPath
 from urllib import parse as urllib_parse
@@ -17,29 +20,127 @@ import ebooklib
 import ebooklib.epub
 import fitz
 import more_itertools
+import msgpack
 from diskcache import Cache
 from lxml import etree as lxml_etree
 from lxml import html as lxml_html
 from selectolax.parser import HTMLParser
 
+from bookworm.concurrency import threaded_worker
 from bookworm.document import cache_utils
 from bookworm.i18n import LocaleInfo
 from bookworm.image_io import ImageIO
 from bookworm.logger import logger
 from bookworm.paths import home_data_path
+from bookworm.signals import document_content_extended
 from bookworm.structured_text import TextRange
-from bookworm.structured_text.structured_html_parser import StructuredHtmlParser
-from bookworm.utils import format_datetime, is_external_url
+from bookworm.structured_text.structured_html_parser import StructuredHtmlSnapshot
+from bookworm.utils import NEWLINE, format_datetime, is_external_url
 
 from .. import SINGLE_PAGE_DOCUMENT_PAGER, BookMetadata, ChangeDocument
 from .. import DocumentCapability as DC
+from .. import DocumentInfo
 from .. import DocumentError, LinkTarget, Section, SinglePageDocument, TreeStackBuilder
+from ..section_index import SectionIntervalIndex
+from ..serde import dump_toc_tree, load_toc_tree
 
 log = logger.getChild(__name__)
 HTML_FILE_EXTS = {
     ".html",
     ".xhtml",
 }
+EPUB_CONTAINER_NAMESPACE = "urn:oasis:names:tc:opendocument:xmlns:container"
+EPUB_OPF_NAMESPACE = "http://www.idpf.org/2007/opf"
+DUBLIN_CORE_NAMESPACE = "http://purl.org/dc/elements/1.1/"
+# Bump this whenever a change to the parser or to `parse_epub`
+# invalidates the structures stored in the parsed structure cache
+PARSED_STRUCTURE_CACHE_VERSION = 2
+
+
+class EpubChapterwiseStructure:
+    """
+    Assembles the structure of an epub book from the structures of its
+    individual chapters, which are appended in reading order as they get parsed.
+    Readers always see a consistent snapshot of the chapters added so far.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._text_parts = []
+        self._text = ""
+        self.text_length = 0
+        self.semantic_elements = {}
+        self.styled_elements = {}
+        self.html_id_ranges = {}
+        self.link_targets = {}
+        self.table_markup = []
+
+    def __len__(self):
+        return self.text_length
+
+    def append(self, chapter: StructuredHtmlSnapshot) -> tuple[int, str]:
+        """Splice the given chapter at the end. Returns the start position and the added text."""
+        with self._lock:
+            added_text = chapter.get_text()
+            if self._text_parts:
+                added_text = NEWLINE + added_text
+            start = self.text_length
+            chapter_length = len(chapter.get_text())
+            offset = start + (len(added_text) - chapter_length)
+            # Ranges may reach past the chapter's stripped text by a trailing newline
+            shift = lambda rng: (
+                min(rng[0], chapter_length) + offset,
+                min(rng[1], chapter_length) + offset,
+            )
+            # Replace rather than mutate the containers, so that readers
+            # iterating over them from other threads are not disturbed
+            self.semantic_elements = self._merge_ranges(
+                self.semantic_elements, chapter.semantic_elements, shift
+            )
+            self.styled_elements = self._merge_ranges(
+                self.styled_elements, chapter.styled_elements, shift
+            )
+            self.html_id_ranges = self.html_id_ranges | {
+                html_id: shift(rng) for html_id, rng in chapter.html_id_ranges.items()
+            }
+            self.link_targets = self.link_targets | {
+                shift(rng): href for rng, href in chapter.link_targets.items()
+            }
+            self.table_markup = [*self.table_markup, *chapter.table_markup]
+            self._text_parts.append(added_text)
+            self.text_length += len(added_text)
+            self._text = None
+            return start, added_text
+
+    @staticmethod
+    def _merge_ranges(existing, new, shift):
+        merged = {key: list(value) for key, value in existing.items()}
+        for key, ranges in new.items():
+            merged.setdefault(key, []).extend(shift(rng) for rng in ranges)
+        return merged
+
+    def get_text(self) -> str:
+        with self._lock:
+            if self._text is None:
+                self._text = "".join(self._text_parts)
+            return self._text
+
+    def get_table_markup(self, table_index: int) -> str:
+        return self.table_markup[table_index]
+
+    def to_snapshot(self) -> StructuredHtmlSnapshot:
+        with self._lock:
+            return StructuredHtmlSnapshot(
+                text=self.get_text(),
+                semantic_elements=self.semantic_elements,
+                styled_elements=self.styled_elements,
+                html_id_ranges=self.html_id_ranges,
+                link_targets=self.link_targets,
+                table_markup=self.table_markup,
+            )
+
+    def dumps(self) -> bytes:
+        return self.to_snapshot().dumps()
 
 
 class EpubDocument(SinglePageDocument):
@@ -56,19 +157,145 @@ class EpubDocument(SinglePageDocument):
         | DC.ASYNC_READ
         | DC.LINKS
         | DC.INTERNAL_ANCHORS
+        | DC.PROGRESSIVE_READ
     )
+    _read_progressively = False
 
     def read(self):
         super().read()
-        self.epub = ebooklib.epub.read_epub(self.get_file_system_path())
+        self._is_fully_loaded = True
+        if self.uri.view_args.get("progressive_read"):
+            self._read_progressively = True
+        if self._shared_text is not None:
+            # Unpickled in a worker process, which only needs the published text
+            return
+        if self.load_cached_structure():
+            return
+        if self._read_progressively:
+            self.start_progressive_read()
+            return
         self.html_content = self.html_content
-        self.structure = StructuredHtmlParser.from_string(self.html_content)
+        self.structure = StructuredHtmlSnapshot.from_string(self.html_content)
         self.toc = self.parse_epub()
+        self.store_cached_structure()
+
+    def __getstate__(self) -> dict:
+        state = super().__getstate__()
+        state["_read_progressively"] = self._read_progressively
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        # Worker processes need the full text
+        super().__setstate__(state)
+        self.wait_until_loaded()
+
+    def close(self):
+        self._progressive_read_cancelled = True
+        super().close()
+
+    def start_progressive_read(self):
+        """
+        Parse the book chapter by chapter. Chapters are parsed in reading order
+        until the first non-empty one is available, and the rest are
+        parsed in the background and spliced into the document as they finish.
+        """
+        self._is_fully_loaded = False
+        self._progressive_read_cancelled = False
+        self._progressive_read_condition = threading.Condition()
+        self._failed_chapters = []
+        self.structure = EpubChapterwiseStructure()
+        self.toc = self.build_toc_tree()
+        chapters = iter(self.epub_html_items)
+        for item in chapters:
+            self.add_chapter(item)
+            if len(self.structure):
+                break
+        threaded_worker.submit(self._parse_remaining_chapters, chapters)
+
+    def _parse_remaining_chapters(self, chapters):
+        try:
+            for item in chapters:
+                if self._progressive_read_cancelled:
+                    return
+                self.add_chapter(item)
+            with self._progressive_read_condition:
+                self.resolve_toc_text_ranges(self.toc)
+                self._invalidate_section_lookup()
+            if self._failed_chapters:
+                # Do not serve the incomplete text from the cache on later opens
+                log.warning(
+                    f"Not caching the structure, failed to parse: {self._failed_chapters}"
+                )
+            else:
+                self.store_cached_structure()
+        except Exception:
+            log.exception("Failed to parse the chapters of the epub", exc_info=True)
+        finally:
+            with self._progressive_read_condition:
+                self._is_fully_loaded = True
+                self._progressive_read_condition.notify_all()
+
+    def add_chapter(self, item):
+        try:
+            chapter_html = self.build_html(
+                title=self.epub.title,
+                body_content=self.prefix_html_ids(item.file_name, item.content),
+            )
+            chapter = StructuredHtmlSnapshot.from_string(chapter_html)
+        except Exception:
+            log.exception(f"Failed to parse chapter {item.file_name}", exc_info=True)
+            self._failed_chapters.append(item.file_name)
+            return
+        with self._progressive_read_condition:
+            start, added_text = self.structure.append(chapter)
+            self.resolve_toc_text_ranges(self.toc, is_final=False)
+            self._invalidate_section_lookup()
+            self._progressive_read_condition.notify_all()
+        if added_text:
+            document_content_extended.send(self, start=start, text=added_text)
+
+    def _invalidate_section_lookup(self):
+        self.__dict__.pop("start_positions_for_sections", None)
+        self.__dict__.pop("text_section_index", None)
+
+    def wait_for_position(self, pos):
+        if self._is_fully_loaded:
+            return
+        with self._progressive_read_condition:
+            self._progressive_read_condition.wait_for(
+                lambda: self._is_fully_loaded or len(self.structure) > pos
+            )
+
+    def wait_until_loaded(self):
+        if self._is_fully_loaded:
+            return
+        with self._progressive_read_condition:
+            self._progressive_read_condition.wait_for(lambda: self._is_fully_loaded)
+
+    def _compute_content_hash(self):
+        self.wait_until_loaded()
+        return super()._compute_content_hash()
+
+    def can_compute_content_hash_quickly(self):
+        return self._is_fully_loaded
+
+    def search(self, request):
+        self.wait_until_loaded()
+        yield from super().search(request)
 
     @property
     def toc_tree(self):
         return self.toc
 
+    @cached_property
+    def epub(self):
+        # Not needed when the parsed structure and metadata are loaded from the cache
+        return ebooklib.epub.read_epub(self.get_file_system_path())
+
+    @cached_property
+    def epub_title(self):
+        return self.epub.title
+
     @cached_property
     def epub_metadata(self):
         info = {}
@@ -78,7 +305,10 @@ class EpubDocument(SinglePageDocument):
 
     @cached_property
     def metadata(self):
-        info = self.epub_metadata
+        return self._make_book_metadata(self.epub_metadata, self.epub_title, self.language)
+
+    @staticmethod
+    def _make_book_metadata(info: dict, title: str, language: LocaleInfo) -> BookMetadata:
         author = info.get("creator", "") or info.get("author", "")
         try:
             desc = HTMLParser(info.get("description", "")).text()
@@ -96,16 +326,16 @@ class EpubDocument(SinglePageDocument):
         if pubdate := dateparser.parse(
             date_value,
             languages=[
-                self.language.two_letter_language_code,
+                language.two_letter_language_code,
             ],
         ):
-            publish_date = self.language.format_datetime(
+            publish_date = language.format_datetime(
                 pubdate, date_only=True, format="long", localized=True
             )
         else:
             publish_date = "Unknown Publication Date"
         return BookMetadata(
-            title=self.epub.title,
+            title=title,
             author=author.removeprefix("By ").strip(),
             description=desc,
             publication_year=publish_date,
@@ -169,12 +399,116 @@ class EpubDocument(SinglePageDocument):
                 "Failed to obtain the cover image for epub document.", exc_info=True
             )
 
-    @lru_cache(maxsize=10)
+    @classmethod
+    def probe(cls, uri):
+        """Read the metadata and the cover from the package document (OPF) only."""
+        with zipfile.ZipFile(uri.path) as epub_zip:
+            container = lxml_etree.fromstring(epub_zip.read("META-INF/container.xml"))
+            opf_path = container.find(f".//{{{EPUB_CONTAINER_NAMESPACE}}}rootfile").get(
+                "full-path"
+            )
+            package = lxml_etree.fromstring(epub_zip.read(opf_path))
+            opf_folder = posixpath.dirname(opf_path)
+            get_item_path = lambda item: posixpath.normpath(
+                posixpath.join(opf_folder, urllib_parse.unquote(item.get("href", "")))
+            )
+            info = {}
+            for element in package.iterfind(
+                f"{{{EPUB_OPF_NAMESPACE}}}metadata/{{{DUBLIN_CORE_NAMESPACE}}}*"
+            ):
+                if element.text and element.text.strip():
+                    info.setdefault(lxml_etree.QName(element).localname, element.text.strip())
+            manifest = {
+                item.get("id"): item
+                for item in package.iterfind(
+                    f"{{{EPUB_OPF_NAMESPACE}}}manifest/{{{EPUB_OPF_NAMESPACE}}}item"
+                )
+            }
+            first_chapter = more_itertools.first(
+                (
+                    get_item_path(manifest[itemref.get("idref")])
+                    for itemref in package.iterfind(
+                        f"{{{EPUB_OPF_NAMESPACE}}}spine/{{{EPUB_OPF_NAMESPACE}}}itemref"
+                    )
+                    if itemref.get("idref") in manifest
+                ),
+                None,
+            )
+            read_first_chapter = lambda: epub_zip.read(first_chapter)
+            language = None
+            if (epub_lang := info.get("language")) is not None:
+                try:
+                    language = LocaleInfo(epub_lang)
+                except:
+                    log.exception(
+                        f"Failed to parse epub language `{epub_lang}`", exc_info=True
+                    )
+            if language is None:
+                # Detect the language from the first chapter only
+                language = LocaleInfo("en")
+                if first_chapter is not None:
+                    with suppress(KeyError):
+                        language = cls.get_language(
+                            read_first_chapter().decode("utf-8", errors="replace"),
+                            is_html=True,
+                        )
+            cover_image = None
+            try:
+                if (cover_item := cls._find_cover_item(package, manifest)) is not None:
+                    cover_image = ImageIO.from_bytes(epub_zip.read(get_item_path(cover_item)))
+                elif first_chapter is not None:
+                    # Render the first chapter, rather than laying out the whole book
+                    with fitz.open(stream=read_first_chapter(), filetype="xhtml") as chapter:
+                        cover_image = ImageIO.from_fitz_pixmap(chapter.get_page_pixmap(0))
+            except:
+                log.warning(
+                    "Failed to obtain the cover image for epub document.", exc_info=True
+                )
+        return DocumentInfo.from_book_metadata(
+            uri=uri,
+            metadata=cls._make_book_metadata(info, info.get("title", ""), language),
+            language=language,
+            cover_image=cover_image,
+        )
+
+    @staticmethod
+    def _find_cover_item(package, manifest):
+        images = [
+            item
+            for item in manifest.values()
+            if item.get("media-type", "").startswith("image/")
+        ]
+        # EPUB 3
+        for item in images:
+            if "cover-image" in item.get("properties", "").split():
+                return item
+        # EPUB 2
+        cover_meta = package.find(
+            f"{{{EPUB_OPF_NAMESPACE}}}metadata/{{{EPUB_OPF_NAMESPACE}}}meta[@name='cover']"
+        )
+        if (cover_meta is not None) and (
+            (item := manifest.get(cover_meta.get("content"))) in images
+        ):
+            return item
+        return more_itertools.first(
+            (item for item in images if "cover" in item.get("href", "").lower()), None
+        )
+
+    @cached_property
+    def text_section_index(self):
+        # The first section whose range contains a position takes precedence
+        return SectionIntervalIndex(
+            reversed(
+                [
+                    (start, end, section)
+                    for (start, end), section in self.start_positions_for_sections
+                ]
+            ),
+            default=self.toc_tree,
+        )
+
     def get_section_at_position(self, pos):
-        for (start, end), section in self.start_positions_for_sections:
-            if start <= pos < end:
-                return section
-        return self.toc_tree
+        return self.text_section_index.get(pos)
 
     @cached_property
     def epub_html_items(self) -> tuple[str]:
@@ -217,18 +551,18 @@ class EpubDocument(SinglePageDocument):
         )
 
     def parse_epub(self):
+        root = self.build_toc_tree()
+        self.resolve_toc_text_ranges(root)
+        return root
+
+    def build_toc_tree(self):
         root = Section(
             title=self.metadata.title,
             pager=SINGLE_PAGE_DOCUMENT_PAGER,
             level=1,
-            text_range=TextRange(0, len(self.get_content())),
+            text_range=TextRange(0, 0),
         )
         log.debug(root)
-        id_ranges = {
-            urllib_parse.unquote(key): value
-            for (key, value) in self.structure.html_id_ranges.items()
-        }
-        log.debug(list(id_ranges.keys()))
         stack = TreeStackBuilder(root)
         toc_entries = self.epub.toc
         if not isinstance(toc_entries, collections.abc.Iterable):
@@ -236,10 +570,39 @@ class EpubDocument(SinglePageDocument):
                 toc_entries,
             ]
         for sect in self.add_toc_entry(toc_entries, root):
+            stack.push(sect)
+        return root
+
+    def resolve_toc_text_ranges(self, root, is_final=True):
+        """
+        Set the text range of each section based on the position of its html id.
+        While the book is still being parsed (`is_final` is False), sections whose
+        ids have not been parsed yet are given a provisional range.
+        """
+        # Update the root range in place, since the search dialog holds a reference to it
+        root.text_range.stop = len(self.get_content())
+        id_ranges = {
+            urllib_parse.unquote(key): value
+            for (key, value) in self.structure.html_id_ranges.items()
+        }
+        log.debug(list(id_ranges.keys()))
+        previous = root
+        for sect in root.iter_children():
             href = urllib_parse.unquote(sect.data["href"])
             try:
-                sect.text_range = TextRange(*id_ranges[href])
+                text_range = id_ranges[href]
             except KeyError:
+                if not is_final:
+                    text_range = id_ranges.get(href.split("#")[0])
+                    if text_range is None:
+                        text_range = (
+                            previous.text_range.astuple()
+                            if previous is not root
+                            else (0, 0)
+                        )
+                    sect.text_range = TextRange(*text_range)
+                    previous = sect
+                    continue
                 # Let's start the dance!
                 text_range = None
                 # Strip  punctuation as ebooklib, for some reason, strips those from html_ids
@@ -257,13 +620,12 @@ class EpubDocument(SinglePageDocument):
                         f"Could not determine the starting position for href: {href} and section: {sect!r}"
                     )
                     text_range = (
-                        stack.top.text_range.astuple()
-                        if stack.top is not root
+                        previous.text_range.astuple()
+                        if previous is not root
                         else (0, 0)
                     )
-                sect.text_range = TextRange(*text_range)
-            stack.push(sect)
-        return root
+            sect.text_range = TextRange(*text_range)
+            previous = sect
 
     @cached_property
     def start_positions_for_sections(self):
@@ -333,6 +695,58 @@ class EpubDocument(SinglePageDocument):
         cache_utils.set_document_modified_time(cache_key, document_path, cache)
         return html_content
 
+    @cached_property
+    def structure_cache_key(self):
+        # Chapter by chapter parsing yields slightly different text offsets
+        layout = "chapterwise" if self._read_progressively else "whole"
+        return f"{self.file_fingerprint}:v{PARSED_STRUCTURE_CACHE_VERSION}:{layout}"
+
+    @cached_property
+    def text_cache_key(self):
+        return self.structure_cache_key
+
+    def load_cached_structure(self) -> bool:
+        """
+        Try to restore the parsed text, structure, TOC and metadata of this book from the cache.
+        Return True if the cached structure was loaded successfully.
+        """
+        with Cache(self._get_structure_cache_directory()) as cache:
+            cached_structure = cache.get(self.structure_cache_key)
+        if cached_structure is None:
+            return False
+        try:
+            structure_data, toc_data, epub_metadata, epub_title, language = msgpack.loads(
+                cached_structure
+            )
+            self.structure = StructuredHtmlSnapshot.loads(structure_data)
+            self.toc = load_toc_tree(toc_data)
+            self.epub_metadata = epub_metadata
+            self.epub_title = epub_title
+            self.language = LocaleInfo(language)
+        except Exception:
+            log.exception(
+                "Failed to load the parsed structure of the epub from the cache",
+                exc_info=True,
+            )
+            return False
+        return True
+
+    def store_cached_structure(self):
+        cached_structure = msgpack.dumps(
+            [
+                self.structure.dumps(),
+                dump_toc_tree(self.toc),
+                self.epub_metadata,
+                self.epub_title,
+                self.language.identifier,
+            ]
+        )
+        with Cache(
+            self._get_structure_cache_directory(),
+            eviction_policy="least-recently-used",
+        ) as cache:
+            cache.set(self.structure_cache_key, cached_structure)
+
     def prefix_html_ids(self, filename, html):
         tree = lxml_html.fromstring(html)
         tree.make_links_absolute(
@@ -399,3 +813,6 @@ class EpubDocument(SinglePageDocument):
 
     def _get_cache_directory(self):
         return os.fspath(home_data_path(".parsed_epub_cache"))
+
+    def _get_structure_cache_directory(self):
+        return os.fspath(home_data_path(".parsed_epub_structure_cache"))
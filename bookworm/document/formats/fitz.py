@@ -2,8 +2,9 @@
 
 from __future__ import annotations
 
+import threading
 import zipfile
-from functools import cached_property, lru_cache
+from functools import cached_property
 from hashlib import md5
 from pathlib import Path
 from tempfile import TemporaryDirectory
@@ -22,12 +23,16 @@ from .. import DocumentCapability as DC
 from .. import (
     DocumentEncryptedError,
     DocumentError,
+    DocumentIOError,
     DocumentRestrictedError,
     Pager,
     Section,
 )
+from ..page_cache import cached_page_method
 
 log = logger.getChild(__name__)
+# A rough estimate of the memory held by a loaded MuPDF page
+FITZ_PAGE_MEMORY_ESTIMATE = 64 * 1024
 # fitz.Tools().mupdf_display_errors(False)
 
 
@@ -50,12 +55,23 @@ class FitzPage(BasePage):
         )
         return ftfy.fix_text(text, config)
 
+    @property
+    def page_access_lock(self) -> threading.RLock:
+        if (document := self.document) is None:
+            raise DocumentIOError(f"The document of page {self.index} is no longer available")
+        return document.page_access_lock
+
     def get_text(self):
-        return self.normalize_text(self._text_from_page(self._fitz_page))
+        with self.page_access_lock:
+            return self.normalize_text(self._text_from_page(self._fitz_page))
+
+    def get_memory_footprint(self):
+        return super().get_memory_footprint() + FITZ_PAGE_MEMORY_ESTIMATE
 
     def get_image(self, zoom_factor=1.0):
         mat = fitz.Matrix(zoom_factor, zoom_factor)
-        pix = self._fitz_page.get_pixmap(matrix=mat, alpha=False)
+        with self.page_access_lock:
+            pix = self._fitz_page.get_pixmap(matrix=mat, alpha=False)
         return ImageIO(data=pix.samples, width=pix.width, height=pix.height)
 
 
@@ -74,15 +90,19 @@ class FitzDocument(BaseDocument):
         | DC.LINKS
     )
 
-    @lru_cache(maxsize=1000)
+    @cached_page_method
     def get_page(self, index: int) -> FitzPage:
-        return FitzPage(self, index)
+        with self.page_access_lock:
+            return FitzPage(self, index)
 
     def __len__(self) -> int:
         return self._ebook.page_count
 
     def read(self, filetype=None):
         self.filename = self.get_file_system_path()
+        # MuPDF is not thread-safe, and pages may be prefetched in the background.
+        # The lock is created before any page could be accessed from another thread
+        self.page_access_lock = threading.RLock()
         try:
             self._ebook = fitz.open(self.filename, filetype=filetype)
             super().read()
@@ -97,8 +117,9 @@ class FitzDocument(BaseDocument):
     def close(self):
         if self._ebook is None:
             return
-        self._ebook.close()
-        self._ebook = None
+        with self.page_access_lock:
+            self._ebook.close()
+            self._ebook = None
         super().close()
 
     @cached_property
@@ -156,10 +177,14 @@ class FitzDocument(BaseDocument):
 
     @cached_property
     def metadata(self):
-        meta = self._ebook.metadata
+        return self.get_book_metadata(self._ebook, self.filename)
+
+    @staticmethod
+    def get_book_metadata(fitz_document, filename) -> BookMetadata:
+        meta = fitz_document.metadata
         to_str = lambda value: "" if value is None else ftfy.fix_encoding(value).strip()
         return BookMetadata(
-            title=to_str(meta["title"]) or Path(self.filename).stem,
+            title=to_str(meta["title"]) or Path(filename).stem,
             author=to_str(meta["author"]),
             publication_year=to_str(meta["creationDate"]),
         )
@@ -2,7 +2,6 @@
 
 from __future__ import annotations
 
-from concurrent.futures import ProcessPoolExecutor
 from contextlib import contextmanager
 from functools import cached_property
 from pathlib import Path
@@ -14,6 +13,7 @@ from more_itertools import first as get_first_element
 from more_itertools import zip_offset
 from yarl import URL
 
+from bookworm.concurrency import recycled_process_worker
 from bookworm.http_tools import HttpResource
 from bookworm.logger import logger
 from bookworm.structured_text import (
@@ -28,6 +28,7 @@ from bookworm.utils import (
     TextContentDecoder,
     escape_html,
     is_external_url,
+    lazy_module,
     remove_excess_blank_lines,
 )
 
@@ -44,6 +45,7 @@ from .. import (
 )
 
 log = logger.getChild(__name__)
+trafilatura = lazy_module("trafilatura")
 # Default cache timeout
 EXPIRE_TIMEOUT = 7 * 24 * 60 * 60
 
@@ -54,9 +56,6 @@ def get_clean_html(html_string: str) -> (str, BookMetadata):
     # trafilatura has a memory leak issue
     # Therefore, we run it in a separate process
 
-    import trafilatura
-    from trafilatura.external import JT_STOPLIST, custom_justext
-
     html_string = StructuredHtmlParser.normalize_html(html_string)
 
     # Extract metadata
@@ -174,18 +173,16 @@ class BaseHtmlDocument(SinglePageDocument):
                 return LinkTarget(url=href, is_external=False, position=anchor)
 
     def parse_to_clean_text(self):
-        with ProcessPoolExecutor(max_workers=1) as executor:
-            task = executor.submit(get_clean_html, self.html_string)
-            try:
-                result = task.result()
-            except Exception as e:
-                log.exception(
-                    "Failed to parse html string for clean view", exc_info=True
-                )
-                raise DocumentIOError from e
-            html_content, metadata = result
-            self._metainfo = metadata
-            return self.parse_text_and_structure(html_content)
+        # Trafilatura leaks memory, so its worker process exits after the parse
+        task = recycled_process_worker.submit(get_clean_html, self.html_string)
+        try:
+            result = task.result()
+        except Exception as e:
+            log.exception("Failed to parse html string for clean view", exc_info=True)
+            raise DocumentIOError from e
+        html_content, metadata = result
+        self._metainfo = metadata
+        return self.parse_text_and_structure(html_content)
 
     def parse_to_full_text(self):
         html = lxml_html.fromstring(self.html_string)
@@ -3,7 +3,6 @@
 from __future__ import annotations
 
 import sys
-from functools import lru_cache
 
 from odf import opendocument
 
@@ -31,6 +30,7 @@ from bookworm.utils import NEWLINE, escape_html, generate_file_md5
 from .. import BaseDocument, BasePage, BookMetadata, ChangeDocument
 from .. import DocumentCapability as DC
 from .. import DocumentError, DummyDocument, Pager, Section, TreeStackBuilder
+from ..page_cache import cached_page_method
 
 log = logger.getChild(__name__)
 
@@ -112,6 +112,9 @@ class OdpSlide(BasePage):
     def get_text(self):
         return self.text
 
+    def get_memory_footprint(self):
+        return super().get_memory_footprint() + sys.getsizeof(self.text)
+
     def get_style_info(self) -> dict:
         return self.style_info
 
@@ -138,7 +141,7 @@ class OdfPresentation(BaseDocument):
     def __len__(self):
         return self.num_slides
 
-    @lru_cache(maxsize=1000)
+    @cached_page_method
     def get_page(self, index):
         return OdpSlide(self, index)
 
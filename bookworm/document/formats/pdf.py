@@ -4,8 +4,9 @@ from __future__ import annotations
 
 import gc
 from datetime import datetime
-from functools import cached_property, lru_cache
+from functools import cached_property
 
+import fitz
 import ftfy
 import regex
 from dateutil.tz import tzoffset, tzutc
@@ -15,15 +16,19 @@ from pyxpdf.xpdf import TextControl as XPdfTextControl
 from pyxpdf.xpdf import TextOutput as XPdfTextOutput
 from pyxpdf_data import generate_xpdfrc
 
+from bookworm.image_io import ImageIO
 from bookworm.logger import logger
 from bookworm.paths import data_path
 from bookworm.utils import format_datetime
 
 from .. import DocumentCapability as DC
-from .. import ReadingMode
+from .. import DocumentInfo, ReadingMode
+from ..page_cache import cached_page_method
 from .fitz import FitzDocument, FitzPage
 
 log = logger.getChild(__name__)
+# The size of the cover image rendered when probing a pdf document
+PROBED_COVER_IMAGE_SIZE = 512
 XPDF_CONFIG = dict(text_keep_tiny=False, text_eol="unix", text_page_breaks=False)
 BOOKWORM_READING_MODE_TO_XPDF_READING_MODE = {
     ReadingMode.DEFAULT: "reading",
@@ -54,7 +59,8 @@ class FitzPdfPage(FitzPage):
         self.xpdf_text_output = xpdf_text_output
 
     def get_text(self):
-        text = self.xpdf_text_output.get(self.index)[:-1]
+        with self.page_access_lock:
+            text = self.xpdf_text_output.get(self.index)[:-1]
         return self.normalize_text(text)
 
     def normalize_text(self, text):
@@ -85,9 +91,10 @@ class FitzPdfDocument(FitzDocument):
         ReadingMode.PHYSICAL,
     )
 
-    @lru_cache(maxsize=1000)
+    @cached_page_method
     def get_page(self, index: int) -> FitzPage:
-        return FitzPdfPage(self, index, xpdf_text_output=self.xpdf_text_output)
+        with self.page_access_lock:
+            return FitzPdfPage(self, index, xpdf_text_output=self.xpdf_text_output)
 
     @cached_property
     def xpdf_text_output(self):
@@ -123,21 +130,51 @@ class FitzPdfDocument(FitzDocument):
     @cached_property
     def metadata(self):
         meta = super().metadata
-        if pub_year := meta.publication_year:
-            try:
-                parsed_creation_date = self.language.format_datetime(
-                    self._parse_pdf_creation_date(pub_year),
-                    format="medium",
-                    localized=True,
-                    date_only=False,
-                )
-            except:
-                log.exception("Failed to parse pdf creation date", exc_info=True)
-            else:
-                meta.creation_date = parsed_creation_date
-                meta.publication_year = ""
+        if meta.publication_year:
+            self._set_creation_date(meta, self.language)
         return meta
 
+    @classmethod
+    def _set_creation_date(cls, meta, language):
+        try:
+            parsed_creation_date = language.format_datetime(
+                cls._parse_pdf_creation_date(meta.publication_year),
+                format="medium",
+                localized=True,
+                date_only=False,
+            )
+        except:
+            log.exception("Failed to parse pdf creation date", exc_info=True)
+        else:
+            meta.creation_date = parsed_creation_date
+            meta.publication_year = ""
+
+    @classmethod
+    def probe(cls, uri):
+        """Read the info dict, and render the first page at thumbnail resolution."""
+        with fitz.open(uri.path, filetype="pdf") as fitz_document:
+            if fitz_document.is_encrypted or not fitz_document.page_count:
+                # Let the full read report the problem
+                return super().probe(uri)
+            first_page = fitz_document[0]
+            language = cls.get_language(first_page.get_text(), is_html=False)
+            meta = cls.get_book_metadata(fitz_document, uri.path)
+            if meta.publication_year:
+                cls._set_creation_date(meta, language)
+            zoom_factor = PROBED_COVER_IMAGE_SIZE / max(
+                first_page.rect.width, first_page.rect.height, 1
+            )
+            pixmap = first_page.get_pixmap(
+                matrix=fitz.Matrix(zoom_factor, zoom_factor), alpha=False
+            )
+            return DocumentInfo.from_book_metadata(
+                uri=uri,
+                metadata=meta,
+                language=language,
+                number_of_pages=fitz_document.page_count,
+                cover_image=ImageIO.from_fitz_pixmap(pixmap),
+            )
+
     @staticmethod
     def _parse_pdf_creation_date(date_str: str) -> datetime:
         match = PDF_DATE_PATTERN.match(date_str)
@@ -2,7 +2,8 @@
 
 from __future__ import annotations
 
-from functools import cached_property, lru_cache
+import sys
+from functools import cached_property
 
 import pptx
 from pptx.enum.shapes import MSO_SHAPE_TYPE, PP_PLACEHOLDER
@@ -15,6 +16,7 @@ from bookworm.utils import NEWLINE
 from .. import BaseDocument, BasePage, BookMetadata
 from .. import DocumentCapability as DC
 from .. import DocumentError, Pager, Section, TreeStackBuilder
+from ..page_cache import cached_page_method
 
 log = logger.getChild(__name__)
 PP_HEADING_TYPES = {
@@ -92,6 +94,9 @@ class PowerpointSlide(BasePage):
     def get_text(self):
         return self.text_buffer.getvalue()
 
+    def get_memory_footprint(self):
+        return super().get_memory_footprint() + sys.getsizeof(self.get_text())
+
     def get_style_info(self) -> dict:
         return self.style_elements
 
@@ -121,7 +126,7 @@ class PowerpointPresentation(BaseDocument):
     def __len__(self):
         return self.num_slides
 
-    @lru_cache(maxsize=1000)
+    @cached_page_method
     def get_page(self, index):
         return PowerpointSlide(self.slides[index], self, index)
 
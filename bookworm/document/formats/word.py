@@ -7,6 +7,7 @@ import os
 import shutil
 import subprocess
 import tempfile
+import zipfile
 from io import BytesIO
 from pathlib import Path
 
@@ -15,19 +16,22 @@ import msoffcrypto
 import msoffcrypto.exceptions
 from diskcache import Cache
 from docx import Document as DocxDocumentReader
+from lxml import etree
 from selectolax.parser import HTMLParser
 
 from bookworm import app
 from bookworm.concurrency import process_worker, threaded_worker
 from bookworm.document import cache_utils
 from bookworm.document.uri import DocumentUri
+from bookworm.i18n import LocaleInfo
 from bookworm.logger import logger
 from bookworm.paths import app_path, home_data_path
 from bookworm.utils import NEWLINE, escape_html, generate_file_md5
 
 from .. import ChangeDocument
+from .. import BookMetadata
 from .. import DocumentCapability as DC
-from .. import DocumentEncryptedError, DocumentError, DummyDocument
+from .. import DocumentEncryptedError, DocumentError, DocumentInfo, DummyDocument
 from .html import BaseHtmlDocument
 from .pandoc import DocbookDocument
 
@@ -37,6 +41,13 @@ TAGS_TO_REMOVE = [
     "img",
     "style",
 ]
+DOCX_CORE_PROPERTIES_NAMESPACES = {
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "dcterms": "http://purl.org/dc/terms/",
+}
+DOCX_TEXT_TAG = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t"
+# The length of the text used to detect the language of a probed document
+LANGUAGE_DETECTION_SAMPLE_LENGTH = 2000
 
 
 class WordDocument(BaseHtmlDocument):
@@ -62,6 +73,57 @@ class WordDocument(BaseHtmlDocument):
     def get_html(self):
         return self.__html_content
 
+    @classmethod
+    def probe(cls, uri):
+        """Read the core properties (docProps/core.xml), without converting the document."""
+        try:
+            docx_zip = zipfile.ZipFile(uri.path)
+        except zipfile.BadZipFile:
+            # Encrypted documents are not zip packages
+            return super().probe(uri)
+        with docx_zip:
+            props = {}
+            with contextlib.suppress(KeyError):
+                core_props = etree.fromstring(docx_zip.read("docProps/core.xml"))
+                for name in ("dc:title", "dc:creator", "dc:description", "dc:language"):
+                    element = core_props.find(name, DOCX_CORE_PROPERTIES_NAMESPACES)
+                    if (element is not None) and element.text:
+                        props[name.split(":")[1]] = element.text.strip()
+            language = None
+            if doc_lang := props.get("language"):
+                try:
+                    language = LocaleInfo(doc_lang)
+                except:
+                    log.exception(f"Failed to parse docx language `{doc_lang}`", exc_info=True)
+            if language is None:
+                language = cls.get_language(cls._read_text_sample(docx_zip), is_html=False)
+        doc_title = props.get("title", "")
+        if not doc_title or doc_title.lower() == "word document":
+            doc_title = Path(uri.path).stem.strip()
+        return DocumentInfo.from_book_metadata(
+            uri=uri,
+            metadata=BookMetadata(
+                title=doc_title,
+                author=props.get("creator", ""),
+                description=props.get("description", ""),
+            ),
+            language=language,
+        )
+
+    @staticmethod
+    def _read_text_sample(docx_zip):
+        text_parts = []
+        sample_length = 0
+        with docx_zip.open("word/document.xml") as document_xml:
+            for _event, element in etree.iterparse(document_xml, tag=DOCX_TEXT_TAG):
+                if element.text:
+                    text_parts.append(element.text)
+                    sample_length += len(element.text)
+                    if sample_length >= LANGUAGE_DETECTION_SAMPLE_LENGTH:
+                        break
+                element.clear()
+        return " ".join(text_parts)
+
     def parse_html(self):
         return self.parse_to_full_text()
 
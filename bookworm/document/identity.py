@@ -0,0 +1,128 @@
+# coding: utf-8
+
+"""
+Documents are identified in two tiers. The fingerprint of the raw file is
+cheap to compute, and is used to find the content hash of previously hashed
+files right away. The content hash itself requires extracting the text of the
+whole document, so when it is not known yet, it is computed in the background
+and written back to the stored records of the document once it is ready.
+"""
+
+from __future__ import annotations
+
+from functools import partial
+
+from bookworm import typehints as t
+from bookworm.concurrency import TaskPriority, task_scheduler
+from bookworm.logger import logger
+
+from .cache_utils import get_fingerprint_cache
+from .exceptions import DocumentIOError
+
+log = logger.getChild(__name__)
+# Keys of the documents whose content hash is being computed in this process
+_hashes_being_computed = set()
+
+
+def get_content_hash_key(doc) -> str | None:
+    try:
+        return f"content:{doc.text_cache_key}"
+    except (DocumentIOError, OSError):
+        # Not backed by a file, such as virtual documents
+        return None
+
+
+def get_stored_content_hash(doc, default: t.Any = None) -> str | None:
+    if (key := get_content_hash_key(doc)) is None:
+        return default
+    with get_fingerprint_cache() as cache:
+        return cache.get(key, default)
+
+
+def store_content_hash(doc, content_hash: str | None) -> None:
+    if (key := get_content_hash_key(doc)) is None:
+        return
+    with get_fingerprint_cache() as cache:
+        cache.set(key, content_hash)
+
+
+def get_content_hash_for_lookup(doc) -> str | None:
+    """
+    Return the content hash of the given document if it is known, or if it
+    can be computed without extracting the text of the whole document.
+    Otherwise, compute it in the background and return None for now.
+    """
+    if doc.can_compute_content_hash_quickly():
+        return doc.get_content_hash()
+    if (key := get_content_hash_key(doc)) is None:
+        return doc.get_content_hash()
+    with get_fingerprint_cache() as cache:
+        is_known = key in cache
+    if is_known:
+        return doc.get_content_hash()
+    compute_content_hash_in_background(doc)
+    return None
+
+
+def compute_content_hash_in_background(doc) -> None:
+    key = get_content_hash_key(doc)
+    if key in _hashes_being_computed:
+        return
+    _hashes_being_computed.add(key)
+    try:
+        future = task_scheduler.process_executor(TaskPriority.INDEXING, group=doc.uri).submit(
+            _compute_content_hash, doc
+        )
+    except RuntimeError:
+        _hashes_being_computed.discard(key)
+        log.debug("Failed to schedule computing the content hash.")
+        return
+    future.add_done_callback(partial(_on_content_hash_computed, key, doc.uri))
+
+
+def _compute_content_hash(doc) -> str | None:
+    """This function runs in a separate process."""
+    try:
+        return doc.get_content_hash()
+    finally:
+        doc.close()
+
+
+def _on_content_hash_computed(key, uri, future):
+    _hashes_being_computed.discard(key)
+    if future.cancelled():
+        return
+    if (exc := future.exception()) is not None:
+        log.error(f"Failed to compute the content hash of the document: {exc!r}")
+        return
+    if (content_hash := future.result()) is not None:
+        store_content_hash_in_records(uri, content_hash)
+
+
+def store_content_hash_in_records(uri, content_hash: str) -> None:
+    """Set the content hash of the stored records of the given document which do not have one."""
+    from bookworm.database.models import (
+        Base,
+        Book,
+        DocumentPositionInfo,
+        PinnedDocument,
+        RecentDocument,
+    )
+
+    # This function may be called from a worker thread, so use a separate session
+    session = Base.session.session_factory()
+    # Records may be stored under the uri of the document with other openner args
+    uri_key = uri.to_key_string()
+    try:
+        for model in (Book, DocumentPositionInfo, RecentDocument, PinnedDocument):
+            session.query(model).filter(
+                model.uri_key == uri_key, model.content_hash.is_(None)
+            ).update(
+                model.get_content_hash_update_values(content_hash), synchronize_session=False
+            )
+        session.commit()
+    except Exception:
+        session.rollback()
+        log.exception("Failed to store the content hash of the document", exc_info=True)
+    finally:
+        session.close()
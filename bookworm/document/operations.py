@@ -2,17 +2,33 @@
 
 """
 Contains generic utility functions for working with documents.
-The functions in this module are usually run in parallel using bookworm.concurrency .QueueProcess.
+The functions in this module are usually run by the document worker processes,
+see `bookworm.concurrency.document_worker_pool`.
 """
 
 from __future__ import annotations
 
-from io import StringIO
+import os
+from collections import deque
+from contextlib import contextmanager, suppress
 
 import attr
 import regex as re
 
+from bookworm.concurrency import TaskPriority, task_scheduler
+
 NEWLINE = "\n"
+# Number of consecutive pages searched by a worker in one go when searching in parallel
+SEARCH_SHARD_SIZE = 25
+# Documents with fewer pages than this are searched or exported in a single process
+PARALLEL_PROCESSING_MIN_PAGES = 100
+# Number of consecutive pages extracted by a worker in one go when exporting in parallel
+EXPORT_SHARD_SIZE = 8
+# Number of shards per worker which may be extracted ahead of the one being written
+EXPORT_WINDOW_PER_WORKER = 2
+EXPORT_WRITE_BUFFER_SIZE = 1024 * 1024
+# The state of the document worker processes
+_document_worker_state = {}
 
 
 @attr.s(auto_attribs=True, slots=True, getstate_setstate=True)
@@ -41,11 +57,11 @@ class SearchResult:
     section: str
 
 
-def search(pattern, text):
-    """Search the given text using a regular expression."""
+def search(pattern, text, pos=None, endpos=None):
+    """Search the given text (optionally between pos and endpos) using a regular expression."""
     snip_reach = 25
     len_text = len(text)
-    for mat in pattern.finditer(text, concurrent=True):
+    for mat in pattern.finditer(text, pos, endpos, concurrent=True):
         start, end = mat.span()
         snip_start = 0 if start <= snip_reach else (start - snip_reach)
         snip_end = len_text if (end + snip_reach) >= len_text else (end + snip_reach)
@@ -56,41 +72,180 @@ def search(pattern, text):
         yield (start, " ".join(snip))
 
 
+@contextmanager
+def _open_export_file(title, target_filename):
+    """
+    Pages are written to a temporary file as soon as they are extracted.
+    The target file is replaced only when the export is complete.
+    """
+    partial_filename = f"{target_filename}.partial"
+    try:
+        with open(
+            partial_filename, "w", encoding="utf8", buffering=EXPORT_WRITE_BUFFER_SIZE
+        ) as file:
+            if file.write(title or ""):
+                file.write(f"{NEWLINE}{'-' * 30}{NEWLINE}")
+            yield file
+        os.replace(partial_filename, target_filename)
+    except BaseException:
+        with suppress(OSError):
+            os.remove(partial_filename)
+        raise
+
+
+def _write_exported_page(file, text):
+    file.write(f"{text}{NEWLINE}\f{NEWLINE}")
+
+
 def export_to_plain_text(doc, target_filename):
-    """This function runs in a separate process."""
+    """This function runs in a document worker process, which keeps the document open."""
+    with _open_export_file(doc.metadata.title, target_filename) as file:
+        for n in range(len(doc)):
+            _write_exported_page(file, doc.get_page_content(n))
+            yield n + 1
+
+
+def export_shared_text_to_plain_text(shared_text, title, target_filename):
+    """
+    Export a single page document from its published text. This function runs in a
+    document worker process, which detaches from the snapshot when the export is done.
+    """
+    with _open_export_file(title, target_filename) as file:
+        _write_exported_page(file, shared_text.get_page_text(0))
+        yield 1
+
+
+def get_export_worker_count(doc) -> int:
+    """Return the number of worker processes to use for exporting the given document."""
+    return _get_worker_count(len(doc), EXPORT_SHARD_SIZE)
+
+
+def export_to_plain_text_in_parallel(doc, target_filename, num_workers):
+    """
+    Extract the pages using a pool of worker processes, and write them to the target
+    file in page order. Only a fixed number of shards may be extracted ahead of the
+    one being written, so memory usage does not grow with the size of the document.
+    Yields the number of pages written so far, like `export_to_plain_text`.
+    """
     total = len(doc)
-    out = StringIO()
-    if out.write(doc.metadata.title or ""):
-        out.write(f"{NEWLINE}{'-' * 30}{NEWLINE}")
+    executor = _get_document_worker_executor(doc)
+    shard_starts = iter(range(0, total, EXPORT_SHARD_SIZE))
+    pending_shards = deque()
+
+    def submit_next_shard():
+        if (start := next(shard_starts, None)) is not None:
+            pending_shards.append(
+                executor.submit(
+                    get_page_range_content, start, min(start + EXPORT_SHARD_SIZE, total)
+                )
+            )
+
     try:
-        for n in range(total):
-            text = doc.get_page_content(n)
-            out.write(f"{text}{NEWLINE}\f{NEWLINE}")
-            yield n + 1
-        full_text = out.getvalue()
-        with open(target_filename, "w", encoding="utf8") as file:
-            file.write(full_text)
+        for _i in range(num_workers * EXPORT_WINDOW_PER_WORKER):
+            submit_next_shard()
+        with _open_export_file(doc.metadata.title, target_filename) as file:
+            num_written = 0
+            while pending_shards:
+                page_texts = pending_shards.popleft().result()
+                submit_next_shard()
+                for text in page_texts:
+                    _write_exported_page(file, text)
+                    num_written += 1
+                    yield num_written
     finally:
-        out.close()
-        doc.close()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_page_range_content(start, stop):
+    """This function runs in a document worker process."""
+    doc = _document_worker_state["document"]
+    return [doc.get_page_content(n) for n in range(start, stop)]
 
 
 def search_book(doc, request):
-    """This function also runs in a separate process."""
+    """This function also runs in a document worker process."""
     pattern = _make_search_re_pattern(request)
+    for n in range(request.from_page, request.to_page + 1):
+        yield _search_page(doc, n, pattern)
+
+
+def get_search_worker_count(request) -> int:
+    """Return the number of worker processes to use for searching the given page range."""
+    num_pages = request.to_page - request.from_page + 1
+    return _get_worker_count(num_pages, SEARCH_SHARD_SIZE)
+
+
+def _get_worker_count(num_pages, shard_size) -> int:
+    if num_pages < PARALLEL_PROCESSING_MIN_PAGES:
+        return 1
+    return max(1, min(task_scheduler.processes.max_workers, num_pages // shard_size))
+
+
+def search_book_in_parallel(doc, request, num_workers):
+    """
+    Split the page range into shards which are searched by the process workers of
+    the task scheduler, each with its own handle to the document. Per-page result sets
+    are yielded in page order as soon as the shards holding them are done.
+    Closing the generator cancels the shards which have not started yet.
+    """
+    executor = _get_document_worker_executor(doc)
     try:
-        for n in range(request.from_page, request.to_page + 1):
-            resultset = []
-            sect = doc[n].section.title
-            for pos, snip in search(pattern, doc.get_page_content(n)):
-                resultset.append(
-                    SearchResult(excerpt=snip, page=n, position=pos, section=sect)
-                )
-            yield resultset
+        # Shards are picked up by the workers in submission order,
+        # so they also complete approximately in page order
+        shards = [
+            executor.submit(
+                search_page_range,
+                request,
+                start,
+                min(start + SEARCH_SHARD_SIZE, request.to_page + 1),
+            )
+            for start in range(
+                request.from_page, request.to_page + 1, SEARCH_SHARD_SIZE
+            )
+        ]
+        for shard in shards:
+            yield from shard.result()
     finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _get_document_worker_executor(doc):
+    """The user waits for the result, and the shards are cancelled as a group."""
+    return task_scheduler.process_executor(
+        TaskPriority.INTERACTIVE,
+        group=object(),
+        initializer=_init_document_worker,
+        initargs=(doc,),
+        finalizer=_release_document_worker,
+    )
+
+
+def _init_document_worker(doc):
+    """Runs in the worker process. Unpickling the document opens it."""
+    _document_worker_state["document"] = doc
+
+
+def _release_document_worker():
+    """Runs in the worker process, when it is idle or given the shards of another document."""
+    if (doc := _document_worker_state.pop("document", None)) is not None:
         doc.close()
 
 
+def search_page_range(request, start, stop):
+    """This function runs in a search worker process."""
+    doc = _document_worker_state["document"]
+    pattern = _make_search_re_pattern(request)
+    return [_search_page(doc, n, pattern) for n in range(start, stop)]
+
+
+def _search_page(doc, page_number, pattern):
+    sect = doc[page_number].section.title
+    return [
+        SearchResult(excerpt=snip, page=page_number, position=pos, section=sect)
+        for pos, snip in search(pattern, doc.get_page_content(page_number))
+    ]
+
+
 def search_single_page_document(text, request):
     pattern = _make_search_re_pattern(request)
     start_pos, stop_pos = request.text_range
@@ -101,6 +256,15 @@ def search_single_page_document(text, request):
         ]
 
 
+def search_shared_text(shared_text, request):
+    """
+    This function runs in a document worker process,
+    which detaches from the snapshot when the search is done.
+    """
+    text = shared_text.get_page_text(0)[request.text_range.as_slice()]
+    yield from search_single_page_document(text, request)
+
+
 def _make_search_re_pattern(request):
     I = re.I if not request.case_sensitive else 0
     if request.is_regex:
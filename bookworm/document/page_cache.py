@@ -0,0 +1,164 @@
+# coding: utf-8
+
+"""
+A memory-budgeted cache for pages and page content shared by all open documents.
+Each document gets its own namespace in the cache, which is freed when the document is closed.
+"""
+
+from __future__ import annotations
+
+import itertools
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+from functools import wraps
+
+import attr
+
+from bookworm import typehints as t
+from bookworm.logger import logger
+
+log = logger.getChild(__name__)
+# Memory budget (in bytes) shared by the cached pages of all open documents
+PAGE_CACHE_CAPACITY = 64 * 1024 * 1024
+_MISSING = object()
+
+
+@attr.s(auto_attribs=True, slots=True)
+class PageCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return (self.hits / lookups) if lookups else 0.0
+
+
+class PageCache:
+    """
+    A least-recently-used cache bounded by the estimated memory size of its entries.
+    Entries are keyed by an opaque namespace token rather than by the document itself,
+    so that the cache never keeps closed documents alive.
+    """
+
+    def __init__(self, capacity: int = PAGE_CACHE_CAPACITY):
+        self.capacity = capacity
+        self.size = 0
+        self.stats = PageCacheStats()
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()
+        self._namespaces = {}
+        self._namespace_counter = itertools.count(1)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_namespace(self, document) -> int:
+        """Return the namespace of the given document, creating it if necessary."""
+        if (namespace := document.__dict__.get("_page_cache_namespace")) is not None:
+            return namespace
+        with self._lock:
+            namespace = next(self._namespace_counter)
+            document.__dict__["_page_cache_namespace"] = namespace
+            self._namespaces[namespace] = set()
+        # Documents that are garbage collected without being closed
+        weakref.finalize(document, self.drop_namespace, namespace)
+        return namespace
+
+    def get(self, document, key: t.Hashable, factory: t.Callable[[], t.Any]):
+        """Return the cached value for `key`, or compute it using `factory` and cache it."""
+        entry_key = (self.get_namespace(document), key)
+        with self._lock:
+            entry = self._entries.get(entry_key, _MISSING)
+            if entry is not _MISSING:
+                self._entries.move_to_end(entry_key)
+                self.stats.hits += 1
+                return entry[0]
+            self.stats.misses += 1
+        # Compute the value without holding the lock, as this may be expensive
+        value = factory()
+        self.put(entry_key, value)
+        return value
+
+    def contains(self, document, key: t.Hashable) -> bool:
+        namespace = document.__dict__.get("_page_cache_namespace")
+        return (namespace, key) in self._entries
+
+    def get_entries_size(self, document, keys: t.Iterable[t.Hashable]) -> int:
+        """Return the memory held by the cached entries of the document with the given keys."""
+        namespace = document.__dict__.get("_page_cache_namespace")
+        with self._lock:
+            return sum(
+                entry[1]
+                for key in keys
+                if (entry := self._entries.get((namespace, key))) is not None
+            )
+
+    def put(self, entry_key: tuple[int, t.Hashable], value: t.Any) -> None:
+        namespace, __ = entry_key
+        value_size = self.estimate_size(value)
+        with self._lock:
+            if namespace not in self._namespaces:
+                # The document was closed while the value was being computed
+                return
+            if value_size > self.capacity:
+                return
+            if (old_entry := self._entries.pop(entry_key, None)) is not None:
+                self.size -= old_entry[1]
+            self._entries[entry_key] = (value, value_size)
+            self._namespaces[namespace].add(entry_key)
+            self.size += value_size
+            while self.size > self.capacity:
+                self._evict_oldest()
+
+    def _evict_oldest(self):
+        (namespace, key), (__, value_size) = self._entries.popitem(last=False)
+        self._namespaces[namespace].discard((namespace, key))
+        self.size -= value_size
+        self.stats.evictions += 1
+
+    def drop_namespace(self, namespace: int) -> None:
+        """Remove all the entries belonging to the given namespace."""
+        with self._lock:
+            for entry_key in self._namespaces.pop(namespace, ()):
+                __, value_size = self._entries.pop(entry_key)
+                self.size -= value_size
+
+    def drop_document(self, document) -> None:
+        """Free the entries of the given document, and forget its namespace."""
+        if (namespace := document.__dict__.pop("_page_cache_namespace", None)) is None:
+            return
+        self.drop_namespace(namespace)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._namespaces = {namespace: set() for namespace in self._namespaces}
+            self.size = 0
+
+    @staticmethod
+    def estimate_size(value: t.Any) -> int:
+        if hasattr(value, "get_memory_footprint"):
+            return value.get_memory_footprint()
+        return sys.getsizeof(value)
+
+
+page_cache = PageCache()
+
+
+def cached_page_method(method):
+    """
+    Cache the result of a document method that takes a page index
+    in the shared page cache, under the namespace of the document.
+    """
+    cache_key = method.__qualname__
+
+    @wraps(method)
+    def wrapper(self, index):
+        return page_cache.get(self, (cache_key, index), lambda: method(self, index))
+
+    wrapper.page_cache_key = cache_key
+    return wrapper
@@ -0,0 +1,127 @@
+# coding: utf-8
+
+"""
+Extracts the text of the pages around the current page in the background,
+so that turning to an adjacent page becomes a cache lookup.
+"""
+
+from __future__ import annotations
+
+import threading
+
+import attr
+
+from bookworm.concurrency import TaskPriority, task_scheduler
+from bookworm.logger import logger
+
+log = logger.getChild(__name__)
+
+
+@attr.s(auto_attribs=True, slots=True)
+class PrefetchStats:
+    prefetched: int = 0
+    hits: int = 0
+    misses: int = 0
+    cancelled: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        page_turns = self.hits + self.misses
+        return (self.hits / page_turns) if page_turns else 0.0
+
+
+class PagePrefetcher:
+    """
+    Prefetches the text content of the `ahead` pages following, and the `behind`
+    pages preceding the current page. Work scheduled for a previous page is
+    abandoned as soon as the current page changes, and nothing is prefetched
+    once the pages prefetched by this prefetcher, and which are still in the
+    page cache, hold more than `memory_ceiling` bytes.
+    """
+
+    def __init__(self, document, ahead: int, behind: int, memory_ceiling: int):
+        self.document = document
+        self.ahead = ahead
+        self.behind = behind
+        self.memory_ceiling = memory_ceiling
+        self.stats = PrefetchStats()
+        # Guards the stats and the prefetched pages, which are updated by the workers
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._future = None
+        self._prefetched_pages = set()
+
+    def get_pages_to_prefetch(self, current: int) -> list[int]:
+        num_pages = len(self.document)
+        following = range(current + 1, min(current + self.ahead + 1, num_pages))
+        preceding = range(current - 1, max(current - self.behind - 1, -1), -1)
+        return [*following, *preceding]
+
+    def page_changed(self, current: int) -> None:
+        """Record whether the new page was prefetched, and prefetch its neighbours."""
+        is_hit = self.document.is_page_content_cached(current)
+        with self._lock:
+            if is_hit:
+                self.stats.hits += 1
+            else:
+                self.stats.misses += 1
+        self.schedule(current)
+
+    def schedule(self, current: int) -> None:
+        pages = self.get_pages_to_prefetch(current)
+        with self._lock:
+            self._cancel_pending()
+            if not pages:
+                return
+            generation = self._generation
+            try:
+                self._future = task_scheduler.thread_executor(
+                    TaskPriority.PREFETCH, group=self.document.uri
+                ).submit(self._prefetch_pages, pages, generation)
+            except RuntimeError:
+                log.debug("Failed to schedule page prefetching.")
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancel_pending()
+
+    def _cancel_pending(self):
+        self._generation += 1
+        if (self._future is not None) and self._future.cancel():
+            self.stats.cancelled += 1
+        self._future = None
+
+    def get_prefetched_size(self) -> int:
+        """Return the memory held by the prefetched pages which are still cached, in bytes."""
+        with self._lock:
+            prefetched_pages = list(self._prefetched_pages)
+        page_sizes = {
+            page_number: self.document.get_cached_page_size(page_number)
+            for page_number in prefetched_pages
+        }
+        with self._lock:
+            # Forget the pages which were evicted from the cache
+            self._prefetched_pages.difference_update(
+                page_number for (page_number, size) in page_sizes.items() if not size
+            )
+        return sum(page_sizes.values())
+
+    def _prefetch_pages(self, pages, generation):
+        for page_number in pages:
+            if generation != self._generation:
+                with self._lock:
+                    self.stats.cancelled += 1
+                return
+            if self.get_prefetched_size() >= self.memory_ceiling:
+                log.debug("Page prefetching stopped: memory ceiling reached.")
+                return
+            if self.document.is_page_content_cached(page_number):
+                continue
+            try:
+                self.document.get_page_content(page_number)
+            except Exception:
+                log.exception(f"Failed to prefetch page {page_number}", exc_info=True)
+                return
+            with self._lock:
+                self._prefetched_pages.add(page_number)
+                self.stats.prefetched += 1
@@ -0,0 +1,158 @@
+# coding: utf-8
+
+"""
+A registry of the supported document formats.
+Formats are declared by name, file extensions, and capabilities, along with the
+location of the class implementing them. The implementing module, and the
+libraries it depends on, are only imported when a document of that format is
+created, keeping them out of application startup and of the worker processes
+which never deal with that format.
+"""
+
+from __future__ import annotations
+
+import importlib
+import threading
+
+import attr
+
+from bookworm import typehints as t
+from bookworm.logger import logger
+
+from .features import DocumentCapability
+
+log = logger.getChild(__name__)
+
+
+@attr.s(auto_attribs=True, slots=True, frozen=True)
+class DocumentFormat:
+    """Describes a document format without importing its implementation."""
+
+    format: str
+    """The developer oriented name of this format."""
+    name: str
+    """The displayable name of this format."""
+    extensions: tuple[str, ...]
+    """Wildcard patterns of the file extensions of this format, like `*.epub`."""
+    class_path: str
+    """The implementing class, as `module:ClassName`."""
+    capabilities: DocumentCapability = DocumentCapability.NULL_CAPABILITY
+    internal: bool = False
+    """Whether this format is hidden from the user."""
+    requirement: t.Optional[t.Callable[[], bool]] = None
+    """Return True if this format is supported in the user's environment."""
+
+    @classmethod
+    def from_document_class(cls, doc_cls) -> DocumentFormat:
+        return cls(
+            format=doc_cls.format.lower(),
+            name=doc_cls.name,
+            extensions=tuple(doc_cls.extensions or ()),
+            class_path=f"{doc_cls.__module__}:{doc_cls.__qualname__}",
+            capabilities=doc_cls.capabilities,
+            internal=doc_cls.__internal__,
+            requirement=doc_cls.check,
+        )
+
+    @property
+    def class_name(self) -> str:
+        return self.class_path.partition(":")[2]
+
+    def load(self):
+        """Import the module implementing this format, and return its document class."""
+        module_name, _sep, class_name = self.class_path.partition(":")
+        return getattr(importlib.import_module(module_name), class_name)
+
+
+class DocumentFormatRegistry:
+    """
+    Maps format names and file extensions to document formats.
+    Formats whose requirement is not met are treated as unsupported.
+    """
+
+    def __init__(self):
+        self._formats: dict[str, DocumentFormat] = {}
+        self._classes: dict[str, type] = {}
+        self._availability: dict[str, bool] = {}
+        self._extension_index: t.Optional[dict[str, str]] = None
+        self._lock = threading.RLock()
+
+    def register(self, document_format: DocumentFormat) -> None:
+        with self._lock:
+            key = document_format.format.lower()
+            self._formats[key] = document_format
+            self._classes.pop(key, None)
+            self._availability.pop(key, None)
+            self._extension_index = None
+
+    def register_class(self, doc_cls) -> None:
+        """
+        Record a document class as it is defined. Classes of declared formats
+        resolve their declaration, other classes are declared using their own
+        attributes if they pass their `check`.
+        """
+        key = doc_cls.format.lower()
+        with self._lock:
+            document_format = self._formats.get(key)
+            class_path = f"{doc_cls.__module__}:{doc_cls.__qualname__}"
+            if document_format is None or document_format.class_path != class_path:
+                if not doc_cls.check():
+                    return
+                self.register(DocumentFormat.from_document_class(doc_cls))
+            self._classes[key] = doc_cls
+
+    def is_available(self, format: str) -> bool:
+        key = format.lower()
+        with self._lock:
+            if (document_format := self._formats.get(key)) is None:
+                return False
+            if key not in self._availability:
+                requirement = document_format.requirement
+                self._availability[key] = (requirement is None) or bool(requirement())
+            return self._availability[key]
+
+    def get(self, format: str) -> t.Optional[DocumentFormat]:
+        """Return the given format if it is supported."""
+        if self.is_available(format):
+            return self._formats[format.lower()]
+
+    def get_document_class(self, format: str):
+        """Return the class implementing the given format, importing it if needed."""
+        if (document_format := self.get(format)) is None:
+            return None
+        key = document_format.format
+        if (doc_cls := self._classes.get(key)) is None:
+            log.debug(f"Loading the implementation of document format: {key}")
+            doc_cls = self._classes[key] = document_format.load()
+        return doc_cls
+
+    def get_format_given_extension(self, ext: str) -> t.Optional[str]:
+        """Return the name of the format with the given extension pattern, like `*.epub`."""
+        with self._lock:
+            if self._extension_index is None:
+                extension_index = {}
+                for document_format in self:
+                    for format_ext in document_format.extensions:
+                        extension_index.setdefault(format_ext, document_format.format)
+                self._extension_index = extension_index
+            return self._extension_index.get(ext)
+
+    def get_supported_file_extensions(self, include_internal=True) -> frozenset[str]:
+        """Return the file extensions of the supported formats, like `.epub`."""
+        return frozenset(
+            ext.lstrip("*")
+            for document_format in self
+            if include_internal or not document_format.internal
+            for ext in document_format.extensions
+        )
+
+    def __contains__(self, format: str) -> bool:
+        return self.is_available(format)
+
+    def __iter__(self) -> t.Iterator[DocumentFormat]:
+        with self._lock:
+            formats = list(self._formats)
+        return (self._formats[key] for key in formats if self.is_available(key))
+
+
+document_formats = DocumentFormatRegistry()
@@ -0,0 +1,330 @@
+# coding: utf-8
+
+"""
+A persistent inverted index of the words in a document, used to answer
+plain text searches without extracting and scanning the whole document again.
+
+The index maps each word to the pages (or, for single page documents, the
+fixed-size, overlapping chunks of text) in which it occurs. Candidate pages are then
+searched with the same pattern used by a regular scan, so both give the same results.
+"""
+
+from __future__ import annotations
+
+import os
+from bisect import bisect_left
+
+import attr
+import msgpack
+import regex as re
+from diskcache import Cache
+
+from bookworm import config
+from bookworm.concurrency import TaskPriority, task_scheduler
+from bookworm.logger import logger
+from bookworm.paths import home_data_path
+
+from . import operations as doctools
+from .exceptions import DocumentIOError
+
+log = logger.getChild(__name__)
+# Bump this whenever a change invalidates the stored indexes
+SEARCH_INDEX_VERSION = 2
+# Size (in characters) of the chunks by which the text of single page documents is indexed
+SINGLE_PAGE_INDEX_CHUNK_SIZE = 4096
+# Each chunk also indexes this many characters of the next one, so that a match which
+# starts in a chunk is wholly indexed by it. Longer terms are searched without the index.
+SINGLE_PAGE_INDEX_CHUNK_OVERLAP = 256
+# Terms matching more indexed words than this are searched without the index
+MAX_SUBSTRING_MATCHES = 1000
+# Terms shorter than this which may match within words are searched without the index
+MIN_SUBSTRING_LENGTH = 3
+SEARCH_INDEX_CACHE_SIZE_LIMIT = 512 * 1024 * 1024
+WORD_RE = re.compile(r"\w+")
+# Keys of the documents whose index is being built in this process
+_indexes_being_built = set()
+
+
+@attr.s(auto_attribs=True, slots=True)
+class DocumentSearchIndex:
+    postings: dict[str, list[int]]
+    """Maps each lowercase word to the sorted list of units in which it occurs."""
+
+    page_texts: list[str] = None
+    """The text of each page of paginated documents."""
+
+    chunk_offsets: list[int] = None
+    """The start offset of each chunk of single page documents."""
+
+    _words: list[str] = attr.ib(default=None, init=False, repr=False, eq=False)
+
+    @classmethod
+    def from_page_texts(cls, page_texts: list[str]) -> DocumentSearchIndex:
+        return cls(postings=cls._build_postings(page_texts), page_texts=page_texts)
+
+    @classmethod
+    def from_text(cls, text: str) -> DocumentSearchIndex:
+        text_length = len(text)
+        chunk_offsets = [0]
+        while (chunk_end := chunk_offsets[-1] + SINGLE_PAGE_INDEX_CHUNK_SIZE) < text_length:
+            # Do not split words across chunks
+            if match := WORD_RE.match(text, chunk_end):
+                chunk_end = match.end()
+            if chunk_end >= text_length:
+                break
+            chunk_offsets.append(chunk_end)
+        chunks = (
+            text[start : cls._get_indexed_chunk_end(text, stop)]
+            for (start, stop) in zip(chunk_offsets, [*chunk_offsets[1:], text_length])
+        )
+        return cls(postings=cls._build_postings(chunks), chunk_offsets=chunk_offsets)
+
+    @staticmethod
+    def _get_indexed_chunk_end(text, chunk_end) -> int:
+        indexed_end = chunk_end + SINGLE_PAGE_INDEX_CHUNK_OVERLAP
+        if match := WORD_RE.match(text, indexed_end):
+            indexed_end = match.end()
+        return min(indexed_end, len(text))
+
+    @staticmethod
+    def _build_postings(unit_texts) -> dict[str, list[int]]:
+        postings = {}
+        for unit, text in enumerate(unit_texts):
+            for word in set(WORD_RE.findall(text.lower())):
+                postings.setdefault(word, []).append(unit)
+        # Sorted, so that words can be looked up by prefix
+        return dict(sorted(postings.items()))
+
+    def dumps(self) -> bytes:
+        return msgpack.dumps([self.postings, self.page_texts, self.chunk_offsets])
+
+    @classmethod
+    def loads(cls, data: bytes) -> DocumentSearchIndex:
+        postings, page_texts, chunk_offsets = msgpack.loads(data)
+        return cls(postings=postings, page_texts=page_texts, chunk_offsets=chunk_offsets)
+
+    def get_candidate_units(self, request) -> set[int] | None:
+        """
+        Return the units which may contain matches for the given request,
+        or None if the index can not be used to answer this request.
+        """
+        if request.is_regex:
+            return None
+        term = request.term.lower()
+        query_words = list(WORD_RE.finditer(term))
+        if not query_words:
+            return None
+        candidates = None
+        for i, match in enumerate(query_words):
+            # The first and last words of the term may be part of longer words
+            may_start_within_word = (
+                (i == 0) and (match.start() == 0) and not request.whole_word
+            )
+            may_end_within_word = (
+                (i == len(query_words) - 1)
+                and (match.end() == len(term))
+                and not request.whole_word
+            )
+            if not may_start_within_word:
+                if may_end_within_word:
+                    words = self._get_words_with_prefix(match[0])
+                else:
+                    words = [match[0]] if match[0] in self.postings else []
+            elif len(query_words) > 1:
+                # The other words of the term are enough to narrow down the candidates
+                continue
+            elif (words := self._get_words_containing(match[0])) is None:
+                return None
+            units = set()
+            for word in words:
+                units.update(self.postings[word])
+            candidates = units if candidates is None else (candidates & units)
+            if not candidates:
+                break
+        return candidates
+
+    def _get_sorted_words(self) -> list[str]:
+        if self._words is None:
+            self._words = list(self.postings)
+        return self._words
+
+    def _get_words_with_prefix(self, prefix) -> list[str]:
+        words = self._get_sorted_words()
+        start = index = bisect_left(words, prefix)
+        while (index < len(words)) and words[index].startswith(prefix):
+            index += 1
+        return words[start:index]
+
+    def _get_words_containing(self, substring) -> list[str] | None:
+        """Return None if the substring is too short, or too common, for the index to help."""
+        if len(substring) < MIN_SUBSTRING_LENGTH:
+            return None
+        words = []
+        for word in self._get_sorted_words():
+            if substring in word:
+                words.append(word)
+                if len(words) > MAX_SUBSTRING_MATCHES:
+                    return None
+        return words
+
+    def search_pages(self, doc, request):
+        """Yield a result set for each page in the requested range, like `doctools.search_book`."""
+        if (candidates := self.get_candidate_units(request)) is None:
+            return None
+        return self._iter_page_results(
+            doc, candidates, doctools._make_search_re_pattern(request), request
+        )
+
+    def _iter_page_results(self, doc, candidates, pattern, request):
+        for n in range(request.from_page, request.to_page + 1):
+            if n not in candidates:
+                yield []
+                continue
+            section_title = doc[n].section.title
+            yield [
+                doctools.SearchResult(
+                    excerpt=snip, page=n, position=pos, section=section_title
+                )
+                for pos, snip in doctools.search(pattern, self.page_texts[n])
+            ]
+
+    def search_text(self, text, request):
+        """Yield result sets like `doctools.search_single_page_document`."""
+        if len(request.term) > SINGLE_PAGE_INDEX_CHUNK_OVERLAP:
+            return None
+        if (candidates := self.get_candidate_units(request)) is None:
+            return None
+        return self._iter_text_results(
+            text, candidates, doctools._make_search_re_pattern(request), request
+        )
+
+    def _iter_text_results(self, text, candidates, pattern, request):
+        start_pos, stop_pos = request.text_range
+        chunk_ends = [*self.chunk_offsets[1:], len(text)]
+        text = text[start_pos:stop_pos]
+        # Matches may span the end of a chunk by at most the length of the term
+        overlap = len(request.term) + 1
+        last_match_end = 0
+        for chunk in sorted(candidates):
+            chunk_start = max(self.chunk_offsets[chunk] - start_pos, last_match_end)
+            chunk_end = chunk_ends[chunk] - start_pos
+            if (chunk_end <= 0) or (chunk_start >= len(text)):
+                continue
+            for pos, snip in doctools.search(
+                pattern,
+                text,
+                pos=max(chunk_start, 0),
+                endpos=min(chunk_end + overlap, len(text)),
+            ):
+                if pos >= chunk_end:
+                    break
+                last_match_end = pos + len(request.term)
+                yield [
+                    doctools.SearchResult(
+                        excerpt=snip, page=0, position=start_pos + pos, section=""
+                    ),
+                ]
+
+
+def get_search_index_cache() -> Cache:
+    return Cache(
+        os.fspath(home_data_path(".document_search_index")),
+        size_limit=SEARCH_INDEX_CACHE_SIZE_LIMIT,
+        eviction_policy="least-recently-used",
+    )
+
+
+def get_search_index_key(doc) -> str | None:
+    try:
+        return f"{doc.text_cache_key}:v{SEARCH_INDEX_VERSION}"
+    except DocumentIOError:
+        # Not backed by a file, such as virtual documents
+        return None
+
+
+def load_search_index(doc) -> DocumentSearchIndex | None:
+    """
+    Return the stored index for the given document, if any. The index is kept on
+    the document once loaded, until the text of the document changes.
+    """
+    if (key := get_search_index_key(doc)) is None:
+        return None
+    if (doc._search_index is not None) and (doc._search_index[0] == key):
+        return doc._search_index[1]
+    with get_search_index_cache() as cache:
+        data = cache.get(key)
+    if data is None:
+        return None
+    try:
+        index = DocumentSearchIndex.loads(data)
+    except Exception:
+        log.exception("Failed to load the search index of the document", exc_info=True)
+        return None
+    doc._search_index = (key, index)
+    return index
+
+
+def build_search_index(doc) -> DocumentSearchIndex:
+    if doc.is_single_page_document():
+        return DocumentSearchIndex.from_text(doc.get_content())
+    return DocumentSearchIndex.from_page_texts(
+        [doc.get_page_content(n) for n in range(len(doc))]
+    )
+
+
+def store_search_index(doc, index: DocumentSearchIndex) -> None:
+    key = get_search_index_key(doc)
+    path_key = f"path:{doc.get_file_system_path()}"
+    with get_search_index_cache() as cache:
+        # The file has changed since it was last indexed
+        if ((previous_key := cache.get(path_key)) is not None) and (
+            previous_key != key
+        ):
+            cache.delete(previous_key)
+        cache.set(key, index.dumps())
+        cache.set(path_key, key)
+
+
+def _build_and_store_search_index(doc) -> None:
+    """This function runs in a separate process."""
+    try:
+        store_search_index(doc, build_search_index(doc))
+    finally:
+        doc.close()
+
+
+def is_search_indexing_enabled() -> bool:
+    return (config.conf is not None) and config.conf["general"][
+        "index_documents_for_search"
+    ]
+
+
+def ensure_search_index(doc) -> None:
+    """Build and store the index of the given document in the background, unless it is already stored."""
+    if not is_search_indexing_enabled():
+        return
+    if (key := get_search_index_key(doc)) is None:
+        return
+    if key in _indexes_being_built:
+        return
+    with get_search_index_cache() as cache:
+        if key in cache:
+            return
+    _indexes_being_built.add(key)
+    try:
+        future = task_scheduler.process_executor(TaskPriority.INDEXING, group=doc.uri).submit(
+            _build_and_store_search_index, doc
+        )
+    except RuntimeError:
+        _indexes_being_built.discard(key)
+        log.debug("Failed to schedule building the search index.")
+        return
+    future.add_done_callback(lambda f: _on_search_index_built(key, f))
+
+
+def _on_search_index_built(key, future):
+    _indexes_being_built.discard(key)
+    if future.cancelled():
+        return
+    if (exc := future.exception()) is not None:
+        log.error(f"Failed to build the search index of the document: {exc!r}")
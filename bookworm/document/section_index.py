@@ -0,0 +1,89 @@
+# coding: utf-8
+
+"""
+Maps page numbers and text positions to the sections of the table of content
+in logarithmic time, instead of walking the whole tree for each lookup.
+"""
+
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+from bookworm import typehints as t
+
+from .elements import Section
+
+
+class SectionIntervalIndex:
+    """
+    Splits the covered range into segments at the start and stop of each section.
+    Each segment is assigned the section which covers it, so a lookup is
+    a binary search in the sorted array of segment starts.
+    """
+
+    __slots__ = ["_segment_starts", "_segment_sections", "default"]
+
+    def __init__(
+        self, intervals: t.Iterable[tuple[int, int, Section]], default: Section
+    ):
+        """
+        `intervals` are half-open `(start, stop, section)` tuples. Where
+        intervals overlap, the one that comes later takes precedence.
+        """
+        intervals = [(start, stop, sect) for (start, stop, sect) in intervals if start < stop]
+        boundaries = sorted({pos for (start, stop, _s) in intervals for pos in (start, stop)})
+        self._segment_starts = array("q", boundaries)
+        self._segment_sections = [default] * len(boundaries)
+        self.default = default
+        # Later intervals take precedence, so assign segments starting from the last
+        # interval, and skip the segments which are already assigned
+        next_unassigned = list(range(len(boundaries) + 1))
+
+        def find_unassigned(segment):
+            root = segment
+            while next_unassigned[root] != root:
+                root = next_unassigned[root]
+            while next_unassigned[segment] != root:
+                next_unassigned[segment], segment = root, next_unassigned[segment]
+            return root
+
+        for start, stop, sect in reversed(intervals):
+            segment = find_unassigned(bisect_left(self._segment_starts, start))
+            stop_segment = bisect_left(self._segment_starts, stop)
+            while segment < stop_segment:
+                self._segment_sections[segment] = sect
+                next_unassigned[segment] = segment + 1
+                segment = find_unassigned(segment + 1)
+
+    @classmethod
+    def from_pagers(cls, toc_tree: Section) -> SectionIntervalIndex:
+        """Maps each page number to the most specific section that contains it."""
+        return cls(
+            (
+                (sect.pager.first, sect.pager.last + 1, sect)
+                for sect in toc_tree.iter_children()
+            ),
+            default=toc_tree,
+        )
+
+    @classmethod
+    def from_text_ranges(cls, toc_tree: Section) -> SectionIntervalIndex:
+        """Maps each text position to the most specific section that contains it."""
+        return cls(
+            (
+                # Text ranges include their stop position
+                (sect.text_range.start, sect.text_range.stop + 1, sect)
+                for sect in toc_tree.iter_children()
+            ),
+            default=toc_tree,
+        )
+
+    def __len__(self):
+        return len(self._segment_starts)
+
+    def get(self, pos: int) -> Section:
+        segment = bisect_right(self._segment_starts, pos) - 1
+        if segment < 0:
+            return self.default
+        return self._segment_sections[segment]
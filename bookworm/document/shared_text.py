@@ -0,0 +1,93 @@
+# coding: utf-8
+
+"""
+Publishes the page texts of a loaded document to worker processes through shared memory,
+so that workers do not need to read the document again or receive its text through a pipe.
+"""
+
+from __future__ import annotations
+
+import os
+import struct
+from multiprocessing.shared_memory import SharedMemory
+
+from bookworm import typehints as t
+from bookworm.logger import logger
+
+log = logger.getChild(__name__)
+# Native unsigned 64-bit integers, to be able to view the offset table without copying
+_OFFSET_FORMAT = "Q"
+_OFFSET_SIZE = struct.calcsize(_OFFSET_FORMAT)
+
+
+class SharedTextSnapshot:
+    """
+    The page texts of a document stored in a shared memory block.
+    The block starts with the number of pages, followed by a table with the offset of
+    each page text in the UTF-8 encoded data that follows. Pickling a snapshot only
+    transfers the name of the block, which the receiving process attaches to.
+    """
+
+    def __init__(self, shared_memory: SharedMemory, owner_pid: int | None):
+        self._shared_memory = shared_memory
+        # Forked processes inherit the snapshot object, but must not free the block
+        self._owner_pid = owner_pid
+        (num_pages,) = struct.unpack_from(_OFFSET_FORMAT, shared_memory.buf, 0)
+        self._data_start = _OFFSET_SIZE * (num_pages + 2)
+        self._offsets = shared_memory.buf[_OFFSET_SIZE : self._data_start].cast(
+            _OFFSET_FORMAT
+        )
+
+    @classmethod
+    def publish(cls, page_texts: t.Iterable[str]) -> SharedTextSnapshot:
+        encoded_texts = [text.encode("utf-8") for text in page_texts]
+        num_pages = len(encoded_texts)
+        data_start = _OFFSET_SIZE * (num_pages + 2)
+        data_size = sum(len(text) for text in encoded_texts)
+        shared_memory = SharedMemory(create=True, size=data_start + data_size)
+        buf = shared_memory.buf
+        struct.pack_into(_OFFSET_FORMAT, buf, 0, num_pages)
+        offset = 0
+        for page_number, text in enumerate(encoded_texts):
+            struct.pack_into(
+                _OFFSET_FORMAT, buf, _OFFSET_SIZE * (page_number + 1), offset
+            )
+            buf[data_start + offset : data_start + offset + len(text)] = text
+            offset += len(text)
+        struct.pack_into(_OFFSET_FORMAT, buf, _OFFSET_SIZE * (num_pages + 1), offset)
+        return cls(shared_memory, owner_pid=os.getpid())
+
+    @classmethod
+    def attach(cls, name: str) -> SharedTextSnapshot:
+        return cls(SharedMemory(name=name), owner_pid=None)
+
+    def __reduce__(self):
+        return (self.attach, (self.name,))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __repr__(self):
+        return f"<SharedTextSnapshot: name={self.name}, pages={len(self)}>"
+
+    @property
+    def name(self) -> str:
+        return self._shared_memory.name
+
+    def get_page_text(self, page_number: int) -> str:
+        start = self._data_start + self._offsets[page_number]
+        stop = self._data_start + self._offsets[page_number + 1]
+        return str(self._shared_memory.buf[start:stop], "utf-8")
+
+    def close(self) -> None:
+        """Detach from the shared memory block, and free it if this process published it."""
+        if self._offsets is None:
+            return
+        self._offsets.release()
+        self._offsets = None
+        self._shared_memory.close()
+        if self._owner_pid == os.getpid():
+            try:
+                self._shared_memory.unlink()
+            except FileNotFoundError:
+                log.debug(f"Shared memory block {self.name} was already freed.")
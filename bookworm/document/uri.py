@@ -88,6 +88,13 @@ class DocumentUri:
             )
         )
 
+    def to_key_string(self):
+        """
+        Identifies the document regardless of its openner args.
+        Leading slashes are dropped from the path, since parsing a uri string drops them.
+        """
+        return DocumentUri(self.format, str(self.path).lstrip("/"), {}).to_bare_uri_string()
+
     def create_copy(self, format=None, path=None, openner_args=None, view_args=None):
         return DocumentUri(
             format=format or self.format,
@@ -132,9 +139,7 @@ class DocumentUri:
 
     @classmethod
     def _get_format_given_extension(cls, ext):
-        for doc_format, doc_cls in BaseDocument.document_classes.items():
-            if (doc_cls.extensions is not None) and (ext in doc_cls.extensions):
-                return doc_format
+        return BaseDocument.document_formats.get_format_given_extension(ext)
 
     def is_equal_without_openner_args(self, other):
         return self.to_bare_uri_string() == other.to_bare_uri_string()
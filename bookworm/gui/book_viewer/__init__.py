@@ -35,6 +35,7 @@ from bookworm.reader import (
 from bookworm.resources import app_icons, sounds
 from bookworm.runtime import keep_awake
 from bookworm.signals import (
+    document_content_extended,
     reader_book_loaded,
     reader_book_unloaded,
     reading_position_change,
@@ -289,6 +290,7 @@ class BookViewerWindow(wx.Frame, MenubarProvider, StateProvider):
         )
 
         self.Bind(wx.EVT_CHAR_HOOK, self.on_key_press_local)
+        document_content_extended.connect(self.on_document_content_extended)
 
         self.toc_tree_manager = TocTreeManager(self.tocTreeCtrl)
         # Set status bar text
@@ -538,6 +540,26 @@ class BookViewerWindow(wx.Frame, MenubarProvider, StateProvider):
         self.set_insertion_point(0)
         self.contentTextCtrl.Thaw()
 
+    @gui_thread_safe
+    def on_document_content_extended(self, sender, start, text):
+        """Append the text of a progressively loaded document as it becomes available."""
+        if sender is not self.reader.document:
+            return
+        last_position = self.get_last_position()
+        if start + len(text) <= last_position:
+            # Already included when the content was set
+            return
+        elif start > last_position:
+            text = sender.get_content()[last_position:start] + text
+        else:
+            text = text[last_position - start :]
+        insertion_point = self.contentTextCtrl.GetInsertionPoint()
+        self.contentTextCtrl.Freeze()
+        self.contentTextCtrl.SetInsertionPoint(last_position + TEXT_CTRL_OFFSET)
+        self.contentTextCtrl.WriteText(text)
+        self.contentTextCtrl.SetInsertionPoint(insertion_point)
+        self.contentTextCtrl.Thaw()
+
     def set_title(self, title):
         self.SetTitle(title)
 
@@ -650,7 +672,11 @@ class BookViewerWindow(wx.Frame, MenubarProvider, StateProvider):
         self.contentTextCtrl.SetFocus()
 
     def set_state_on_page_change(self, page):
-        self.set_content(page.get_text())
+        if self.reader.document.is_single_page_document():
+            self.set_content(page.get_text())
+        else:
+            # Goes through the page cache, which may have been filled by the prefetcher
+            self.set_content(self.reader.document.get_page_content(page.index))
         if config.conf["general"]["play_pagination_sound"]:
             sounds.pagination.play()
         status_text = self.get_statusbar_text()
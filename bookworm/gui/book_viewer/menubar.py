@@ -1,12 +1,11 @@
 # coding: utf-8
 
-import inspect
 import os
 import shutil
 import sys
 import threading
 import webbrowser
-from contextlib import suppress
+from contextlib import closing, suppress
 from functools import partial
 from operator import ge, le
 from pathlib import Path
@@ -17,7 +16,7 @@ from slugify import slugify
 
 from bookworm import app, config, ocr, paths, qread, speech
 from bookworm.commandline_handler import run_subcommand_in_a_new_process
-from bookworm.concurrency import call_threaded, process_worker
+from bookworm.concurrency import CancellationToken, call_threaded, process_worker
 from bookworm.document import READING_MODE_LABELS
 from bookworm.document import DocumentCapability as DC
 from bookworm.document import DocumentInfo, PaginationError, ReadingMode
@@ -312,23 +311,28 @@ class FileMenu(BaseMenu):
             can_abort=True,
         )
         process = self.reader.document.export_to_text(filename)
-        if inspect.isgenerator(process):
-            dlg.set_abort_callback(process.close)
-        else:
-            dlg.set_abort_callback(process.cancel)
-        self._continue_with_export_to_text(process, dlg, total)
+        cancellation_token = CancellationToken()
+        dlg.set_abort_callback(cancellation_token.request_cancellation)
+        self._continue_with_export_to_text(process, cancellation_token, dlg, total)
 
     @call_threaded
-    def _continue_with_export_to_text(self, process, progress_dlg, total):
-        for progress in process:
-            progress_dlg.Update(
-                progress,
-                # Translators: a message shown when the book is being exported
-                _("Exporting Page {current} of {total}...").format(
-                    current=progress + 1, total=total
-                ),
-            )
-        progress_dlg.Dismiss()
+    def _continue_with_export_to_text(self, process, cancellation_token, progress_dlg, total):
+        # The export can only be stopped by the thread iterating it
+        progress_iterator = iter(process)
+        try:
+            for progress in progress_iterator:
+                if cancellation_token.is_cancellation_requested():
+                    break
+                progress_dlg.Update(
+                    progress,
+                    # Translators: a message shown when the book is being exported
+                    _("Exporting Page {current} of {total}...").format(
+                        current=progress + 1, total=total
+                    ),
+                )
+        finally:
+            progress_iterator.close()
+            progress_dlg.Dismiss()
 
     def onDocumentReferenceClicked(self, item_to_doc_map, event):
         item_id = event.GetId()
@@ -734,10 +738,14 @@ class SearchMenu(BaseMenu):
     def _add_search_results(self, request, dlg):
         search_func = self.reader.document.search
         results = []
-        for i, resultset in enumerate(search_func(request)):
-            results.extend(resultset)
-            if dlg.IsShown():
-                dlg.addResultSet(resultset)
+        with closing(search_func(request)) as resultsets:
+            for resultset in resultsets:
+                if self._last_search_request != request:
+                    # A newer search has started, so stop the workers of this one
+                    return
+                results.extend(resultset)
+                if dlg.IsShown():
+                    dlg.addResultSet(resultset)
         # Translators: message to announce the number of search results
         # also used as the final title of the search results dialog
         msg = _("Results | {total}").format(total=len(results))
@@ -1027,12 +1035,12 @@ class MenubarProvider:
     def _get_ebooks_wildcards():
         rv = []
         all_exts = []
-        visible_doc_cls = [
-            doc_cls
-            for doc_cls in EBookReader.get_document_format_info().values()
-            if not doc_cls.__internal__
+        visible_doc_formats = [
+            document_format
+            for document_format in EBookReader.get_document_format_info().values()
+            if not document_format.internal
         ]
-        for cls in visible_doc_cls:
+        for cls in visible_doc_formats:
             exts = ";".join(cls.extensions)
             rv.append("{name}|{exts}|".format(name=_(cls.name), exts=exts))
             all_exts.extend(cls.extensions)
@@ -1,6 +1,7 @@
 # coding: utf-8
 
 from bookworm.database import PinnedDocument, RecentDocument
+from bookworm.document.identity import get_content_hash_for_lookup
 from bookworm.logger import logger
 
 log = logger.getChild(__name__)
@@ -8,19 +9,19 @@ _CONTENT_HASH_UNSET = object()
 
 
 def _get_document_by_uri(model, uri):
-    for doc in model.query:
-        if uri.is_equal_without_openner_args(doc.uri):
-            return doc
+    return model.get_by_uri_key(uri)
 
 
 def _get_documents_by_content_hash(model, content_hash, uri):
     if content_hash is None:
         return []
-    matching_documents = []
-    for doc in model.query:
-        if doc.content_hash == content_hash and doc.uri.format == uri.format:
-            matching_documents.append(doc)
-    return matching_documents
+    return [
+        doc
+        for doc in model.query.filter(model.content_hash == content_hash).order_by(
+            model.id.asc()
+        )
+        if doc.uri.format == uri.format
+    ]
 
 
 def _merge_matching_documents(uri_document, hash_matching_documents):
@@ -34,24 +35,9 @@ def _merge_matching_documents(uri_document, hash_matching_documents):
     return matching_documents
 
 
-def _merge_recent_document_state(doc, duplicates):
-    timestamps = [candidate.last_opened_on for candidate in [doc, *duplicates]]
-    doc.last_opened_on = max(timestamp for timestamp in timestamps if timestamp is not None)
-
-
-def _merge_pinned_document_state(doc, duplicates):
-    _merge_recent_document_state(doc, duplicates)
-    doc.is_pinned = doc.is_pinned or any(candidate.is_pinned for candidate in duplicates)
-    doc.pinning_order = max(candidate.pinning_order for candidate in [doc, *duplicates])
-
-
 def _merge_document_state(model, doc, duplicates):
-    if not duplicates:
-        return
-    if model is RecentDocument:
-        _merge_recent_document_state(doc, duplicates)
-    elif model is PinnedDocument:
-        _merge_pinned_document_state(doc, duplicates)
+    if duplicates:
+        doc.merge_duplicates(model.session(), duplicates)
 
 
 def _delete_duplicate_documents(model, duplicates):
@@ -68,7 +54,7 @@ def get_document_unique(model, document):
         else _CONTENT_HASH_UNSET
     )
     if content_hash is _CONTENT_HASH_UNSET:
-        content_hash = document.get_content_hash()
+        content_hash = get_content_hash_for_lookup(document)
     matching_documents = _merge_matching_documents(
         doc,
         _get_documents_by_content_hash(model, content_hash, uri),
@@ -96,18 +82,17 @@ def add_to_recents(document):
     doc_info.record_open()
 
 
+def _remove_document(model, uri):
+    model.query.filter(model.uri_key == uri.to_key_string()).delete()
+    model.session.commit()
+
+
 def remove_from_recents(uri):
-    for doc in RecentDocument.query:
-        if uri.is_equal_without_openner_args(doc.uri):
-            RecentDocument.session.delete(doc)
-            RecentDocument.session.commit()
+    _remove_document(RecentDocument, uri)
 
 
 def remove_from_pinned(uri):
-    for doc in PinnedDocument.query:
-        if uri.is_equal_without_openner_args(doc.uri):
-            PinnedDocument.session.delete(doc)
-            PinnedDocument.session.commit()
+    _remove_document(PinnedDocument, uri)
 
 
 def pin(document):
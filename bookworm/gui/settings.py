@@ -323,6 +323,20 @@ class GeneralPanel(SettingsPanel):
             ),
             name="general.use_continuous_reading",
         )
+        wx.CheckBox(
+            miscBox,
+            -1,
+            # Translators: the label of a checkbox
+            _("Show the content of large books while the rest is still loading"),
+            name="general.progressive_document_loading",
+        )
+        wx.CheckBox(
+            miscBox,
+            -1,
+            # Translators: the label of a checkbox
+            _("Index documents in the background to speed up searching"),
+            name="general.index_documents_for_search",
+        )
         wx.CheckBox(
             miscBox,
             -1,
@@ -7,7 +7,6 @@ import importlib
 import tempfile
 from dataclasses import dataclass
 
-import fitz
 import wx
 from PIL import Image, ImageOps
 
@@ -15,6 +14,7 @@ from bookworm import typehints as t
 from bookworm.logger import logger
 from bookworm.utils import lazy_module
 
+fitz = lazy_module("fitz")
 np = lazy_module("numpy")
 cv2 = lazy_module("cv2")
 
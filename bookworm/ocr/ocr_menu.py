@@ -13,7 +13,7 @@ import wx
 from PIL import Image
 
 from bookworm import app, config, speech
-from bookworm.concurrency import QueueProcess, call_threaded, threaded_worker
+from bookworm.concurrency import call_threaded, document_worker_pool, threaded_worker
 from bookworm.document import SINGLE_PAGE_DOCUMENT_PAGER, BookMetadata
 from bookworm.document import DocumentCapability as DC
 from bookworm.document import DocumentUri, Section, SinglePageDocument, VirtualDocument
@@ -328,9 +328,12 @@ class OCRMenu(wx.Menu):
     def _continue_with_text_extraction(self, ocr_opts, output_file, progress_dlg):
         doc = self.service.reader.document
         total = len(doc)
-        args = (doc, output_file, ocr_opts)
-        scan2text_process = QueueProcess(
-            target=self.service.current_ocr_engine.scan_to_text, args=args
+        scan2text_process = document_worker_pool.submit(
+            self.service.current_ocr_engine.scan_to_text,
+            doc,
+            args=(output_file, ocr_opts),
+            key=doc.get_worker_handle_key(),
+            name="ocr-scan-to-text",
         )
         progress_dlg.set_abort_callback(scan2text_process.cancel)
 
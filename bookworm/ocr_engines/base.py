@@ -2,7 +2,6 @@
 
 from __future__ import annotations
 from abc import ABCMeta, abstractmethod
-from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from io import StringIO
 from operator import attrgetter
@@ -12,6 +11,7 @@ from more_itertools import first_true
 from bookworm import config
 from bookworm import app
 from bookworm import typehints as t
+from bookworm.concurrency import TaskPriority, task_scheduler
 from bookworm.i18n import LocaleInfo
 from bookworm.image_io import ImageIO
 from bookworm.logger import logger, configure_logger
@@ -147,7 +147,7 @@ class BaseOcrEngine(metaclass=ABCMeta):
         def recognize_page(page):
             """
             A helper function to recognize a single page and handle errors gracefully.
-            This function runs in a worker thread from the ThreadPoolExecutor.
+            This function runs in a thread of the task scheduler, as bulk OCR.
             """
             try:
                 # Create a request for the current page
@@ -174,24 +174,23 @@ class BaseOcrEngine(metaclass=ABCMeta):
                 return None
 
         try:
-            with ThreadPoolExecutor(4) as pool:
-                for idx, res in enumerate(pool.map(recognize_page, doc)):
-                    if res is None:
-                        # The page failed to recognize, the error has been logged.
-                        # We still yield the progress to update the progress bar.
-                        yield idx
-                        continue  # Skip to the next page
-
-                    out.write(
-                        f"Page {res.cookie}{NEWLINE}{res.recognized_text}{NEWLINE}\f{NEWLINE}"
-                    )
-                    yield idx  # Yield progress
+            pool = task_scheduler.thread_executor(TaskPriority.BULK_OCR)
+            for idx, res in enumerate(pool.map(recognize_page, doc)):
+                if res is None:
+                    # The page failed to recognize, the error has been logged.
+                    # We still yield the progress to update the progress bar.
+                    yield idx
+                    continue  # Skip to the next page
+
+                out.write(
+                    f"Page {res.cookie}{NEWLINE}{res.recognized_text}{NEWLINE}\f{NEWLINE}"
+                )
+                yield idx  # Yield progress
 
             with open(output_file, "w", encoding="utf8") as file:
                 file.write(out.getvalue())
         finally:
             out.close()
-            doc.close()
 
     @classmethod
     def get_sorted_languages(cls):
@@ -17,9 +17,12 @@ from tempfile import NamedTemporaryFile
 from time import sleep
 
 from packaging.version import Version
-from numpy import ndarray
 from PIL import Image
 
+from bookworm.utils import lazy_module
+
+np = lazy_module("numpy")
+
 tesseract_cmd = "tesseract"
 
 
@@ -149,7 +152,7 @@ def cleanup(temp_name):
 
 
 def prepare(image):
-    if isinstance(image, ndarray):
+    if isinstance(image, np.ndarray):
         image = Image.fromarray(image)
 
     if not isinstance(image, Image.Image):
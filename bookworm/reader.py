@@ -4,6 +4,7 @@ import os
 import re
 import string
 from contextlib import suppress
+from functools import partial
 from pathlib import Path
 
 from selectolax.parser import HTMLParser
@@ -11,7 +12,8 @@ from selectolax.parser import HTMLParser
 from bookworm import app, config
 from bookworm import typehints as t
 from bookworm.commandline_handler import run_subcommand_in_a_new_process
-from bookworm.database import Book, Bookmark, DocumentPositionInfo, Note, Quote
+from bookworm.concurrency import task_scheduler
+from bookworm.database import Book, DocumentPositionInfo, read_session
 from bookworm.document import (
     ArchiveContainsMultipleDocuments,
     ArchiveContainsNoDocumentsError,
@@ -26,8 +28,10 @@ from bookworm.document import (
     DocumentIOError,
     PaginationError,
     Section,
+    document_formats,
 )
-from bookworm.document.formats import *
+from bookworm.document.identity import get_content_hash_for_lookup
+from bookworm.document.prefetch import PagePrefetcher
 from bookworm.document.uri import DocumentUri
 from bookworm.i18n import is_rtl
 from bookworm.logger import logger
@@ -50,7 +54,7 @@ _CONTENT_HASH_UNSET = object()
 
 
 def get_document_format_info():
-    return BaseDocument.document_classes
+    return {document_format.format: document_format for document_format in document_formats}
 
 
 class ReaderError(Exception):
@@ -82,18 +86,28 @@ class UriResolver:
             self.uri = uri
         self.num_fallbacks = num_fallbacks
         self.original_uri = original_uri or self.uri
-        doc_format_info = get_document_format_info()
-        if (doc_format := self.uri.format) not in doc_format_info:
+        self.document_format = document_formats.get(self.uri.format)
+        if self.document_format is None:
             raise UnsupportedDocumentError(
                 f"Could not open document from uri {self.uri}. The format is not supported."
             )
-        self.document_cls = doc_format_info[doc_format]
 
     def __repr__(self):
         return f"UriResolver(uri={self.uri})"
 
+    @property
+    def document_cls(self):
+        # Imports the implementation of the format, if this is the first document of its format
+        return BaseDocument.get_document_class_given_format(self.uri.format)
+
     def should_read_async(self):
-        return self.document_cls.should_read_async()
+        return DC.ASYNC_READ in self.document_format.capabilities
+
+    def should_read_progressively(self):
+        return (
+            DC.PROGRESSIVE_READ in self.document_format.capabilities
+            and config.conf["general"]["progressive_document_loading"]
+        )
 
     def read_document(self):
         try:
@@ -115,7 +129,10 @@ class UriResolver:
             raise
 
     def _do_read_document(self):
-        document = self.document_cls(self.uri)
+        uri = self.uri
+        if self.should_read_progressively():
+            uri = uri.create_copy(view_args={"progressive_read": True})
+        document = self.document_cls(uri)
         try:
             document.read()
         except DocumentEncryptedError:
@@ -128,8 +145,34 @@ class UriResolver:
             ):
                 raise e
             raise ReaderError("Failed to open document") from e
+        if document.is_single_page_document():
+            # Parse up to the initial position here, rather than on the GUI thread
+            document.wait_for_position(self.get_initial_position_hint())
         return document
 
+    def get_initial_position_hint(self) -> int:
+        """
+        The position the document is likely to be opened at. Only the uri is used
+        to find the last saved position, because matching documents by their
+        content hash requires the whole document to be loaded.
+        """
+        if open_args := self.original_uri.openner_args:
+            return int(open_args.get("position", 0))
+        if not (
+            self.original_uri.view_args.get("save_last_position", True)
+            and config.conf["general"]["open_with_last_position"]
+        ):
+            return 0
+        with read_session() as session:
+            last_position = (
+                session.query(DocumentPositionInfo.last_position)
+                .filter(DocumentPositionInfo.uri_key == self.original_uri.to_key_string())
+                .order_by(DocumentPositionInfo.id.asc())
+                .limit(1)
+                .scalar()
+            )
+        return last_position or 0
+
 
 class EBookReader:
     """The controller that glues together the
@@ -143,6 +186,7 @@ class EBookReader:
         "__state",
         "current_book",
         "current_book_record",
+        "page_prefetcher",
     ]
 
     def _record_matches_document(self, record, uri_for_storage, content_hash):
@@ -195,27 +239,8 @@ class EBookReader:
                 matching_ids.add(record.id)
         return matching_records
 
-    def _merge_book_records(self, record, duplicates):
-        for duplicate in duplicates:
-            for annotation_model in (Bookmark, Note, Quote):
-                annotation_model.query.filter_by(book_id=duplicate.id).update(
-                    {annotation_model.book_id: record.id},
-                    synchronize_session=False,
-                )
-
-    def _merge_document_position_infos(self, record, duplicates):
-        if record.get_last_position() != (0, 0):
-            return
-        for duplicate in duplicates:
-            if duplicate.get_last_position() != (0, 0):
-                record.last_page, record.last_position = duplicate.get_last_position()
-                return
-
     def _merge_document_records(self, model, session, record, duplicates):
-        if model is Book:
-            self._merge_book_records(record, duplicates)
-        elif model is DocumentPositionInfo:
-            self._merge_document_position_infos(record, duplicates)
+        record.merge_duplicates(session, duplicates)
         for duplicate in duplicates:
             session.delete(duplicate)
 
@@ -275,7 +300,7 @@ class EBookReader:
         def get_content_hash():
             nonlocal content_hash
             if content_hash is _CONTENT_HASH_UNSET:
-                content_hash = doc.get_content_hash()
+                content_hash = get_content_hash_for_lookup(doc)
             return content_hash
 
         self.current_book_record = self._get_or_create_document_record(
@@ -301,7 +326,9 @@ class EBookReader:
             Book,
             title=current_book.title,
             uri_for_storage=self.document.uri,
-            content_hash_provider=self.document.get_content_hash,
+            content_hash_provider=partial(
+                get_content_hash_for_lookup, self.document
+            ),
         )
         return self.current_book_record
 
@@ -316,6 +343,7 @@ class EBookReader:
         self.document = None
         self.stored_document_info = None
         self.current_book_record = None
+        self.page_prefetcher = None
         self.__state = {}
 
     def set_document(
@@ -328,6 +356,7 @@ class EBookReader:
         self.__state.pop("active_section", None)
         self.document = document
         self.current_book = self.document.metadata
+        self.page_prefetcher = self._create_page_prefetcher()
         self.set_view_parameters()
         # Use the original URI for storage, falling back to the document's URI
         # if no original URI was passed (i.e., for non-converted files).
@@ -341,6 +370,10 @@ class EBookReader:
             self.stored_document_info = self._get_or_create_document_position_info(
                 document, uri_for_storage
             )
+        if self.document.is_single_page_document():
+            # Usually loaded by the resolver already, unless the position
+            # was found by matching the content hash of the document
+            self.document.wait_for_position(self._get_initial_position())
         # the current_page is set after the document position info and related models are created in order to allow dependent services to access the current_book
         self.current_page = 0
         if open_args := self.document.uri.openner_args:
@@ -367,6 +400,27 @@ class EBookReader:
         self.__state["ready"] = True
         reader_book_loaded.send(self)
 
+    def _get_initial_position(self) -> int:
+        if open_args := self.document.uri.openner_args:
+            return int(open_args.get("position", 0))
+        elif (
+            self.stored_document_info
+            and config.conf["general"]["open_with_last_position"]
+        ):
+            return self.stored_document_info.get_last_position()[1]
+        return 0
+
+    def _create_page_prefetcher(self) -> PagePrefetcher | None:
+        if self.document.is_single_page_document():
+            return None
+        advanced_config = config.conf["advanced"]
+        return PagePrefetcher(
+            self.document,
+            ahead=advanced_config["prefetch_pages_ahead"],
+            behind=advanced_config["prefetch_pages_behind"],
+            memory_ceiling=advanced_config["prefetch_memory_ceiling"] * 1024 * 1024,
+        )
+
     def set_view_parameters(self):
         self.view.set_title(self.get_view_title(include_author=True))
         self.view.set_text_direction(self.document.language.is_rtl)
@@ -380,6 +434,11 @@ class EBookReader:
         if self.document is None:
             return
         try:
+            if self.page_prefetcher is not None:
+                self.page_prefetcher.cancel()
+                log.debug(f"Page prefetching stats: {self.page_prefetcher.stats}")
+            # Queued prefetching and indexing of this document are no longer needed
+            task_scheduler.cancel_group(self.document.uri)
             if self.ready:
                 log.debug("Saving current position.")
                 self.save_current_position()
@@ -436,6 +495,8 @@ class EBookReader:
                 f"Total number of pages in the document is: {len(self.document)}"
             )
         self.__state["current_page_index"] = value
+        if self.page_prefetcher is not None:
+            self.page_prefetcher.page_changed(value)
         page = self.document[value]
         if not self.document.is_single_page_document():
             self.active_section = page.section
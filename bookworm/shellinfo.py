@@ -36,9 +36,9 @@ class SupportedFileFormat:
 def get_ext_info(supported="*"):
     doctypes = {}
     shell_integratable_docs = [
-        doc_cls
-        for doc_cls in get_document_format_info().values()
-        if (not doc_cls.__internal__) and (doc_cls.extensions is not None)
+        document_format
+        for document_format in get_document_format_info().values()
+        if not document_format.internal
     ]
     for cls in shell_integratable_docs:
         for ext in cls.extensions:
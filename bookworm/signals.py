@@ -23,6 +23,12 @@ reader_book_unloaded = _signals.signal("reader/unloaded")
 reader_page_changed = _signals.signal("reader/page_changed")
 reader_section_changed = _signals.signal("reader/section_changed")
 
+# Document signals
+document_content_extended = _signals.signal("document/content_extended")
+
+# Database
+content_hash_backfill_progressed = _signals.signal("database/content_hash_backfill_progressed")
+
 # Configuration
 config_updated = _signals.signal("config/updated")
 
@@ -6,7 +6,9 @@ import re
 from functools import cached_property
 from itertools import chain
 
+import attr
 import ftfy
+import msgpack
 from inscriptis import Inscriptis
 from inscriptis.css_profiles import RELAXED_CSS_PROFILE, STRICT_CSS_PROFILE
 from inscriptis.model.config import ParserConfig
@@ -196,3 +198,76 @@ class StructuredHtmlParser(Inscriptis):
             ]
         )
         return parsed.html
+
+
+@attr.s(auto_attribs=True, slots=True)
+class StructuredHtmlSnapshot:
+    """
+    A detached copy of the products of `StructuredHtmlParser`.
+    Unlike the parser, it does not hold the lxml tree, and it can be
+    serialized to a compact binary blob to be stored in a persistent cache.
+    """
+
+    text: str
+    semantic_elements: dict[SemanticElementType, list[tuple[int, int]]]
+    styled_elements: dict[Style, list[tuple[int, int]]]
+    html_id_ranges: dict[str, tuple[int, int]]
+    link_targets: dict[tuple[int, int], str]
+    table_markup: list[str] = attr.ib(factory=list)
+
+    @classmethod
+    def from_parser(cls, parser: StructuredHtmlParser) -> StructuredHtmlSnapshot:
+        return cls(
+            text=parser.get_text(),
+            semantic_elements=parser.semantic_elements,
+            styled_elements=parser.styled_elements,
+            html_id_ranges=parser.html_id_ranges,
+            link_targets=parser.link_targets,
+            table_markup=[
+                parser.get_table_markup(idx)
+                for idx in range(len(parser._table_elements))
+            ],
+        )
+
+    @classmethod
+    def from_string(cls, html_string: str) -> StructuredHtmlSnapshot:
+        return cls.from_parser(StructuredHtmlParser.from_string(html_string))
+
+    def get_text(self) -> str:
+        return self.text
+
+    def get_table_markup(self, table_index: int) -> str:
+        return self.table_markup[table_index]
+
+    def dumps(self) -> bytes:
+        return msgpack.dumps(
+            [
+                self.text,
+                {int(k): v for k, v in self.semantic_elements.items()},
+                {int(k): v for k, v in self.styled_elements.items()},
+                self.html_id_ranges,
+                list(self.link_targets.items()),
+                self.table_markup,
+            ]
+        )
+
+    @classmethod
+    def loads(cls, data: bytes) -> StructuredHtmlSnapshot:
+        (
+            text,
+            semantic_elements,
+            styled_elements,
+            html_id_ranges,
+            link_targets,
+            table_markup,
+        ) = msgpack.loads(data, use_list=False, strict_map_key=False)
+        return cls(
+            text=text,
+            semantic_elements={
+                SemanticElementType(k): list(v) for k, v in semantic_elements.items()
+            },
+            styled_elements={Style(k): list(v) for k, v in styled_elements.items()},
+            html_id_ranges=html_id_ranges,
+            link_targets=dict(link_targets),
+            table_markup=list(table_markup),
+        )
@@ -7,6 +7,8 @@ import importlib
 import hashlib
 import os
 import sys
+import threading
+import types
 import uuid
 from functools import lru_cache, wraps
 from pathlib import Path
@@ -134,6 +136,51 @@ def format_datetime(
     )
 
 
-def lazy_module(mod: str):
-    module = importlib.__import__(mod)
-    return module
+class LazyModule(types.ModuleType):
+    """
+    Stands for a module which is imported on the first access to any of its
+    attributes. Only the first access pays for the import, which is done once
+    even if several threads get there at the same time.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        vars(self).update(_lazy_module=None, _lazy_module_lock=threading.Lock())
+
+    def get_module(self) -> types.ModuleType:
+        """Import the module if it was not imported yet, and return it."""
+        if (module := vars(self)["_lazy_module"]) is not None:
+            return module
+        with vars(self)["_lazy_module_lock"]:
+            if (module := vars(self)["_lazy_module"]) is None:
+                log.debug(f"Importing module {self.__name__} on first use.")
+                module = importlib.import_module(self.__name__)
+                vars(self)["_lazy_module"] = module
+        return module
+
+    @property
+    def is_loaded(self) -> bool:
+        return vars(self)["_lazy_module"] is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.get_module(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.get_module(), attr, value)
+
+    def __dir__(self):
+        return dir(self.get_module())
+
+    def __repr__(self):
+        state = "imported" if self.is_loaded else "not imported yet"
+        return f"<lazy module {self.__name__!r}, {state}>"
+
+
+def lazy_module(mod: str) -> types.ModuleType:
+    """
+    Return the given module, deferring its import until it is first used.
+    Modules which are already imported are returned as is.
+    """
+    if (module := sys.modules.get(mod)) is not None:
+        return module
+    return LazyModule(mod)
@@ -7,8 +7,6 @@ from functools import lru_cache, partial
 import wx
 import wx.lib.sized_controls as sc
 from bidict import bidict
-from mediawiki import MediaWiki
-from mediawiki.exceptions import DisambiguationError, PageError
 
 from bookworm import app
 from bookworm.gui.components import AsyncSnakDialog, SimpleDialog
@@ -17,8 +15,11 @@ from bookworm.logger import logger
 from bookworm.paths import resources_path
 from bookworm.resources import sounds
 from bookworm.service import BookwormService
+from bookworm.utils import lazy_module
 
 log = logger.getChild(__name__)
+mediawiki = lazy_module("mediawiki")
+mediawiki_exceptions = lazy_module("mediawiki.exceptions")
 
 
 class NoMatches(Exception):
@@ -122,12 +123,12 @@ class WikipediaService(BookwormService):
     def define_term_using_wikipedia(
         self, term: str, language, sure_exists=False
     ) -> str:
-        wiki = MediaWiki(lang=language)
+        wiki = mediawiki.MediaWiki(lang=language)
         try:
             page = wiki.page(title=term, auto_suggest=True, preload=True)
-        except DisambiguationError as e:
+        except mediawiki_exceptions.DisambiguationError as e:
             raise MultipleMatches(e.options, language)
-        except PageError:
+        except mediawiki_exceptions.PageError:
             search_results = [title for (title, __, ___) in wiki.opensearch(term)]
             if search_results:
                 raise MultipleMatches(search_results, language)
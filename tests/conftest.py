@@ -4,13 +4,16 @@ import tempfile
 import time
 
 import pytest
+from pptx import Presentation
 from sqlalchemy.orm import close_all_sessions
 from sqlalchemy.pool import NullPool
 
+from bookworm.bookshelf.local_bookshelf import models as bookshelf_models
 from bookworm.config import setup_config
 from bookworm.database import init_database
 from bookworm.database.models import Base
 from bookworm.document.elements import Section
+from bookworm.document.uri import DocumentUri
 from bookworm.reader import EBookReader
 from bookworm.service.handler import ServiceHandler
 
@@ -91,6 +94,59 @@ def engine(tmp_path):
     engine.dispose()
 
 
+@pytest.fixture()
+def bookshelf_database(tmp_path):
+    bookshelf_models.database.init(os.fspath(tmp_path / "bookshelf.sqlite"))
+    bookshelf_models.BaseModel.create_all()
+    yield bookshelf_models.database
+    bookshelf_models.database.close()
+
+
+@pytest.fixture()
+def posix_uri_root(tmp_path, monkeypatch):
+    """
+    Stored uris of absolute POSIX paths are read back relative to the root.
+    Request this fixture after the database fixtures, which need the original directory.
+    """
+    monkeypatch.chdir(tmp_path.anchor)
+
+
+def add_document(title, page_texts):
+    """Add a plain text document with the given pages to the bookshelf."""
+    doc_format, _created = bookshelf_models.Format.get_or_create(name="plain_text")
+    document = bookshelf_models.Document.create(
+        uri=DocumentUri.from_filename(f"{title}.txt"), title=title, format=doc_format
+    )
+    for n, text in enumerate(page_texts):
+        bookshelf_models.Page.create(number=n, content=text, document=document)
+    return document
+
+
+def add_documents(num_documents, pages_per_document=20):
+    """Add many documents, with pages of a few kilobytes, to the bookshelf."""
+    doc_format, _created = bookshelf_models.Format.get_or_create(name="plain_text")
+    with bookshelf_models.database.atomic():
+        for n in range(num_documents):
+            document = bookshelf_models.Document.create(
+                uri=DocumentUri("plain_text", f"/books/{n}.txt", {}),
+                title=f"Book {n}",
+                format=doc_format,
+            )
+            bookshelf_models.Page.insert_many(
+                {"number": i, "document": document, "content": f"Page {i} " + "text " * 400}
+                for i in range(pages_per_document)
+            ).execute()
+
+
+def make_presentation(filename, slide_titles):
+    """Save a presentation with a titled slide for each of the given titles."""
+    presentation = Presentation()
+    for title in slide_titles:
+        presentation.slides.add_slide(presentation.slide_layouts[5]).shapes.title.text = title
+    presentation.save(filename)
+    return DocumentUri.from_filename(filename)
+
+
 @pytest.fixture()
 def reader(view, engine):
     setup_config()
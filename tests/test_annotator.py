@@ -7,6 +7,7 @@ import pytest
 from bookworm import config
 from bookworm.annotation import AnnotationService, NoteTaker
 from bookworm.annotation.annotator import AnnotationSortCriteria
+from bookworm.database import read_session
 from bookworm.database.models import *
 from bookworm.document.uri import DocumentUri
 from bookworm.signals import reader_book_loaded
@@ -129,3 +130,24 @@ def test_comments_are_styled_on_initial_landing_page(asset, reader, view, monkey
 
     assert styled_positions == [0]
     reader.unload()
+
+
+
+def test_annotations_are_read_while_the_database_is_being_written_to(asset, reader, engine):
+    reader.load(DocumentUri.from_filename(asset("roman.epub")))
+    notes = NoteTaker(reader)
+    notes.create(title="test", content="test", position=0, start_pos=0, end_pos=1)
+    writer = engine.raw_connection()
+    try:
+        cursor = writer.cursor()
+        assert cursor.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        # Without the write-ahead log, this would keep the readers waiting
+        cursor.execute("BEGIN EXCLUSIVE")
+        cursor.execute("UPDATE note SET title = 'pending'")
+        with read_session() as session:
+            assert [note.title for note in notes.get_for_page(session=session)] == ["test"]
+        writer.commit()
+        with read_session() as session:
+            assert [note.title for note in notes.get_for_page(session=session)] == ["pending"]
+    finally:
+        writer.close()
@@ -0,0 +1,74 @@
+import pytest
+
+from bookworm.bookshelf.local_bookshelf import models
+from conftest import add_document
+
+
+def search(term, field="content"):
+    return list(models.DocumentFTSIndex.search_for_term(term, field=field))
+
+
+def test_full_text_indexes_follow_pages_and_documents(bookshelf_database):
+    first = add_document("Walrus Tales", ["The first page", "A page about penguins"])
+    add_document("Other Stories", ["Penguins again"])
+    results = search("penguins")
+    assert {(r.document_title, r.page_index) for r in results} == {
+        ("Walrus Tales", 1),
+        ("Other Stories", 0),
+    }
+    [title_result] = search("walrus", field="title")
+    assert title_result.document_id == first.get_id()
+    assert title_result.page_id == models.Page.get(document=first, number=0).get_id()
+
+    first.title = "Seal Tales"
+    first.save()
+    assert not search("walrus", field="title")
+    assert [r.document_title for r in search("seal", field="title")] == ["Seal Tales"]
+
+    first.delete_instance()
+    assert [r.document_title for r in search("penguins")] == ["Other Stories"]
+    assert not search("seal", field="title")
+
+
+def test_version_2_bookshelf_rebuilds_the_full_text_index_once(bookshelf_database, monkeypatch):
+    add_document("Walrus Tales", ["A page about penguins"])
+    bookshelf_database.execute_sql("PRAGMA user_version=2")
+    rebuilds = []
+    rebuild = models.DocumentFTSIndex.rebuild.__func__
+    monkeypatch.setattr(
+        models.DocumentFTSIndex,
+        "rebuild",
+        classmethod(lambda cls: rebuilds.append(cls) or rebuild(cls)),
+    )
+
+    models.BaseModel.perform_migrations()
+
+    assert len(rebuilds) == 1
+    user_version = bookshelf_database.execute_sql("PRAGMA user_version").fetchone()[0]
+    assert user_version == models.BOOKWORM_BOOKSHELF_SCHEMA_VERSION
+    assert [r.document_title for r in search("penguins")] == ["Walrus Tales"]
+
+
+def test_compressed_page_text_is_searchable(bookshelf_database):
+    pytest.importorskip("zstandard")
+    from bookworm.bookshelf.local_bookshelf import tasks
+
+    words = ["walrus", "penguin", "seal", "otter", "heron", "puffin", "gannet"]
+    for d in range(4):
+        page_texts = [
+            f"{' '.join(words[(n + i) % 7] for i in range(40))} marker{d}x{n}" for n in range(40)
+        ]
+        add_document(f"Document {d}", page_texts)
+    before = [(r.page_id, r.snippet) for r in search("marker2x5")]
+    report = tasks.compress_bookshelf_page_text()
+    assert report.num_changed_pages == 160
+    assert report.compression_ratio > 1
+    assert [(r.page_id, r.snippet) for r in search("marker2x5")] == before
+    [(page_id, _snippet)] = before
+    assert models.Page.get_text_start_position(page_id, "marker2x5") > 0
+
+    assert tasks.get_page_text_compressor() is not None
+    report = tasks.decompress_bookshelf_page_text()
+    assert report.num_changed_pages == 160
+    assert tasks.get_page_text_compressor() is None
+    assert [(r.page_id, r.snippet) for r in search("marker2x5")] == before
@@ -0,0 +1,111 @@
+import datetime
+import time
+
+import apsw
+import pytest
+from PIL import Image
+
+from bookworm.bookshelf.local_bookshelf import models
+from bookworm.bookshelf.local_bookshelf.database import paginate_by_key
+from bookworm.document.uri import DocumentUri
+from bookworm.image_io import ImageIO
+
+
+@pytest.fixture
+def documents(bookshelf_database):
+    doc_format, _created = models.Format.get_or_create(name="plain_text")
+    start = datetime.datetime(2020, 1, 1)
+    for n in range(25):
+        models.Document.create(
+            uri=DocumentUri("plain_text", f"/books/{n}.txt", {}),
+            # Repeated titles and dates check that ties are broken by the key
+            title=f"Book {n % 7}",
+            format=doc_format,
+            date_added=start + datetime.timedelta(days=n % 4),
+        )
+    return models.Document
+
+
+def collect_pages(query, limit):
+    pages = []
+    rows, next_key = paginate_by_key(query, models.Document.id, limit=limit)
+    pages.append(rows)
+    while next_key is not None:
+        rows, next_key = paginate_by_key(query, models.Document.id, after=next_key, limit=limit)
+        pages.append(rows)
+    return pages
+
+
+@pytest.mark.parametrize(
+    "ordering",
+    [
+        (models.Document.title.asc(),),
+        (models.Document.date_added.desc(), models.Document.title.desc()),
+        (models.Document.id.asc(),),
+    ],
+)
+def test_keyset_pages_cover_the_query_in_order(documents, ordering):
+    query = models.Document.select().order_by(*ordering)
+    pages = collect_pages(query, limit=4)
+    assert [len(page) for page in pages] == [4] * 6 + [1]
+    paged_titles = [(doc.title, doc.date_added) for page in pages for doc in page]
+    assert paged_titles == [(doc.title, doc.date_added) for doc in query]
+    assert len({doc.id for page in pages for doc in page}) == 25
+
+
+def test_limited_queries_are_paged_by_offset(documents):
+    query = models.Document.select().order_by(models.Document.title).limit(10)
+    pages = collect_pages(query, limit=4)
+    assert [len(page) for page in pages] == [4, 4, 2]
+    assert [doc.id for page in pages for doc in page] == [doc.id for doc in query]
+
+
+def test_thumbnails_are_created_once_from_the_cover(bookshelf_database, tmp_path):
+    Image.new("RGB", (600, 800), "red").save(tmp_path / "cover.png")
+    doc_format, _created = models.Format.get_or_create(name="plain_text")
+    with_cover = models.Document.create(
+        uri=DocumentUri("plain_text", "/books/cover.txt", {}),
+        title="With cover",
+        format=doc_format,
+        cover_image=ImageIO.from_filename(tmp_path / "cover.png"),
+    )
+    without_cover = models.Document.create(
+        uri=DocumentUri("plain_text", "/books/plain.txt", {}),
+        title="Without cover",
+        format=doc_format,
+    )
+    thumbnail = models.DocumentThumbnail.get_thumbnail(with_cover.id, 120)
+    assert ImageIO.from_bytes(thumbnail).size == (120, 120)
+    assert models.DocumentThumbnail.get_thumbnail(with_cover.id, 120) == thumbnail
+    assert models.DocumentThumbnail.get_thumbnail(without_cover.id, 120) is None
+    assert models.DocumentThumbnail.select().count() == 2
+    with_cover.delete_instance()
+    assert models.DocumentThumbnail.select().count() == 1
+
+
+def test_thumbnails_are_not_cached_while_the_database_is_written_to(
+    bookshelf_database, tmp_path
+):
+    Image.new("RGB", (600, 800), "red").save(tmp_path / "cover.png")
+    doc_format, _created = models.Format.get_or_create(name="plain_text")
+    document = models.Document.create(
+        uri=DocumentUri("plain_text", "/books/cover.txt", {}),
+        title="With cover",
+        format=doc_format,
+        cover_image=ImageIO.from_filename(tmp_path / "cover.png"),
+    )
+    # Locks are only seen by connections opened through the same SQLite library
+    writer = apsw.Connection(bookshelf_database.database)
+    try:
+        writer.execute("BEGIN IMMEDIATE")
+        started = time.perf_counter()
+        thumbnail = models.DocumentThumbnail.get_thumbnail(document.id, 120)
+        assert time.perf_counter() - started < 1
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+    assert ImageIO.from_bytes(thumbnail).size == (120, 120)
+    assert models.DocumentThumbnail.select().count() == 0
+    assert models.DocumentThumbnail.get_thumbnail(document.id, 120) == thumbnail
+    assert models.DocumentThumbnail.select().count() == 1
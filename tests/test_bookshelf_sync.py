@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from bookworm.bookshelf.local_bookshelf import models
+from bookworm.bookshelf.local_bookshelf.tasks import (
+    index_bookshelf_documents,
+    sync_folder_to_bookshelf,
+)
+from bookworm.document.cache_utils import hash_file
+
+
+def write_documents(folder, count):
+    (folder / "sub").mkdir(parents=True)
+    for i in range(count):
+        parent = folder if i % 2 else folder / "sub"
+        (parent / f"doc{i}.txt").write_text(f"Document {i} keyword{i}\n" * 10)
+
+
+def test_folder_sync_skips_unchanged_and_prunes_removed_files(
+    bookshelf_database, tmp_path
+):
+    folder = tmp_path / "library"
+    write_documents(folder, 4)
+    report = sync_folder_to_bookshelf(folder, "", True, num_workers=1)
+    assert report.num_documents == 4
+    assert not report.failed
+    # The files are hashed by the extraction workers
+    assert {(e.path, e.file_hash) for e in models.FolderSyncEntry.select()} == {
+        (os.fspath(path), hash_file(path)) for path in folder.rglob("*.txt")
+    }
+
+    report = sync_folder_to_bookshelf(folder, "", True, num_workers=1)
+    assert (report.num_documents, report.num_skipped) == (0, 4)
+
+    (folder / "sub" / "doc0.txt").unlink()
+    (folder / "doc1.txt").write_text("Changed content\n")
+    report = sync_folder_to_bookshelf(folder, "", True, num_workers=1)
+    assert (report.num_documents, report.num_skipped, report.num_removed) == (1, 2, 1)
+    assert models.Document.select().count() == 3
+    assert not list(models.DocumentFTSIndex.search_for_term("keyword0"))
+    assert not list(models.DocumentFTSIndex.search_for_term("keyword1"))
+    assert list(models.DocumentFTSIndex.search_for_term("changed"))
+
+
+def test_folder_sync_reports_failed_files_without_retrying_them(
+    bookshelf_database, tmp_path
+):
+    folder = tmp_path / "library"
+    write_documents(folder, 2)
+    (folder / "broken.epub").write_bytes(b"Not an epub file")
+    report = sync_folder_to_bookshelf(folder, "", True, num_workers=1)
+    assert report.num_documents == 2
+    assert [os.path.basename(f.filename) for f in report.failed] == ["broken.epub"]
+
+    report = sync_folder_to_bookshelf(folder, "", True, num_workers=1)
+    assert report.num_documents == 0
+    assert len(report.failed) == 1
+
+
+def test_documents_added_without_text_are_indexed_later(
+    bookshelf_database, posix_uri_root, tmp_path
+):
+    folder = tmp_path / "library"
+    write_documents(folder, 3)
+    report = sync_folder_to_bookshelf(folder, "", False, num_workers=1)
+    assert report.num_documents == 3
+    assert models.Page.select().count() == 0
+
+    report = index_bookshelf_documents(num_workers=1)
+    assert (report.num_documents, report.num_skipped) == (3, 0)
+    assert not report.failed
+    assert {r.document_title for r in models.DocumentFTSIndex.search_for_term("keyword2")} == {
+        "doc2"
+    }
+    assert index_bookshelf_documents(num_workers=1).num_documents == 0
@@ -1,3 +1,5 @@
+import datetime
+import os
 import shutil
 from pathlib import Path
 
@@ -11,6 +13,7 @@ from sqlalchemy.pool import NullPool
 
 from bookworm.annotation import NoteTaker
 from bookworm.database import init_database
+from bookworm.database.content_hash_backfill import ContentHashBackfill
 from bookworm.database.models import (
     Book,
     DocumentPositionInfo,
@@ -19,6 +22,7 @@ from bookworm.database.models import (
     RecentDocument,
 )
 from bookworm.document import BaseDocument, BasePage, BookMetadata, Pager, Section, create_document
+from bookworm.document import cache_utils, identity
 from bookworm.document.uri import DocumentUri
 from bookworm.gui.book_viewer import recents_manager
 
@@ -167,7 +171,7 @@ def test_content_hash_migration_only_adds_schema(asset, tmp_path):
     try:
         with migrated_engine.connect() as conn:
             revision = conn.execute(text("SELECT version_num FROM alembic_version")).scalar_one()
-            assert revision == "707543f03b6d"
+            assert revision == "9c3e1f7a2b64"
             for table_name in (
                 "book",
                 "document_position_info",
@@ -183,6 +187,43 @@ def test_content_hash_migration_only_adds_schema(asset, tmp_path):
         migrated_engine.dispose()
 
 
+def test_uri_key_migration_backfills_existing_records(asset, tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'migration.db'}"
+    document_uri = DocumentUri.from_filename(asset("test.md"))
+    uri_with_openner_args = document_uri.create_copy(openner_args={"page": "3"})
+
+    command.upgrade(_make_alembic_config(db_url), "707543f03b6d")
+    seed_engine = create_engine(db_url, poolclass=NullPool)
+    with seed_engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO recent_document (title, uri) VALUES (:title, :uri)"),
+            {"title": "recent", "uri": uri_with_openner_args.to_uri_string()},
+        )
+        conn.execute(
+            text("INSERT INTO book (title, uri) VALUES (:title, :uri)"),
+            {"title": "malformed", "uri": "http://example.com/book.md"},
+        )
+    seed_engine.dispose()
+
+    migrated_engine = init_database(url=db_url, poolclass=NullPool)
+    try:
+        with migrated_engine.connect() as conn:
+            uri_key = conn.execute(text("SELECT uri_key FROM recent_document")).scalar_one()
+            malformed_uri_key = conn.execute(text("SELECT uri_key FROM book")).scalar_one()
+            index_names = conn.execute(
+                text("SELECT name FROM sqlite_master WHERE tbl_name = 'book' AND type = 'index'")
+            ).scalars().all()
+        assert uri_key == document_uri.to_key_string()
+        assert malformed_uri_key is None
+        assert {"ix_book_uri_key", "ix_book_content_hash"} <= set(index_names)
+        assert RecentDocument.get_by_uri_key(document_uri).title == "recent"
+        recents_manager.remove_from_recents(document_uri)
+        assert RecentDocument.query.count() == 0
+    finally:
+        close_all_sessions()
+        migrated_engine.dispose()
+
+
 def test_filename_derived_titles_follow_moved_paths(reader, tmp_path):
     first_path = tmp_path / "first.txt"
     second_path = tmp_path / "second.txt"
@@ -571,3 +612,161 @@ def test_pinned_documents_merge_existing_uri_and_hash_duplicates(asset, tmp_path
     assert merged_pinned.content_hash == content_hash
     assert merged_pinned.is_pinned is True
     assert merged_pinned.pinning_order == 7
+
+
+def test_pinned_documents_without_order_or_timestamps_are_merged():
+    last_opened_on = datetime.datetime(2020, 1, 1)
+    pinned = PinnedDocument(
+        title="moved", uri=DocumentUri("txt", "/moved.txt", {}), pinning_order=None
+    )
+    duplicates = [
+        PinnedDocument(
+            title="original",
+            uri=DocumentUri("txt", "/original.txt", {}),
+            is_pinned=True,
+            pinning_order=None,
+            last_opened_on=last_opened_on,
+        ),
+        PinnedDocument(title="copy", uri=DocumentUri("txt", "/copy.txt", {}), pinning_order=3),
+    ]
+
+    pinned.merge_duplicates(None, duplicates)
+
+    assert (pinned.is_pinned, pinned.pinning_order) == (True, 3)
+    assert pinned.last_opened_on == last_opened_on
+
+
+def test_file_fingerprint_is_reused_until_the_file_changes(tmp_path, monkeypatch):
+    filename = tmp_path / "book.txt"
+    filename.write_text("first", encoding="utf-8")
+    hashed_files = []
+    hash_file = cache_utils.hash_file
+    monkeypatch.setattr(
+        cache_utils, "hash_file", lambda path: hashed_files.append(path) or hash_file(path)
+    )
+
+    fingerprint = cache_utils.get_file_fingerprint(filename)
+    assert cache_utils.get_file_fingerprint(filename) == fingerprint
+    assert len(hashed_files) == 1
+
+    filename.write_text("second", encoding="utf-8")
+    os.utime(filename, ns=(0, 0))
+    assert cache_utils.get_file_fingerprint(filename) != fingerprint
+    assert len(hashed_files) == 2
+
+
+def test_paginated_content_hash_is_computed_in_background_and_written_back(
+    engine, tmp_path, monkeypatch
+):
+    filename = tmp_path / "slides.pptx"
+    presentation = Presentation()
+    presentation.slides.add_slide(presentation.slide_layouts[5]).shapes.title.text = (
+        f"Unique text {os.urandom(8).hex()}"
+    )
+    presentation.save(filename)
+    uri = DocumentUri.from_filename(filename)
+    scheduled = []
+    monkeypatch.setattr(identity, "compute_content_hash_in_background", scheduled.append)
+    document = create_document(uri)
+
+    assert identity.get_content_hash_for_lookup(document) is None
+    assert scheduled == [document]
+
+    recents_manager.add_to_recents(document)
+    assert RecentDocument.query.one().content_hash is None
+    content_hash = identity._compute_content_hash(create_document(uri))
+    identity.store_content_hash_in_records(uri, content_hash)
+    RecentDocument.session.expire_all()
+    assert RecentDocument.query.one().content_hash == content_hash
+
+    reopened_document = create_document(uri)
+    monkeypatch.setattr(
+        reopened_document,
+        "_compute_content_hash",
+        lambda: pytest.fail("the stored content hash should be reused"),
+    )
+    num_scheduled = len(scheduled)
+    assert identity.get_content_hash_for_lookup(reopened_document) == content_hash
+    assert len(scheduled) == num_scheduled
+
+
+@pytest.mark.usefixtures("engine")
+def test_content_hash_is_stored_in_records_of_the_document_with_other_openner_args():
+    uri = DocumentUri("txt", "/book.txt", {})
+    RecentDocument.get_or_create(title="book", uri=uri.create_copy(openner_args={"page": 3}))
+    PinnedDocument.get_or_create(title="other", uri=DocumentUri("txt", "/other.txt", {}))
+
+    identity.store_content_hash_in_records(uri, "content hash")
+
+    RecentDocument.session.expire_all()
+    assert RecentDocument.query.one().content_hash == "content hash"
+    assert PinnedDocument.query.one().content_hash is None
+
+
+def test_backfill_hashes_and_merges_existing_records(engine, posix_uri_root, tmp_path):
+    text = f"Shared text {os.urandom(8).hex()}"
+    first_path = tmp_path / "first.txt"
+    second_path = tmp_path / "second.txt"
+    first_path.write_text(text, encoding="utf-8")
+    second_path.write_text(text, encoding="utf-8")
+    first_uri = DocumentUri.from_filename(first_path)
+    second_uri = DocumentUri.from_filename(second_path)
+
+    first_book = Book.get_or_create(title="first", uri=first_uri)
+    Book.get_or_create(title="second", uri=second_uri)
+    Note.session().add(
+        Note(
+            title="test",
+            content="test note",
+            page_number=0,
+            position=0,
+            section_title="test section",
+            section_identifier="test-section",
+            book_id=Book.query.filter_by(title="second").one().id,
+        )
+    )
+    DocumentPositionInfo.get_or_create(title="first", uri=first_uri)
+    DocumentPositionInfo.get_or_create(title="second", uri=second_uri).save_position(3, 9)
+    last_opened_on = datetime.datetime(2020, 1, 1)
+    RecentDocument.get_or_create(title="first", uri=first_uri, last_opened_on=last_opened_on)
+    RecentDocument.get_or_create(title="second", uri=second_uri)
+    RecentDocument.query.filter_by(title="second").one().last_opened_on = last_opened_on
+    RecentDocument.session.commit()
+    reports = []
+
+    progress = ContentHashBackfill(
+        max_workers=1, duty_cycle=1, progress_callback=reports.append
+    ).run()
+
+    content_hash = create_document(first_uri).get_content_hash()
+    assert (progress.total, progress.hashed, progress.failed) == (2, 2, 0)
+    assert progress.is_done and reports[-1] == progress
+    RecentDocument.session.expire_all()
+    assert Book.query.one().id == first_book.id
+    assert Book.query.one().content_hash == content_hash
+    assert Note.query.one().book_id == first_book.id
+    assert DocumentPositionInfo.query.one().get_last_position() == (3, 9)
+    assert RecentDocument.query.one().last_opened_on == last_opened_on
+    assert ContentHashBackfill().run().total == 0
+
+
+def test_backfill_skips_missing_and_remembers_unhashable_documents(
+    engine, posix_uri_root, tmp_path
+):
+    broken_path = tmp_path / "broken.epub"
+    broken_path.write_bytes(os.urandom(64))
+    RecentDocument.get_or_create(title="broken", uri=DocumentUri.from_filename(broken_path))
+    RecentDocument.get_or_create(
+        title="missing", uri=DocumentUri.from_filename(tmp_path / "missing.epub")
+    )
+
+    progress = ContentHashBackfill(max_workers=1, duty_cycle=1).run()
+    assert (progress.total, progress.skipped, progress.failed) == (2, 1, 1)
+    progress = ContentHashBackfill(max_workers=1, duty_cycle=1).run()
+    assert (progress.total, progress.skipped, progress.failed) == (2, 2, 0)
+
+    broken_path.write_bytes(os.urandom(64))
+    os.utime(broken_path, ns=(0, 0))
+    progress = ContentHashBackfill(max_workers=1, duty_cycle=1).run()
+    assert (progress.total, progress.skipped, progress.failed) == (2, 1, 1)
+    assert RecentDocument.query.filter(RecentDocument.content_hash.is_(None)).count() == 2
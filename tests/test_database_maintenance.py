@@ -0,0 +1,91 @@
+import os
+import sqlite3
+
+import pytest
+
+from bookworm.bookshelf.local_bookshelf import models
+from bookworm.database import DocumentPositionInfo, database_maintenance, init_database
+from bookworm.database.maintenance import (
+    MaintenanceTask,
+    MaintenanceThresholds,
+    SQLiteMaintenanceScheduler,
+)
+from bookworm.document.uri import DocumentUri
+from conftest import add_documents
+
+
+def test_bookshelf_maintenance_is_due_by_the_rows_changed(bookshelf_database):
+    target = models.BaseModel.create_maintenance_target()
+    target.thresholds = MaintenanceThresholds(
+        optimize_changes=100,
+        wal_checkpoint_changes=100,
+        vacuum_free_pages=16,
+        fts_merge_changes=100,
+    )
+    assert target.get_due_tasks() == []
+    add_documents(40)
+    assert target.get_stats().pending_changes[MaintenanceTask.OPTIMIZE] >= 40 * 21
+    due_tasks = target.get_due_tasks()
+    assert {MaintenanceTask.OPTIMIZE, MaintenanceTask.FTS_MERGE} <= set(due_tasks)
+    assert due_tasks[-1] is MaintenanceTask.WAL_CHECKPOINT
+    models.Document.delete().execute()
+    stats = target.get_stats()
+    assert stats.auto_vacuum == 2
+    assert stats.free_pages >= 16 and stats.wal_size > 0
+
+    completed_tasks = target.run_maintenance()
+
+    assert MaintenanceTask.VACUUM in completed_tasks
+    stats = target.get_stats()
+    assert stats.free_pages == 0
+    assert stats.wal_size == 0
+    assert stats.file_size < stats.page_size * (stats.page_count + 1)
+    assert all(stats.runs[task] == 1 for task in completed_tasks)
+    assert stats.last_maintained_on is not None
+    assert target.get_due_tasks() == []
+
+
+def test_databases_are_maintained_only_when_idle(engine):
+    scheduler = SQLiteMaintenanceScheduler(idle_time=0)
+    target = database_maintenance.get_target("database")
+    target.thresholds = MaintenanceThresholds(optimize_changes=1)
+    scheduler.register(target)
+
+    DocumentPositionInfo.get_or_create(title="book", uri=DocumentUri("txt", "/book.txt", {}))
+    assert target.get_pending_changes()[MaintenanceTask.OPTIMIZE] == 1
+    assert scheduler.run_idle_maintenance() == {}
+    assert scheduler.run_idle_maintenance() == {"database": [MaintenanceTask.OPTIMIZE]}
+    assert target.get_stats().time_spent[MaintenanceTask.OPTIMIZE] > 0
+    assert scheduler.run_idle_maintenance() == {}
+
+
+def test_reinitializing_an_engine_does_not_add_its_listeners_again(engine):
+    target = database_maintenance.get_target("database")
+    connect_listeners = len(engine.pool.dispatch.connect)
+    assert init_database(engine, url=str(engine.url)) is engine
+    assert len(engine.pool.dispatch.connect) == connect_listeners
+    assert database_maintenance.get_target("database") is target
+
+
+def test_existing_databases_are_converted_to_incremental_vacuuming(tmp_path):
+    filename = os.fspath(tmp_path / "bookshelf.sqlite")
+    with sqlite3.connect(filename) as connection:
+        connection.execute("CREATE TABLE created_before_incremental_vacuuming (id)")
+    models.database.init(filename)
+    try:
+        models.BaseModel.create_all()
+        target = models.BaseModel.create_maintenance_target()
+        target.thresholds = MaintenanceThresholds(vacuum_free_pages=16)
+        assert target.get_stats().auto_vacuum == 0
+        add_documents(20)
+        models.Document.delete().execute()
+        # A full vacuum can not be interrupted, so it is not run for large databases
+        target.thresholds = MaintenanceThresholds(vacuum_free_pages=16, full_vacuum_max_size=1024)
+        assert MaintenanceTask.VACUUM not in target.get_due_tasks()
+        target.thresholds = MaintenanceThresholds(vacuum_free_pages=16)
+
+        assert MaintenanceTask.VACUUM in target.run_maintenance()
+        stats = target.get_stats()
+        assert (stats.auto_vacuum, stats.free_pages) == (2, 0)
+    finally:
+        models.database.close()
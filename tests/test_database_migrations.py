@@ -0,0 +1,55 @@
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+from sqlalchemy.orm import close_all_sessions
+from sqlalchemy.pool import NullPool
+
+import bookworm.database
+from bookworm.database import init_database
+from bookworm.database.migrations import get_head_revision
+
+
+def _make_alembic_config(db_url):
+    cfg = Config(Path("alembic.ini"))
+    cfg.attributes["configure_logger"] = False
+    cfg.set_main_option("script_location", "alembic")
+    cfg.set_main_option("sqlalchemy.url", db_url)
+    return cfg
+
+
+def test_head_revision_is_read_from_the_migration_scripts():
+    script_directory = ScriptDirectory.from_config(_make_alembic_config("sqlite://"))
+    assert get_head_revision(Path("alembic")) == script_directory.get_current_head()
+
+
+def test_migrations_only_run_when_the_schema_is_behind(tmp_path, monkeypatch):
+    db_url = f"sqlite:///{tmp_path / 'database.sqlite'}"
+    upgrades = []
+    upgrade_schema = bookworm.database.upgrade_schema
+    monkeypatch.setattr(
+        bookworm.database,
+        "upgrade_schema",
+        lambda *args, **kwargs: upgrades.append(args) or upgrade_schema(*args, **kwargs),
+    )
+
+    def get_revision_after_init():
+        engine = init_database(url=db_url, poolclass=NullPool)
+        try:
+            with engine.connect() as conn:
+                return conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+        finally:
+            close_all_sessions()
+            engine.dispose()
+
+    head_revision = get_head_revision(Path("alembic"))
+    assert get_revision_after_init() == head_revision
+    assert len(upgrades) == 1
+    assert get_revision_after_init() == head_revision
+    assert len(upgrades) == 1
+
+    command.downgrade(_make_alembic_config(db_url), "-1")
+    assert get_revision_after_init() == head_revision
+    assert len(upgrades) == 2
@@ -1,22 +1,54 @@
 from functools import cached_property
 import gc
+import pickle
+import sys
 from pathlib import Path
 import weakref
 
+import docx
+import fitz
 import pytest
 
+from bookworm.concurrency import WorkerPool
 from bookworm.database import Book, DocumentPositionInfo
+from bookworm.document import base as document_base
 from bookworm.document import (
     SINGLE_PAGE_DOCUMENT_PAGER,
+    BaseDocument,
+    BasePage,
     BookMetadata,
+    DocumentInfo,
+    DocumentIOError,
+    Pager,
     PaginationError,
     Section,
+    DOCUMENT_FORMATS,
+    DocumentFormat,
     SinglePageDocument,
     VirtualDocument,
     create_document,
+    document_formats,
+    probe_document,
 )
 from bookworm.document.uri import DocumentUri
+from bookworm.reader import UriResolver
+from bookworm.document.formats.epub import EpubDocument
+from bookworm.document.formats.fitz import FitzDocument
 from bookworm.document.formats.pdf import FitzPdfDocument
+from bookworm.document.operations import (
+    SearchRequest,
+    export_to_plain_text,
+    export_to_plain_text_in_parallel,
+    search_book,
+    search_book_in_parallel,
+)
+from bookworm.document.page_cache import PageCache, page_cache
+from bookworm.document.prefetch import PagePrefetcher
+from bookworm.document.registry import DocumentFormatRegistry
+from bookworm.document.section_index import SectionIntervalIndex
+from bookworm.document.shared_text import SharedTextSnapshot
+from bookworm.structured_text import TextRange
+from conftest import make_presentation
 
 
 def test_epub_metadata(asset):
@@ -26,6 +58,34 @@ def test_epub_metadata(asset):
     assert epub.metadata.author == "George Grossmith"
 
 
+@pytest.mark.parametrize("filename", ["The Diary of a Nobody.epub", "roman.epub"])
+def test_epub_probe_reads_the_same_metadata_as_a_full_read(asset, filename, monkeypatch):
+    uri = DocumentUri.from_filename(asset(filename))
+    full_info = DocumentInfo.from_document(create_document(uri))
+    monkeypatch.setattr(
+        EpubDocument, "read", lambda self: pytest.fail("Probing should not read the book")
+    )
+    probed_info = probe_document(uri)
+    for field in ("title", "authors", "language", "description", "publication_date"):
+        assert getattr(probed_info, field) == getattr(full_info, field)
+    assert probed_info.cover_image.size == full_info.cover_image.size
+
+
+def test_pdf_and_docx_probes_read_the_metadata_and_the_cover(asset, tmp_path):
+    pdf_info = probe_document(DocumentUri.from_filename(asset("tagged_sample.pdf")))
+    assert (pdf_info.title, pdf_info.authors) == ("tagged_sample", "Elmusharaf Omer")
+    assert pdf_info.number_of_pages == 1
+    assert max(pdf_info.cover_image.size) == 512
+
+    docx_document = docx.Document()
+    docx_document.core_properties.title = "Probed Title"
+    docx_document.core_properties.author = "Some Author"
+    docx_document.add_paragraph("A paragraph of text. " * 20)
+    docx_document.save(tmp_path / "probed.docx")
+    docx_info = probe_document(DocumentUri.from_filename(tmp_path / "probed.docx"))
+    assert (docx_info.title, docx_info.authors) == ("Probed Title", "Some Author")
+
+
 def test_epub_document_section_at_text_position(asset):
     uri = DocumentUri.from_filename(asset("epub30-spec.epub"))
     epub = create_document(uri)
@@ -79,6 +139,16 @@ def test_opening_existing_document_falls_bac_kto_same_entry(reader, asset):
     assert DocumentPositionInfo.query.count() == 1
     assert Book.query.count() == 1
 
+def test_resolver_finds_the_initial_position_before_the_document_is_shown(asset, reader):
+    uri = DocumentUri.from_filename(asset("The Diary of a Nobody.epub"))
+    DocumentPositionInfo.get_or_create(title="The Diary of a Nobody", uri=uri).save_position(
+        0, 4200
+    )
+    assert UriResolver(uri).get_initial_position_hint() == 4200
+    position_uri = uri.create_copy(openner_args={"page": 0, "position": 42})
+    assert UriResolver(position_uri).get_initial_position_hint() == 42
+
+
 def test_document_with_different_format_and_name_creates_new_entry(asset, reader):
     path = Path(asset("test.md"))
     uri = DocumentUri.from_filename(path)
@@ -233,3 +303,328 @@ def test_single_page_document_hash_does_not_retain_document_instances(asset):
 
     assert document_ref() is None
 
+
+
+def test_closing_document_frees_its_cached_pages(asset):
+    uri = DocumentUri.from_filename(asset("roman.epub"))
+    document = create_document(uri)
+    page_content = document.get_page_content(0)
+    hits = page_cache.stats.hits
+
+    assert document.get_page_content(0) == page_content
+    assert page_cache.stats.hits > hits
+
+    document_ref = weakref.ref(document)
+    size_before_close = page_cache.size
+    document.close()
+    assert page_cache.size < size_before_close
+    del document
+    gc.collect()
+
+    assert document_ref() is None
+
+
+def test_unclosed_document_is_garbage_collected_with_its_cached_pages(tmp_path):
+    uri = make_presentation(tmp_path / "slides.pptx", (f"Slide {i}" for i in range(3)))
+    document = create_document(uri)
+    page = document.get_page(0)
+    assert page.get_text() == document.get_page_content(0)
+    num_cached_entries = len(page_cache)
+
+    document_ref = weakref.ref(document)
+    del document, page
+    gc.collect()
+
+    assert document_ref() is None
+    assert len(page_cache) < num_cached_entries
+
+
+def test_reading_a_fitz_page_of_a_collected_document_raises_an_io_error(tmp_path):
+    filename = tmp_path / "page.pdf"
+    with fitz.open() as pdf:
+        pdf.new_page().insert_text((72, 72), "Hello")
+        pdf.save(filename)
+    document = FitzDocument(DocumentUri.from_filename(filename))
+    document.read(filetype="pdf")
+    page = document.get_page(0)
+    assert page.get_text().strip() == "Hello"
+
+    del document
+    gc.collect()
+    with pytest.raises(DocumentIOError):
+        page.get_text()
+
+
+def test_page_cache_evicts_least_recently_used_entries_within_budget():
+    class Owner:
+        pass
+
+    cache = PageCache(capacity=3000)
+    owner, other_owner = Owner(), Owner()
+    for index in range(3):
+        cache.get(owner, index, lambda: "x" * 900)
+    cache.get(owner, 0, lambda: "y")
+    cache.get(other_owner, 0, lambda: "x" * 900)
+
+    assert cache.size <= cache.capacity
+    assert cache.stats.evictions == 1
+    assert cache.get(owner, 0, lambda: "recomputed") == "x" * 900
+    assert cache.get(owner, 1, lambda: "recomputed") == "recomputed"
+
+    cache.drop_document(owner)
+    assert len(cache) == 1
+
+
+def test_page_prefetcher_extracts_adjacent_pages_and_records_hits(asset):
+    class SyntheticPage(BasePage):
+        def get_text(self):
+            self.document.extracted_pages.append(self.index)
+            return f"page {self.index}"
+
+    class SyntheticPaginatedDocument(BaseDocument):
+        __internal__ = True
+        format = "test_paginated_prefetch"
+        extensions = ()
+
+        def __init__(self, uri):
+            super().__init__(uri)
+            self.extracted_pages = []
+
+        def __len__(self):
+            return 10
+
+        def read(self):
+            super().read()
+
+        def get_page(self, index):
+            return SyntheticPage(self, index)
+
+        @cached_property
+        def toc_tree(self):
+            return Section(title="", pager=Pager(first=0, last=9))
+
+        @cached_property
+        def metadata(self):
+            return BookMetadata(title="Synthetic Document", author="", publication_year="")
+
+    document = SyntheticPaginatedDocument(DocumentUri.from_filename(asset("test.md")))
+    document.read()
+    prefetcher = PagePrefetcher(document, ahead=2, behind=1, memory_ceiling=1024 * 1024)
+    assert prefetcher.get_pages_to_prefetch(0) == [1, 2]
+    assert prefetcher.get_pages_to_prefetch(9) == [8]
+
+    prefetcher.page_changed(4)
+    prefetcher._future.result()
+    assert sorted(document.extracted_pages) == [3, 5, 6]
+
+    prefetcher.page_changed(5)
+    assert document.get_page_content(5) == "page 5"
+    assert document.extracted_pages.count(5) == 1
+    assert (prefetcher.stats.hits, prefetcher.stats.misses) == (1, 1)
+    prefetcher.cancel()
+
+    # The ceiling only counts the pages cached by the prefetcher itself
+    assert page_cache.size > 1
+    page_size = document.get_cached_page_size(3)
+    prefetcher = PagePrefetcher(document, ahead=3, behind=0, memory_ceiling=page_size)
+    prefetcher.page_changed(0)
+    prefetcher._future.result()
+    assert sorted(document.extracted_pages) == [1, 3, 5, 6]
+    assert prefetcher.get_prefetched_size() == page_size
+
+    document.close()
+    assert prefetcher.get_prefetched_size() == 0
+
+
+def test_parallel_search_yields_the_same_results_in_page_order(tmp_path):
+    uri = make_presentation(
+        tmp_path / "slides.pptx",
+        (f"Slide {i} has a needle" if i % 7 == 0 else f"Slide {i}" for i in range(60)),
+    )
+    request = SearchRequest(
+        term="needle",
+        is_regex=False,
+        case_sensitive=False,
+        whole_word=True,
+        from_page=0,
+        to_page=59,
+    )
+
+    sequential_results = list(search_book(create_document(uri), request))
+    parallel_results = list(
+        search_book_in_parallel(create_document(uri), request, num_workers=2)
+    )
+
+    assert len(parallel_results) == 60
+    assert parallel_results == sequential_results
+    assert [result.page for resultset in parallel_results for result in resultset] == list(
+        range(0, 60, 7)
+    )
+
+
+def test_parallel_export_writes_the_same_text_as_sequential_export(tmp_path):
+    uri = make_presentation(tmp_path / "slides.pptx", (f"Slide number {i}" for i in range(45)))
+    sequential_file = tmp_path / "sequential.txt"
+    parallel_file = tmp_path / "parallel.txt"
+
+    sequential_progress = list(export_to_plain_text(create_document(uri), sequential_file))
+    parallel_progress = list(
+        export_to_plain_text_in_parallel(create_document(uri), parallel_file, num_workers=3)
+    )
+
+    assert parallel_progress == sequential_progress == list(range(1, 46))
+    assert parallel_file.read_text(encoding="utf8") == sequential_file.read_text(encoding="utf8")
+    assert not (tmp_path / "parallel.txt.partial").exists()
+
+
+def test_cancelled_export_does_not_leave_a_partial_file(tmp_path):
+    filename = tmp_path / "slides.pptx"
+    uri = make_presentation(filename, (f"Slide {i}" for i in range(45)))
+    target_file = tmp_path / "export.txt"
+
+    export = export_to_plain_text_in_parallel(create_document(uri), target_file, num_workers=2)
+    assert next(export) == 1
+    export.close()
+
+    assert list(tmp_path.iterdir()) == [filename]
+
+
+def test_shared_text_snapshot_is_attached_by_name_and_freed_by_owner():
+    page_texts = ["First page", "Ṣecond päge", ""]
+    snapshot = SharedTextSnapshot.publish(page_texts)
+    attached = pickle.loads(pickle.dumps(snapshot))
+
+    assert [attached.get_page_text(n) for n in range(len(attached))] == page_texts
+    attached.close()
+    snapshot.close()
+    with pytest.raises(FileNotFoundError):
+        SharedTextSnapshot.attach(snapshot.name)
+
+
+def test_unpickled_epub_uses_the_published_text_without_parsing(asset, monkeypatch):
+    document = create_document(DocumentUri.from_filename(asset("roman.epub")))
+    snapshot = document.publish_shared_text()
+    assert snapshot is document.publish_shared_text()
+    pickled_document = pickle.dumps(document)
+
+    monkeypatch.setattr(
+        EpubDocument,
+        "load_cached_structure",
+        lambda self: pytest.fail("The structure should not be loaded"),
+    )
+    worker_document = pickle.loads(pickled_document)
+    assert worker_document.get_page_content(0) == document.get_content()
+    worker_document.close()
+
+    document.close()
+    with pytest.raises(FileNotFoundError):
+        SharedTextSnapshot.attach(snapshot.name)
+
+
+def test_single_page_search_does_not_keep_the_shared_text_in_workers(asset, monkeypatch):
+    document = create_document(DocumentUri.from_filename(asset("test.md")))
+    request = SearchRequest(
+        term="a",
+        is_regex=False,
+        case_sensitive=False,
+        whole_word=False,
+        from_page=0,
+        to_page=0,
+        text_range=TextRange(0, len(document.get_content())),
+    )
+    pool = WorkerPool(max_workers=1, preload_modules=("bookworm.document",))
+    monkeypatch.setattr(document_base, "document_worker_pool", pool)
+    try:
+        assert list(document.search(request))
+        snapshot = document.publish_shared_text()
+        assert all(snapshot.name not in worker.handle_keys for worker in pool._idle_workers)
+    finally:
+        pool.shutdown()
+        document.close()
+
+
+def test_single_page_export_does_not_read_the_document_in_workers(asset, tmp_path, monkeypatch):
+    document = create_document(DocumentUri.from_filename(asset("test.md")))
+    sequential_file = tmp_path / "sequential.txt"
+    list(export_to_plain_text(document, sequential_file))
+
+    def fail_pickling(self):
+        raise AssertionError("The document should not be sent to the worker")
+
+    pool = WorkerPool(max_workers=1, preload_modules=("bookworm.document",))
+    monkeypatch.setattr(document_base, "document_worker_pool", pool)
+    monkeypatch.setattr(SinglePageDocument, "__getstate__", fail_pickling)
+    try:
+        exported_file = tmp_path / "exported.txt"
+        assert list(document.export_to_text(exported_file)) == [1]
+        assert exported_file.read_text(encoding="utf8") == sequential_file.read_text(
+            encoding="utf8"
+        )
+    finally:
+        pool.shutdown()
+        document.close()
+
+
+def test_section_interval_index_finds_the_most_specific_section():
+    root = Section(title="root", pager=Pager(first=0, last=99))
+    part = Section(title="part", pager=Pager(first=10, last=59))
+    first_chapter = Section(title="first chapter", pager=Pager(first=10, last=30))
+    second_chapter = Section(title="second chapter", pager=Pager(first=30, last=59))
+    appendix = Section(title="appendix", pager=Pager(first=80, last=99))
+    part.append(first_chapter)
+    part.append(second_chapter)
+    root.append(part)
+    root.append(appendix)
+    index = SectionIntervalIndex.from_pagers(root)
+
+    def find_section_by_scanning(page_number):
+        rv = root
+        for sect in root.iter_children():
+            if page_number in sect.pager:
+                rv = sect
+        return rv
+
+    for page_number in range(-1, 102):
+        assert index.get(page_number) is find_section_by_scanning(page_number)
+    assert index.get(30) is second_chapter
+    assert index.get(70) is root
+
+
+@pytest.mark.parametrize("document_format", DOCUMENT_FORMATS, ids=lambda f: f.format)
+def test_declared_document_formats_match_their_implementation(document_format):
+    doc_cls = document_format.load()
+    assert doc_cls.format == document_format.format
+    assert tuple(doc_cls.extensions or ()) == document_format.extensions
+    assert doc_cls.capabilities == document_format.capabilities
+    assert doc_cls.__internal__ == document_format.internal
+    assert bool(doc_cls.check()) == document_formats.is_available(document_format.format)
+
+
+def test_document_format_implementation_is_imported_on_first_use(tmp_path, monkeypatch):
+    (tmp_path / "lazy_document_format.py").write_text(
+        "from bookworm.document import DummyDocument\n"
+        "class LazyDocument(DummyDocument):\n"
+        "    pass\n"
+    )
+    monkeypatch.syspath_prepend(tmp_path)
+    registry = DocumentFormatRegistry()
+    for (format, requirement) in [("lazy", None), ("unsupported", lambda: False)]:
+        registry.register(
+            DocumentFormat(
+                format=format,
+                name=format,
+                extensions=(f"*.{format}",),
+                class_path="lazy_document_format:LazyDocument",
+                requirement=requirement,
+            )
+        )
+
+    assert registry.get_format_given_extension("*.lazy") == "lazy"
+    assert registry.get_supported_file_extensions() == {".lazy"}
+    assert registry.get_document_class("unsupported") is None
+    assert "lazy_document_format" not in sys.modules
+    doc_cls = registry.get_document_class("lazy")
+    assert doc_cls.__name__ == "LazyDocument"
+    assert "lazy_document_format" in sys.modules
+    assert registry.get_document_class("lazy") is doc_cls
+    monkeypatch.delitem(sys.modules, "lazy_document_format")
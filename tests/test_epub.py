@@ -5,6 +5,7 @@ import pytest
 
 from bookworm.document.uri import DocumentUri
 from bookworm.document.formats.epub import EpubDocument
+from bookworm.structured_text.structured_html_parser import StructuredHtmlSnapshot
 
 
 def temp_book(title: str = "Sample book") -> epub.EpubBook:
@@ -53,3 +54,77 @@ def test_modified_epub_modifies_cache(asset):
     new_content = doc.html_content
     Path(asset("test.epub")).unlink()
     assert content != new_content
+
+
+def test_reopening_epub_loads_parsed_structure_from_cache(asset, monkeypatch):
+    uri = DocumentUri.from_filename(asset("The Diary of a Nobody.epub"))
+    doc = EpubDocument(uri)
+    doc.read()
+    titles = [sect.title for sect in doc.toc_tree.iter_children()]
+
+    def fail_parse(html_string):
+        raise AssertionError("HTML should not be parsed on a warm reopen")
+
+    def fail_read_epub(filename):
+        raise AssertionError("The epub should not be loaded on a warm reopen")
+
+    monkeypatch.setattr(StructuredHtmlSnapshot, "from_string", fail_parse)
+    monkeypatch.setattr(epub, "read_epub", fail_read_epub)
+    cached_doc = EpubDocument(uri)
+    cached_doc.read()
+    assert cached_doc.metadata == doc.metadata
+    assert cached_doc.language == doc.language
+    assert cached_doc.get_content() == doc.get_content()
+    assert cached_doc.get_document_semantic_structure() == doc.get_document_semantic_structure()
+    assert [sect.title for sect in cached_doc.toc_tree.iter_children()] == titles
+
+
+def test_progressive_read_exposes_content_before_the_whole_book_is_parsed(asset, tmp_path):
+    epub_path = tmp_path / "progressive.epub"
+    epub_path.write_bytes(Path(asset("epub30-spec.epub")).read_bytes())
+    uri = DocumentUri.from_filename(epub_path).create_copy(
+        view_args={"progressive_read": True}
+    )
+    doc = EpubDocument(uri)
+    doc.read()
+    assert doc.get_content()
+
+    doc.wait_until_loaded()
+    content = doc.get_content()
+    assert doc.toc_tree.text_range.stop == len(content)
+    assert all(sect.text_range.stop <= len(content) for sect in doc.toc_tree.iter_children())
+    section = doc.get_section_at_position(doc.toc_tree.last_child.text_range.start)
+    assert section.text_range.start == doc.toc_tree.last_child.text_range.start
+
+    # A subsequent progressive read is served from the cache with the same offsets
+    cached_doc = EpubDocument(uri)
+    cached_doc.read()
+    assert cached_doc.get_content() == content
+
+
+def test_progressive_read_does_not_cache_a_book_with_a_failed_chapter(
+    asset, tmp_path, monkeypatch
+):
+    epub_path = tmp_path / "progressive.epub"
+    epub_path.write_bytes(Path(asset("epub30-spec.epub")).read_bytes())
+    uri = DocumentUri.from_filename(epub_path).create_copy(
+        view_args={"progressive_read": True}
+    )
+    doc = EpubDocument(uri)
+    prefix_html_ids = EpubDocument.prefix_html_ids
+
+    def fail_last_chapter(self, filename, html):
+        if filename == self.epub_html_items[-1].file_name:
+            raise ValueError("Failed to parse the chapter")
+        return prefix_html_ids(self, filename, html)
+
+    monkeypatch.setattr(EpubDocument, "prefix_html_ids", fail_last_chapter)
+    # The same book may have been cached by another test
+    stored = []
+    with monkeypatch.context() as m:
+        m.setattr(EpubDocument, "load_cached_structure", lambda self: False)
+        m.setattr(EpubDocument, "store_cached_structure", lambda self: stored.append(self))
+        doc.read()
+        doc.wait_until_loaded()
+    assert doc._failed_chapters == [doc.epub_html_items[-1].file_name]
+    assert stored == []
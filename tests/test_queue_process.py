@@ -1,6 +1,6 @@
 import pytest
 
-from bookworm.concurrency import QueueProcess
+from bookworm.concurrency import QueueProcess, WorkerPool
 
 
 def _produce_sqrts(numbers):
@@ -21,3 +21,58 @@ def test_queue_process():
     process_iterator = iter(QueueProcess(target=_produce_sqrts, args=(invalid_input,)))
     with pytest.raises(ValueError):
         next(process_iterator)
+
+
+class _CountingHandle:
+    """Counts the tasks run with the same handle in a worker process."""
+
+    def __getstate__(self):
+        return {"num_uses": 0}
+
+    def close(self):
+        pass
+
+
+def _use_handle(handle, num_items):
+    import os
+
+    handle.num_uses += 1
+    for n in range(num_items):
+        yield (os.getpid(), handle.num_uses, n)
+
+
+def _fail_with_handle(handle):
+    yield 1
+    raise ValueError("Failed")
+
+
+@pytest.fixture
+def worker_pool():
+    pool = WorkerPool(max_workers=2, max_tasks_per_worker=3)
+    yield pool
+    pool.shutdown()
+
+
+def test_worker_pool_reuses_open_handles(worker_pool):
+    first_run = list(worker_pool.submit(_use_handle, _CountingHandle(), args=(3,), key="book"))
+    assert [n for (_pid, _num_uses, n) in first_run] == [0, 1, 2]
+    pid, num_uses, _n = first_run[0]
+    assert num_uses == 1
+    second_run = list(worker_pool.submit(_use_handle, _CountingHandle(), args=(1,), key="book"))
+    assert second_run == [(pid, 2, 0)]
+    # Handles without a key are not kept open
+    unkeyed_run = list(worker_pool.submit(_use_handle, _CountingHandle(), args=(1,)))
+    assert unkeyed_run[0][1] == 1
+
+
+def test_worker_pool_cancellation_and_failures(worker_pool):
+    task = worker_pool.submit(_use_handle, _CountingHandle(), args=(10**6,), key="book")
+    items = iter(task)
+    pid, _num_uses, _n = next(items)
+    task.cancel()
+    assert len(list(items)) < 10**6
+    with pytest.raises(ValueError):
+        list(worker_pool.submit(_fail_with_handle, _CountingHandle(), key="book"))
+    # The worker survives both, and is recycled after running three tasks
+    assert next(iter(worker_pool.submit(_use_handle, _CountingHandle(), args=(1,))))[0] == pid
+    assert next(iter(worker_pool.submit(_use_handle, _CountingHandle(), args=(1,))))[0] != pid
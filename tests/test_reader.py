@@ -1,5 +1,6 @@
 import pytest
 
+from bookworm import config
 from bookworm.database.models import DocumentPositionInfo
 from bookworm.document.uri import DocumentUri
 from conftest import asset, reader, engine, view
@@ -71,3 +72,10 @@ def test_restore_position_for_mobi_document(reader, asset, engine):
     assert record.last_page == test_page
     assert record.last_position == test_pos
     assert record.uri == original_uri
+
+
+def test_config_spec_is_applied_by_every_config_provider():
+    for _n in range(2):
+        config.setup_config()
+        assert isinstance(config.conf["advanced"]["prefetch_pages_ahead"], int)
+        assert isinstance(config.conf["general"]["open_with_last_position"], bool)
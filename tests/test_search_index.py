@@ -0,0 +1,128 @@
+import pytest
+from pptx import Presentation
+
+from bookworm.document import create_document
+from bookworm.document.operations import (
+    SearchRequest,
+    search_book,
+    search_single_page_document,
+)
+from bookworm.document.search_index import (
+    DocumentSearchIndex,
+    build_search_index,
+    load_search_index,
+    store_search_index,
+)
+from bookworm.document.uri import DocumentUri
+from bookworm.structured_text import TextRange
+from conftest import make_presentation
+
+
+def _make_request(term, **kwargs):
+    kwargs.setdefault("is_regex", False)
+    kwargs.setdefault("case_sensitive", False)
+    kwargs.setdefault("whole_word", False)
+    return SearchRequest(term=term, **kwargs)
+
+
+@pytest.mark.parametrize(
+    "request_kwargs",
+    [
+        dict(term="publication"),
+        dict(term="Publication", case_sensitive=True),
+        dict(term="content document", whole_word=True),
+        dict(term="EPUB", whole_word=True),
+        dict(term="ation"),
+    ],
+)
+def test_indexed_single_page_search_matches_scan(asset, request_kwargs):
+    document = create_document(DocumentUri.from_filename(asset("epub30-spec.epub")))
+    text = document.get_content()
+    index = DocumentSearchIndex.from_text(text)
+    request = _make_request(
+        text_range=TextRange(1000, len(text) - 1000), **request_kwargs
+    )
+
+    indexed_results = list(index.search_text(text, request))
+
+    scanned_results = list(
+        search_single_page_document(text[request.text_range.as_slice()], request)
+    )
+    assert indexed_results
+    assert indexed_results == scanned_results
+
+
+@pytest.mark.parametrize(
+    "request_kwargs",
+    [
+        dict(term="needle in the haystack"),
+        dict(term="needle in the haystack", whole_word=True),
+        dict(term="edle in the hay"),
+        dict(term="haystack"),
+    ],
+)
+@pytest.mark.parametrize("offset", [4080, 4090, 4094, 4096, 4100])
+def test_indexed_search_finds_terms_across_chunk_boundaries(request_kwargs, offset):
+    filler = "word " * 2000
+    text = f"{filler[:offset]} needle in the haystack {filler}"
+    index = DocumentSearchIndex.from_text(text)
+    request = _make_request(text_range=TextRange(0, len(text)), **request_kwargs)
+
+    indexed_results = list(index.search_text(text, request))
+
+    assert len(index.chunk_offsets) > 1
+    assert indexed_results
+    assert indexed_results == list(search_single_page_document(text, request))
+
+
+def test_indexed_page_search_matches_scan_and_regex_falls_back(tmp_path):
+    uri = make_presentation(
+        tmp_path / "slides.pptx",
+        (f"Slide {i} with needles" if i % 4 else f"Slide {i}" for i in range(30)),
+    )
+    document = create_document(uri)
+    store_search_index(document, build_search_index(document))
+    index = load_search_index(document)
+    request = _make_request("needle", from_page=2, to_page=25)
+
+    indexed_results = list(index.search_pages(document, request))
+
+    assert indexed_results == list(search_book(create_document(uri), request))
+    assert index.search_pages(document, _make_request("need.e", is_regex=True)) is None
+
+
+def test_search_index_is_not_used_after_the_file_changes(tmp_path):
+    filename = tmp_path / "slides.pptx"
+    presentation = Presentation()
+    presentation.slides.add_slide(presentation.slide_layouts[5]).shapes.title.text = "First"
+    presentation.save(filename)
+    document = create_document(DocumentUri.from_filename(filename))
+    store_search_index(document, build_search_index(document))
+
+    presentation.slides.add_slide(presentation.slide_layouts[5]).shapes.title.text = "Second"
+    presentation.save(filename)
+
+    changed_document = create_document(DocumentUri.from_filename(filename))
+    assert load_search_index(document) is not None
+    assert load_search_index(changed_document) is None
+
+
+def test_search_index_is_loaded_once_per_document(tmp_path, monkeypatch):
+    filename = tmp_path / "slides.pptx"
+    presentation = Presentation()
+    presentation.slides.add_slide(presentation.slide_layouts[5]).shapes.title.text = "First"
+    presentation.save(filename)
+    document = create_document(DocumentUri.from_filename(filename))
+    store_search_index(document, build_search_index(document))
+    index = load_search_index(document)
+
+    def fail_loads(data):
+        raise AssertionError("The index should not be loaded again")
+
+    monkeypatch.setattr(DocumentSearchIndex, "loads", fail_loads)
+    assert load_search_index(document) is index
+    assert document.publish_shared_text() is not None
+
+    document.close()
+    monkeypatch.undo()
+    assert load_search_index(document) is not index
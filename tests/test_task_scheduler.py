@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import pytest
+
+from bookworm.concurrency import ScheduledExecutor, TaskPriority, TaskScheduler
+from bookworm.concurrency import scheduler as scheduler_module
+from bookworm.concurrency.scheduler import BACKGROUND_PRIORITIES, TaskLane
+
+
+@pytest.fixture
+def lane():
+    lane = TaskLane(
+        "thread",
+        lambda max_workers: ThreadPoolExecutor(max_workers=max_workers),
+        max_workers=2,
+        class_limits={TaskPriority.INDEXING: 1},
+    )
+    yield lane
+    lane.shutdown(wait=True)
+
+
+def _submit(lane, priority, func, *args, group=None):
+    return lane.submit(priority, group, func, args, {})
+
+
+def test_queued_tasks_start_by_priority(lane):
+    release_first, release_second = threading.Event(), threading.Event()
+    blockers = [
+        _submit(lane, TaskPriority.INTERACTIVE, event.wait)
+        for event in (release_first, release_second)
+    ]
+    started = []
+    futures = [
+        _submit(lane, priority, started.append, priority)
+        for priority in (TaskPriority.BULK_OCR, TaskPriority.PREFETCH, TaskPriority.INTERACTIVE)
+    ]
+    assert lane.get_metrics()[TaskPriority.PREFETCH].queue_depth == 1
+    # The queued tasks run one after the other in the freed worker
+    release_first.set()
+    for future in futures:
+        future.result(timeout=5)
+    release_second.set()
+    assert started == [TaskPriority.INTERACTIVE, TaskPriority.PREFETCH, TaskPriority.BULK_OCR]
+    assert all(blocker.result(timeout=5) for blocker in blockers)
+    metrics = lane.get_metrics()[TaskPriority.INTERACTIVE]
+    assert (metrics.submitted, metrics.completed, metrics.running) == (3, 3, 0)
+
+
+def test_class_limits_and_cancellation_groups(lane):
+    release = threading.Event()
+    running = _submit(lane, TaskPriority.INDEXING, release.wait, group="book")
+    queued = [_submit(lane, TaskPriority.INDEXING, release.wait, group="book") for _n in range(3)]
+    other = _submit(lane, TaskPriority.INDEXING, release.wait, group="other")
+    # Only one indexing task may run, which leaves a worker for interactive tasks
+    assert _submit(lane, TaskPriority.INTERACTIVE, sum, (1, 2)).result(timeout=5) == 3
+    assert lane.get_metrics()[TaskPriority.INDEXING].running == 1
+    assert lane.cancel_group("book") == 3
+    assert all(future.cancelled() for future in queued)
+    release.set()
+    assert running.result(timeout=5) and other.result(timeout=5)
+    metrics = lane.get_metrics()[TaskPriority.INDEXING]
+    assert (metrics.completed, metrics.cancelled, metrics.max_queue_depth) == (2, 3, 4)
+
+
+def test_task_exceptions_are_set_on_the_future(lane):
+    with pytest.raises(ZeroDivisionError):
+        _submit(lane, TaskPriority.INTERACTIVE, divmod, 1, 0).result(timeout=5)
+    assert lane.get_metrics()[TaskPriority.INTERACTIVE].failed == 1
+
+
+def test_saturated_background_classes_leave_a_worker_for_interactive_tasks():
+    lane = TaskLane(
+        "thread",
+        lambda max_workers: ThreadPoolExecutor(max_workers=max_workers),
+        max_workers=3,
+        class_limits={priority: 3 for priority in TaskPriority},
+    )
+    release = threading.Event()
+    try:
+        background = [
+            _submit(lane, priority, release.wait)
+            for priority in BACKGROUND_PRIORITIES
+            for _n in range(3)
+        ]
+        assert _submit(lane, TaskPriority.INTERACTIVE, sum, (1, 2)).result(timeout=5) == 3
+        metrics = lane.get_metrics()
+        assert sum(metrics[priority].running for priority in BACKGROUND_PRIORITIES) == 2
+        release.set()
+        assert all(future.result(timeout=5) for future in background)
+    finally:
+        release.set()
+        lane.shutdown(wait=True)
+
+
+@pytest.mark.parametrize("num_cores", [1, 2, 4, 8, 64])
+def test_scheduler_class_limits_fit_in_the_background_workers(num_cores):
+    scheduler = TaskScheduler(num_cores=num_cores)
+    for lane in scheduler.lanes:
+        assert lane.max_background_workers == lane.max_workers - 1 >= 1
+        background_limits = [lane.class_limits[priority] for priority in BACKGROUND_PRIORITIES]
+        assert all(limit >= 1 for limit in background_limits)
+        if lane.max_background_workers >= len(BACKGROUND_PRIORITIES):
+            assert sum(background_limits) <= lane.max_background_workers
+
+
+def test_recycled_process_lane_runs_each_task_in_a_new_process():
+    scheduler = TaskScheduler(num_cores=2)
+    try:
+        executor = scheduler.recycled_process_executor()
+        pids = {executor.submit(os.getpid).result(timeout=60) for _n in range(3)}
+    finally:
+        scheduler.shutdown(wait=True)
+    assert len(pids) == 3
+
+
+def test_initializer_runs_once_per_executor_and_is_released_when_idle(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "INITIALIZED_STATE_IDLE_TIMEOUT", 0.1)
+    # A single worker, like a process worker, runs one task at a time
+    lane = TaskLane(
+        "process",
+        lambda max_workers: ThreadPoolExecutor(max_workers=max_workers),
+        max_workers=1,
+        class_limits={},
+    )
+    events = []
+
+    def create_executor(name):
+        return ScheduledExecutor(
+            lane,
+            TaskPriority.INTERACTIVE,
+            initializer=events.append,
+            initargs=(f"initialize {name}",),
+            finalizer=partial(events.append, f"release {name}"),
+        )
+
+    try:
+        first = create_executor("first")
+        assert [first.submit(len, "ab").result(timeout=10) for _n in range(3)] == [2, 2, 2]
+        assert events == ["initialize first"]
+        assert create_executor("second").submit(len, "").result(timeout=10) == 0
+        assert events == ["initialize first", "release first", "initialize second"]
+        deadline = time.monotonic() + 10
+        while ("release second" not in events) and (time.monotonic() < deadline):
+            time.sleep(0.05)
+        assert events[-1] == "release second"
+    finally:
+        lane.shutdown(wait=True)
@@ -1,6 +1,10 @@
+import sys
+import threading
+import types
+
 import pytest
 
-from bookworm.utils import get_url_spans
+from bookworm.utils import LazyModule, get_url_spans, lazy_module
 
 
 def test_get_url_spans():
@@ -19,3 +23,33 @@ def test_get_url_spans():
         assert text[start:end] == url_target
     url_ranges_and_targets = get_url_spans(text)
     assert dict(url_ranges_and_targets) == expected_url_ranges_and_targets
+
+
+def test_lazy_module_is_imported_once_on_first_use(tmp_path, monkeypatch):
+    (tmp_path / "lazily_imported.py").write_text(
+        "import time\n"
+        "import lazy_module_log\n"
+        "time.sleep(0.05)\n"
+        "lazy_module_log.imports.append(__name__)\n"
+        "answer = 42\n"
+    )
+    monkeypatch.syspath_prepend(tmp_path)
+    monkeypatch.setitem(sys.modules, "lazy_module_log", types.SimpleNamespace(imports=[]))
+    module = lazy_module("lazily_imported")
+    assert isinstance(module, LazyModule) and not module.is_loaded
+    assert "lazily_imported" not in sys.modules
+
+    answers = []
+    threads = [
+        threading.Thread(target=lambda: answers.append(module.answer)) for _i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert answers == [42] * 8
+    assert sys.modules["lazy_module_log"].imports == ["lazily_imported"]
+    assert module.get_module() is sys.modules["lazily_imported"]
+    assert lazy_module("lazily_imported") is sys.modules["lazily_imported"]
+    monkeypatch.delitem(sys.modules, "lazily_imported")